@@ -0,0 +1,6 @@
+"""
+Stand-ins for running the pipeline without network access: fake UP42 and
+Google Cloud Storage clients (fakes) and synthetic Sentinel-2 scenes with a
+stub detector (synthetic). Used by the tests and src/benchmark.py only; the
+pipeline itself never imports them.
+"""
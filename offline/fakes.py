@@ -0,0 +1,255 @@
+"""
+In-memory stand-ins for the UP42 catalog and Google Cloud Storage.
+
+They implement just the calls the pipeline makes, so order → download →
+merge → predict → convert → upload can run offline in tests and benchmarks, e.g.
+
+    catalog = FakeCatalog([{"id": "img-1", "assets": ["tests/T33TUL.zip"]}])
+    bucket = FakeStorageClient("/tmp/bucket").bucket("marinelitter_predicted")
+
+With `base_url` (see serve_directory) assets also expose a download URL, so
+the chunked downloader is exercised over real HTTP.
+"""
+import os
+import re
+import base64
+import shutil
+import hashlib
+import functools
+import threading
+import itertools
+import http.server
+
+
+class FakeFile:
+    """
+    Mimics the SDK's ImageFile (file_name, url): download() copies a local
+    source file into the target directory.
+    """
+
+    def __init__(self, source, base_url=None):
+        self.source = source
+        self.file_name = os.path.basename(source)
+        self.id = self.file_name
+        self.url = f"{base_url}/{self.file_name}" if base_url else None
+
+    def download(self, output_directory):
+        os.makedirs(output_directory, exist_ok=True)
+        target = os.path.join(output_directory, self.file_name)
+        shutil.copy(self.source, target)
+        return target
+
+
+class FakeAsset:
+    def __init__(self, source, base_url=None):
+        self.file = FakeFile(source, base_url)
+        self.asset_id = self.file.id
+
+
+class FakeOrder:
+    """
+    An order that becomes FULFILLED (or FAILED) after a fixed number of status
+    polls. Like the SDK's order, every read of `status` is one poll.
+    """
+
+    def __init__(self, order_id, sources, polls_until_done=1, fail=False, base_url=None):
+        self.order_id = order_id
+        self.sources = sources
+        self.base_url = base_url
+        self.polls = 0
+        self.polls_until_done = polls_until_done
+        self.final_status = "FAILED" if fail else "FULFILLED"
+
+    @property
+    def status(self):
+        self.polls += 1
+        return self.final_status if self.polls > self.polls_until_done else "PLACED"
+
+    def track_status(self, report_time=0):
+        return self.status
+
+    def get_assets(self):
+        return [FakeAsset(source, self.base_url) for source in self.sources]
+
+
+class FakeCatalog:
+    """
+    Old-style UP42 catalog over a fixed list of scenes.
+
+    Each scene is a dict with at least "id" and "assets" (local files handed
+    out on download); any other keys become columns of the search DataFrame.
+    Scenes with a GeoJSON "geometry" footprint are only returned by searches
+    whose geometry intersects it, so overlapping AOIs see the same scene.
+    """
+
+    def __init__(self, scenes, polls_until_done=1, failing=(), base_url=None):
+        self.scenes = scenes
+        self.base_url = base_url
+        self.polls_until_done = polls_until_done
+        self.failing = set(failing)
+        self.placed_orders = []
+        self.search_calls = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def construct_search_parameters(self, **kwargs):
+        return kwargs
+
+    def search(self, search_params):
+        import pandas as pd
+        self.search_calls.append(search_params)
+        rows = [{k: v for k, v in scene.items() if k != "assets"} for scene in self.scenes
+                if self._matches(scene, search_params.get("geometry"))]
+        return pd.DataFrame(rows, columns=sorted({k for row in rows for k in row}) or ["id"])
+
+    @staticmethod
+    def _matches(scene, geometry):
+        if geometry is None or scene.get("geometry") is None:
+            return True
+        from src.aoi import to_ogr
+        return to_ogr(scene["geometry"]).Intersects(to_ogr(geometry))
+
+    def construct_order_parameters(self, data_product_id, image_id, aoi):
+        return {"dataProduct": data_product_id, "params": {"id": image_id, "aoi": aoi}}
+
+    def place_order(self, order_parameters):
+        image_id = order_parameters["params"]["id"]
+        scene = next(scene for scene in self.scenes if scene["id"] == image_id)
+        with self._lock:
+            order = FakeOrder(f"order-{next(self._ids)}", scene["assets"],
+                              self.polls_until_done, fail=image_id in self.failing, base_url=self.base_url)
+            self.placed_orders.append(order)
+        return order
+
+    def get_order(self, order_id):
+        """An order placed earlier, like up42.initialize_order(order_id=...)."""
+        for order in self.placed_orders:
+            if order.order_id == order_id:
+                return order
+        raise KeyError(f"Unknown order {order_id}")
+
+
+class FakeBlob:
+    """A bucket object stored as a plain file below the fake bucket's directory."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    @property
+    def md5_hash(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            return base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+
+    crc32c = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def upload_from_filename(self, filename, **kwargs):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shutil.copy(filename, self.path)
+
+    def download_to_filename(self, filename):
+        shutil.copy(self.path, filename)
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class FakeBucket:
+    def __init__(self, root, name):
+        self.root = os.path.join(root, name)
+        self.name = name
+        os.makedirs(self.root, exist_ok=True)
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        blob = FakeBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self):
+        for directory, _, files in os.walk(self.root):
+            for file in sorted(files):
+                name = os.path.relpath(os.path.join(directory, file), self.root).replace("\\", "/")
+                yield FakeBlob(self, name)
+
+
+class FakeStorageClient:
+    """Drop-in for storage.Client: every bucket is a directory below `root`."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def bucket(self, bucket_name):
+        return FakeBucket(self.root, bucket_name)
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file handler with HTTP Range support, a GCS-style x-goog-hash
+    header and the Content-Disposition filename that signed UP42 download
+    URLs carry (read by up42.utils.get_filename). `drop_after` (bytes) makes the first response for every file cut
+    the connection early, to exercise resumable downloads.
+    """
+
+    drop_after = None
+    dropped = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.send_header("x-goog-hash", "md5=" + base64.b64encode(hashlib.md5(data).digest()).decode())
+        self.end_headers()
+        body = data[start:]
+        if self.drop_after is not None and path not in self.dropped:
+            self.dropped.add(path)
+            body = body[:self.drop_after]
+        self.wfile.write(body)
+
+
+def serve_directory(root, drop_after=None):
+    """Serve `root` over HTTP on a free local port from a daemon thread; return (server, base_url)."""
+    handler = type("Handler", (RangeRequestHandler,), {"drop_after": drop_after, "dropped": set()})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,154 @@
+"""
+Synthetic Sentinel-2 scenes and a stub detector for offline runs.
+
+write_scenes() creates L2A-like zips (metadata.xml plus one B*.tif per band)
+side by side in UTM 33N, the matching UP42 scene records for
+offline.fakes.FakeCatalog and a config.geojson whose AOI covers all of them:
+
+    scenes = write_scenes("/tmp/up42", count=4, size=1024)
+    catalog = FakeCatalog(scenes, base_url=base_url)
+    run_pipeline("/tmp/up42/config.geojson", catalog=catalog, predict_func=stub_detector)
+"""
+import os
+import json
+import datetime
+import zipfile
+import numpy as np
+from osgeo import gdal, osr
+
+from src.aoi import wgs84
+
+S2_BANDS = ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12"]
+UTM_EPSG = 32633
+ORIGIN = (300000, 5000040)  # upper left corner of the first scene
+PIXEL_SIZE = 10
+SQUARES = [f"{column}{row}" for column in "UVWXYZ" for row in "KLMNPQ"]
+
+# Typical L2A digital numbers (reflectance * 10000) of open water and of land
+WATER_DN = {"B02": 700, "B03": 600, "B04": 400, "B08": 200}
+LAND_DN = {"B02": 900, "B03": 1100, "B04": 1200, "B08": 3000}
+OTHER_DN = (300, 2500)
+STUB_DETECTION_RATE = 0.0005  # share of valid pixels the stub detector scores
+
+
+def tile_name(number, date):
+    """Sentinel-2 TILE_ID and MGRS tile of synthetic scene `number`."""
+    mgrs = f"T33T{SQUARES[number % len(SQUARES)]}"
+    compact = date.replace("-", "")
+    return f"S2B_OPER_MSI_L2A_TL_2BPS_{compact}T101031_A{number + 1:06d}_{mgrs}_N05.11", mgrs
+
+
+def band_values(name, water, rng):
+    """UInt16 band of a scene that is water where `water` is set, with sensor-like noise."""
+    if name in WATER_DN:
+        values = np.where(water, WATER_DN[name], LAND_DN[name]).astype(np.float32)
+    else:
+        values = np.full(water.shape, rng.integers(*OTHER_DN), dtype=np.float32)
+    values += rng.normal(0, 40, size=water.shape).astype(np.float32)
+    return np.clip(values, 1, 10000).astype(np.uint16)
+
+
+def footprint(xoff, yoff, width, height):
+    """GeoJSON polygon (EPSG:4326) of a UTM rectangle `xoff`/`yoff` metres east/south of ORIGIN."""
+    utm = osr.SpatialReference()
+    utm.ImportFromEPSG(UTM_EPSG)
+    utm.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(utm, wgs84())
+    x0, y0 = ORIGIN[0] + xoff, ORIGIN[1] - yoff
+    corners = [(x0, y0), (x0 + width, y0), (x0 + width, y0 - height), (x0, y0 - height), (x0, y0)]
+    return {"type": "Polygon", "coordinates": [[list(transform.TransformPoint(x, y)[:2]) for x, y in corners]]}
+
+
+def write_scene(path, tile_id, xoff, size, bands=S2_BANDS, seed=0):
+    """Write one zip with metadata.xml and a size x size UInt16 GeoTIFF per band; half land, half sea."""
+    rng = np.random.default_rng(seed)
+    water = np.zeros((size, size), dtype=bool)
+    water[:, size // 2:] = True
+    water[rng.integers(0, size, size // 8), rng.integers(0, size // 2, size // 8)] = True  # inland lakes
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(UTM_EPSG)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("metadata.xml", f'<?xml version="1.0" encoding="UTF-8"?>\n<Level-2A_Tile_ID>'
+                                         f'<General_Info><TILE_ID metadataLevel="Brief">{tile_id}</TILE_ID>'
+                                         f'</General_Info></Level-2A_Tile_ID>\n')
+        for name in bands:
+            band_path = f"/vsimem/{tile_id}_{name}.tif"
+            ds = gdal.GetDriverByName("GTiff").Create(band_path, size, size, 1, gdal.GDT_UInt16)
+            ds.SetGeoTransform((ORIGIN[0] + xoff, PIXEL_SIZE, 0, ORIGIN[1], 0, -PIXEL_SIZE))
+            ds.SetProjection(srs.ExportToWkt())
+            ds.GetRasterBand(1).WriteArray(band_values(name, water, rng))
+            ds = None
+            archive.writestr(f"{name}.tif", read_vsimem(band_path))
+            gdal.Unlink(band_path)
+    return path
+
+
+def read_vsimem(path):
+    """Contents of a /vsimem/ file."""
+    handle = gdal.VSIFOpenL(path, "rb")
+    try:
+        gdal.VSIFSeekL(handle, 0, 2)
+        length = gdal.VSIFTellL(handle)
+        gdal.VSIFSeekL(handle, 0, 0)
+        return gdal.VSIFReadL(1, length, handle)
+    finally:
+        gdal.VSIFCloseL(handle)
+
+
+def write_scenes(directory, count=4, size=1024, bands=S2_BANDS, date=None):
+    """
+    Write `count` synthetic scenes and directory/config.geojson. Returns the
+    scene records (id, sceneId, cloudCoverage, acquisitionDate, geometry,
+    assets) that offline.fakes.FakeCatalog serves.
+    """
+    os.makedirs(directory, exist_ok=True)
+    date = date or datetime.date.today().isoformat()
+    extent = size * PIXEL_SIZE
+    scenes = []
+    for number in range(count):
+        tile_id, mgrs = tile_name(number, date)
+        xoff = number * extent
+        path = write_scene(os.path.join(directory, f"{tile_id}.zip"), tile_id, xoff, size, bands, seed=number)
+        scenes.append({
+            "id": f"synthetic-{number + 1}",
+            "sceneId": f"S2B_MSIL2A_{date.replace('-', '')}T101031_N0511_R022_{mgrs}_{date.replace('-', '')}T120000",
+            "cloudCoverage": float(number % 5),
+            "acquisitionDate": f"{date}T10:10:31Z",
+            "geometry": footprint(xoff, 0, extent, extent),
+            "assets": [path],
+        })
+
+    # One AOI over all scenes, a pixel inside their outer edges so clipping keeps almost everything
+    aoi = footprint(PIXEL_SIZE, PIXEL_SIZE, count * extent - 2 * PIXEL_SIZE, extent - 2 * PIXEL_SIZE)
+    config = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": "synthetic"}, "geometry": aoi}]}
+    with open(os.path.join(directory, "config.geojson"), "w") as f:
+        json.dump(config, f)
+    return scenes
+
+
+def stub_detector(tif_path):
+    """
+    Stand-in for the marine debris model: reads the tile strip by strip like
+    the windowed predictor and writes a Byte {tile}_prediction.tif with a
+    fixed, sparse speckle of detections on valid pixels. Returns its path.
+    """
+    ds = gdal.Open(tif_path)
+    if ds is None:
+        raise FileNotFoundError(f"Cannot open {tif_path}")
+    output_path = os.path.splitext(tif_path)[0] + "_prediction.tif"
+    out = gdal.GetDriverByName("GTiff").Create(output_path, ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Byte)
+    out.SetGeoTransform(ds.GetGeoTransform())
+    out.SetProjection(ds.GetProjection())
+    rng = np.random.default_rng(0)
+    for yoff in range(0, ds.RasterYSize, 256):
+        rows = min(256, ds.RasterYSize - yoff)
+        valid = ds.GetRasterBand(1).ReadAsArray(0, yoff, ds.RasterXSize, rows) > 0
+        for number in range(2, ds.RasterCount + 1):
+            valid &= ds.GetRasterBand(number).ReadAsArray(0, yoff, ds.RasterXSize, rows) > 0
+        # A sparse speckle of "detections" on valid pixels
+        hits = valid & (rng.random(valid.shape) < STUB_DETECTION_RATE)
+        out.GetRasterBand(1).WriteArray(np.where(hits, 200, 0).astype(np.uint8), 0, yoff)
+    out = None
+    return output_path
@@ -0,0 +1,187 @@
+import os
+import json
+import math
+import hashlib
+import logging
+from osgeo import gdal, ogr, osr
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+CONFIG_PATH = os.getenv("CONFIG_PATH")
+CLIP_TO_AOI = os.environ.get("CLIP_TO_AOI", "1") == "1"
+
+_DEFAULT = {}
+
+
+def wgs84():
+    """EPSG:4326 with GeoJSON's lon/lat axis order."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def load_aoi(config_path=CONFIG_PATH):
+    """Union of all feature geometries in the config FeatureCollection, in EPSG:4326."""
+    with open(config_path) as f:
+        config = json.load(f)
+    union = None
+    for feature in config["features"]:
+        geometry = ogr.CreateGeometryFromJson(json.dumps(feature["geometry"]))
+        union = geometry if union is None else union.Union(geometry)
+    union.AssignSpatialReference(wgs84())
+    return union
+
+
+def default_aoi():
+    """The AOI from CONFIG_PATH, loaded once per process; None if clipping is off or unconfigured."""
+    if not CLIP_TO_AOI or not CONFIG_PATH or not os.path.exists(CONFIG_PATH):
+        return None
+    if CONFIG_PATH not in _DEFAULT:
+        _DEFAULT[CONFIG_PATH] = load_aoi(CONFIG_PATH)
+    return _DEFAULT[CONFIG_PATH]
+
+
+def aoi_hash(aoi):
+    """Short stable hash of an AOI, used in cache keys."""
+    return hashlib.sha256(aoi.ExportToWkb()).hexdigest()[:16] if aoi is not None else None
+
+
+def to_raster_crs(aoi, ds):
+    """Clone of the AOI transformed into the raster's CRS."""
+    target = osr.SpatialReference()
+    target.ImportFromWkt(ds.GetProjection())
+    target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    geometry = aoi.Clone()
+    geometry.Transform(osr.CoordinateTransformation(aoi.GetSpatialReference(), target))
+    geometry.AssignSpatialReference(target)
+    return geometry
+
+
+def clip_window(ds, geometry):
+    """
+    Pixel window (xoff, yoff, xsize, ysize) of the raster covering the
+    geometry's bounding box, or None if they do not overlap.
+    """
+    x0, dx, _, y0, _, dy = ds.GetGeoTransform()
+    min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+    col_start = max(int(math.floor((min_x - x0) / dx)), 0)
+    col_end = min(int(math.ceil((max_x - x0) / dx)), ds.RasterXSize)
+    row_start = max(int(math.floor((max_y - y0) / dy)), 0)
+    row_end = min(int(math.ceil((min_y - y0) / dy)), ds.RasterYSize)
+    if col_end <= col_start or row_end <= row_start:
+        return None
+    return col_start, row_start, col_end - col_start, row_end - row_start
+
+
+def mask_outside(ds, geometry, nodata=0):
+    """Burn nodata into every band of an open dataset wherever the geometry does not cover it."""
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    vector = driver.CreateDataSource("aoi")
+    layer = vector.CreateLayer("aoi", srs=geometry.GetSpatialReference())
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(geometry)
+    layer.CreateFeature(feature)
+    gdal.Rasterize(ds, vector, bands=list(range(1, ds.RasterCount + 1)),
+                   burnValues=[nodata] * ds.RasterCount, layers=["aoi"], inverse=True, allTouched=True)
+
+
+def inside_mask(ds, geometry, xsize=None, ysize=None):
+    """
+    Boolean array of the pixels whose centre lies inside the geometry (in
+    the raster's CRS), for the raster read at xsize x ysize (default: full size).
+    """
+    xsize, ysize = xsize or ds.RasterXSize, ysize or ds.RasterYSize
+    x0, dx, rx, y0, ry, dy = ds.GetGeoTransform()
+    target = gdal.GetDriverByName("MEM").Create("", xsize, ysize, 1, gdal.GDT_Byte)
+    target.SetGeoTransform((x0, dx * ds.RasterXSize / xsize, rx, y0, ry, dy * ds.RasterYSize / ysize))
+    target.SetProjection(ds.GetProjection())
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    vector = driver.CreateDataSource("aoi")
+    layer = vector.CreateLayer("aoi", srs=geometry.GetSpatialReference())
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(geometry)
+    layer.CreateFeature(feature)
+    gdal.Rasterize(target, vector, bands=[1], burnValues=[1], layers=["aoi"])
+    return target.GetRasterBand(1).ReadAsArray() > 0
+
+
+def load_features(config_path=CONFIG_PATH):
+    """
+    Every feature of the config FeatureCollection as {"name", "geometry"},
+    named by its "name" property or its position ("aoi-0", "aoi-1", ...).
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+    features = []
+    for number, feature in enumerate(config["features"]):
+        geom = feature["geometry"]
+        name = (feature.get("properties") or {}).get("name") or f"aoi-{number}"
+        features.append({"name": name, "geometry": {"type": geom["type"], "coordinates": geom["coordinates"]}})
+    return features
+
+
+def to_ogr(value):
+    """OGR geometry in EPSG:4326 from a GeoJSON dict, a shapely geometry or WKT."""
+    if hasattr(value, "__geo_interface__"):
+        value = value.__geo_interface__
+    if isinstance(value, dict):
+        geometry = ogr.CreateGeometryFromJson(json.dumps(value))
+    else:
+        geometry = ogr.CreateGeometryFromWkt(str(value))
+    if geometry is None:
+        raise ValueError(f"Not a geometry: {value!r}")
+    geometry.AssignSpatialReference(wgs84())
+    return geometry
+
+
+class AoiIndex:
+    """
+    In-memory spatial index of the configured AOIs.
+
+    AOI envelopes are bucketed into a regular lon/lat grid, so looking up
+    which AOIs a scene footprint touches only tests the AOIs sharing a cell
+    with it. Alongside, it remembers which AOIs every ordered scene and
+    merged tile serves.
+    """
+
+    def __init__(self, features, cell_degrees=1.0):
+        self.cell = cell_degrees
+        self.geometries = {feature["name"]: to_ogr(feature["geometry"]) for feature in features}
+        self.grid = {}
+        self.scenes = {}
+        self.tiles = {}
+        for name, geometry in self.geometries.items():
+            for cell in self._cells(geometry):
+                self.grid.setdefault(cell, []).append(name)
+
+    def _cells(self, geometry):
+        min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+        for col in range(math.floor(min_x / self.cell), math.floor(max_x / self.cell) + 1):
+            for row in range(math.floor(min_y / self.cell), math.floor(max_y / self.cell) + 1):
+                yield col, row
+
+    def query(self, footprint):
+        """Names of the AOIs that intersect a scene footprint (any geometry accepted by to_ogr)."""
+        geometry = to_ogr(footprint)
+        candidates = {name for cell in self._cells(geometry) for name in self.grid.get(cell, ())}
+        return sorted(name for name in candidates if self.geometries[name].Intersects(geometry))
+
+    def assign(self, scene_id, names):
+        self.scenes.setdefault(scene_id, set()).update(names)
+
+    def link_tile(self, scene_id, tile_id):
+        """Carry the AOIs of an ordered scene over to the tile it was delivered as."""
+        self.tiles.setdefault(tile_id, set()).update(self.scenes.get(scene_id, ()))
+
+    def aois_for_tile(self, tile_id):
+        return sorted(self.tiles.get(tile_id, ()))
+
+    def order_geometry(self, scene_id):
+        """GeoJSON of the union of the AOIs a scene serves, used as the order AOI."""
+        union = None
+        for name in sorted(self.scenes.get(scene_id, ())):
+            geometry = self.geometries[name]
+            union = geometry.Clone() if union is None else union.Union(geometry)
+        return json.loads(union.ExportToJson()) if union is not None else None
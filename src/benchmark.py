@@ -0,0 +1,459 @@
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import concurrent.futures
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import catalog, prediction, vectorize, zip_processing
+from offline import synthetic
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RESULTS_DIR = os.environ.get("BENCHMARK_RESULTS_DIR", "benchmarks/results")  # stored end-to-end results, git-ignored
+E2E_STAGES = ["order", "merge", "predict", "convert", "upload"]
+
+
+def copy_tiles(tif_files, target_dir):
+    """Copy tiles into a scratch directory so each benchmark run writes its own predictions."""
+    os.makedirs(target_dir, exist_ok=True)
+    copies = []
+    for tif_file in tif_files:
+        copy = os.path.join(target_dir, os.path.basename(tif_file))
+        shutil.copy(tif_file, copy)
+        copies.append(copy)
+    return copies
+
+
+def benchmark_prediction(tif_files, device="cpu"):
+    """Compare the per-tile marinedebrisdetector CLI against the in-process prediction engine."""
+    results = {"tiles": len(tif_files), "device": device}
+    with tempfile.TemporaryDirectory() as scratch:
+        # 1) One subprocess per tile, as prediction.main did before the engine existed
+        tiles = copy_tiles(tif_files, os.path.join(scratch, "cli"))
+        start = time.time()
+        for tile in tiles:
+            prediction.run_command(f"marinedebrisdetector --device={device} {tile}")
+        results["cli_seconds"] = time.time() - start
+
+        # 2) Model loaded once, tiles run through it in the same process
+        tiles = copy_tiles(tif_files, os.path.join(scratch, "engine"))
+        start = time.time()
+        prediction.load_model(device)
+        results["engine_load_seconds"] = time.time() - start
+        for tile in tiles:
+            prediction.predict_tile(tile, device)
+        results["engine_seconds"] = time.time() - start
+
+    results["speedup"] = results["cli_seconds"] / max(results["engine_seconds"], 1e-9)
+    logging.info(f"Prediction benchmark: {json.dumps(results)}")
+    return results
+
+
+def process_io():
+    """Bytes this process has read and written so far (Linux /proc/self/io, zeros elsewhere)."""
+    counters = {"rchar": 0, "wchar": 0}
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                key, value = line.split(":")
+                if key in counters:
+                    counters[key] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def benchmark_zip(zip_files):
+    """Compare extract-to-disk against /vsizip/ streaming for merging Sentinel-2 zips."""
+    results = {"archives": len(zip_files)}
+    with tempfile.TemporaryDirectory() as scratch:
+        for mode in ("extract", "vsizip"):
+            archives = copy_tiles(zip_files, os.path.join(scratch, mode))
+            before = process_io()
+            start = time.time()
+            outputs = [zip_processing.process_zip(archive, mode=mode) for archive in archives]
+            after = process_io()
+            results[mode] = {
+                "seconds": time.time() - start,
+                "read_mb": (after["rchar"] - before["rchar"]) / 1e6,
+                "written_mb": (after["wchar"] - before["wchar"]) / 1e6,
+                "output_mb": sum(os.path.getsize(output) for output in outputs) / 1e6,
+            }
+    logging.info(f"ZIP processing benchmark: {json.dumps(results)}")
+    return results
+
+
+def benchmark_rescale(zip_files, bands=None):
+    """Compare gdal.Translate against the windowed NumPy rescale for each output type and a band subset."""
+    configurations = [("gdal_byte", {"engine": "gdal", "dtype": "Byte"}),
+                      ("numpy_byte", {"engine": "numpy", "dtype": "Byte"}),
+                      ("numpy_uint16", {"engine": "numpy", "dtype": "UInt16"}),
+                      ("numpy_float16", {"engine": "numpy", "dtype": "Float16"})]
+    if bands:
+        configurations.append(("numpy_byte_subset", {"engine": "numpy", "dtype": "Byte", "bands": bands}))
+    results = {"archives": len(zip_files)}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name, options in configurations:
+            archives = copy_tiles(zip_files, os.path.join(scratch, name))
+            start = time.time()
+            outputs = [zip_processing.process_zip(archive, clip=False, **options) for archive in archives]
+            results[name] = {"seconds": time.time() - start,
+                             "output_mb": sum(os.path.getsize(output) for output in outputs) / 1e6}
+    logging.info(f"Rescale benchmark: {json.dumps(results)}")
+    return results
+
+
+def raster_size(tif_path):
+    """(width, height, bands) of a GeoTIFF."""
+    from osgeo import gdal
+    ds = gdal.Open(tif_path)
+    return ds.RasterXSize, ds.RasterYSize, ds.RasterCount
+
+
+def benchmark_clip(zip_files):
+    """Compare merging whole tiles against clipping them to the config AOI."""
+    results = {"archives": len(zip_files)}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name, clip in (("full", False), ("clipped", True)):
+            archives = copy_tiles(zip_files, os.path.join(scratch, name))
+            start = time.time()
+            outputs = [zip_processing.process_zip(archive, clip=clip) for archive in archives]
+            sizes = [raster_size(output) for output in outputs]
+            results[name] = {
+                "seconds": time.time() - start,
+                "pixels": sum(width * height * bands for width, height, bands in sizes),
+                "merged_mb": sum(os.path.getsize(output) for output in outputs) / 1e6,
+                # One Byte score per pixel: the uncompressed prediction that is converted and uploaded
+                "prediction_mb": sum(width * height for width, height, _ in sizes) / 1e6,
+            }
+    full, clipped = results["full"], results["clipped"]
+    results["pixels_saved"] = 1 - clipped["pixels"] / max(full["pixels"], 1)
+    results["bytes_saved"] = 1 - clipped["merged_mb"] / max(full["merged_mb"], 1e-9)
+    logging.info(f"AOI clip benchmark: {json.dumps(results)}")
+    return results
+
+
+def synthetic_prediction(path, size, blobs, seed=0):
+    """Write a size x size Byte prediction in UTM 33N that is zero except for `blobs` small scored patches."""
+    import numpy as np
+    from osgeo import gdal, osr
+    rng = np.random.default_rng(seed)
+    scores = np.zeros((size, size), dtype=np.uint8)
+    for row, col in rng.integers(0, size - 8, size=(blobs, 2)):
+        height, width = rng.integers(1, 8, size=2)
+        scores[row:row + height, col:col + width] = rng.integers(100, 256, size=(height, width))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32633)
+    ds = gdal.GetDriverByName("GTiff").Create(path, size, size, 1, gdal.GDT_Byte,
+                                              ["TILED=YES", "COMPRESS=DEFLATE", "PREDICTOR=2"])
+    ds.SetGeoTransform((300000, 10, 0, 5000040, 0, -10))
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(scores)
+    ds = None
+    return path
+
+
+def benchmark_vectorize(size=10980, blobs=500):
+    """Vectorize a synthetic, mostly-background prediction and compare raster and vector sizes."""
+    results = {"size": size, "blobs": blobs}
+    with tempfile.TemporaryDirectory() as scratch:
+        raster = synthetic_prediction(os.path.join(scratch, "T33TUL_prediction.tif"), size, blobs)
+        results["raster_mb"] = os.path.getsize(raster) / 1e6
+        results["raster_uncompressed_mb"] = size * size / 1e6
+        for vector_format in ("FlatGeobuf", "GeoJSON"):
+            start = time.time()
+            path, count = vectorize.vectorize_prediction(raster, vector_format=vector_format)
+            results[vector_format] = {"seconds": time.time() - start, "polygons": count,
+                                      "kb": os.path.getsize(path) / 1e3}
+    logging.info(f"Vectorize benchmark: {json.dumps(results)}")
+    return results
+
+
+def benchmark_catalog(years=10, tiles_per_day=20):
+    """
+    Fill a prediction catalog with `years` of daily entries and time inserts,
+    queries and the dates.json export against rewriting the JSON file.
+    """
+    import datetime
+    import random
+    results = {"years": years, "tiles_per_day": tiles_per_day}
+    tiles = [f"T{zone}{band}{square}" for zone in (32, 33, 34) for band in "STU" for square in ("UL", "VL", "WL")]
+    start_date = datetime.date.today() - datetime.timedelta(days=365 * years)
+    days = [(start_date + datetime.timedelta(days=n)).isoformat() for n in range(365 * years)]
+
+    def files_for(day):
+        compact = day.replace("-", "")
+        return [f"S2C_OPER_MSI_L2A_TL_2CPS_{compact}T101031_A000001_{tile}_N05.11_prediction.tif"
+                for tile in random.Random(day).sample(tiles, min(tiles_per_day, len(tiles)))]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        store = catalog.PredictionCatalog(os.path.join(scratch, "dates.sqlite"))
+        start = time.time()
+        store.add_many([(day, file) for day in days[:-1] for file in files_for(day)])
+        results["bulk_insert_seconds"] = time.time() - start
+        results["entries"] = store.count()
+
+        json_path = os.path.join(scratch, "dates.json")
+        store.export_dates_json(json_path)
+        results["dates_json_mb"] = os.path.getsize(json_path) / 1e6
+
+        # One daily run: previously load + append + rewrite of the whole JSON, now one transaction + export
+        start = time.time()
+        with open(json_path) as f:
+            json_data = json.load(f)
+        json_data.setdefault(days[-1], []).extend(files_for(days[-1]))
+        with open(json_path, "w") as f:
+            json.dump(json_data, f, indent=4)
+        results["json_daily_update_seconds"] = time.time() - start
+        start = time.time()
+        store.add(days[-1], files_for(days[-1]))
+        results["catalog_daily_insert_seconds"] = time.time() - start
+        start = time.time()
+        store.export_dates_json(json_path)
+        results["catalog_export_seconds"] = time.time() - start
+
+        start = time.time()
+        month = store.date_range(days[-31], days[-1])
+        results["range_query_ms"] = (time.time() - start) * 1000
+        results["range_query_days"] = len(month)
+        start = time.time()
+        history = store.for_tile(tiles[0])
+        results["tile_query_ms"] = (time.time() - start) * 1000
+        results["tile_query_rows"] = len(history)
+        start = time.time()
+        [day for day, files in json_data.items() if days[-31] <= day <= days[-1]]
+        results["json_range_scan_ms"] = (time.time() - start) * 1000
+    logging.info(f"Catalog benchmark: {json.dumps(results)}")
+    return results
+
+
+def e2e_environment(run_dir, source_dir):
+    """Settings of one isolated end-to-end run: all paths below run_dir, fast order polling, no tile cache."""
+    return {
+        "CONFIG_PATH": os.path.join(source_dir, "config.geojson"),
+        "INPUT_PATH": os.path.join(run_dir, "downloaded"),
+        "OUTPUT_PATH": os.path.join(run_dir, "predicted"),
+        "DATES_PATH": os.path.join(run_dir, "dates.json"),
+        "MANIFEST_PATH": os.path.join(run_dir, "manifest.sqlite"),
+        "JOB_STATE_PATH": os.path.join(run_dir, "jobs.sqlite"),
+        "REPORT_DIR": os.path.join(run_dir, "reports"),
+        "BUCKET_NAME": "marinelitter_predicted",
+        "CACHE_MAX_GB": "0",
+        "ORDER_POLL_MIN_SECONDS": "0.05",
+        "ORDER_POLL_MAX_SECONDS": "0.2",
+    }
+
+
+def run_isolated(func, env, *args):
+    """
+    func(*args) in a freshly spawned process whose environment is updated
+    with env, so module-level settings and caches start clean for every run.
+    """
+    saved = dict(os.environ)
+    os.environ.update(env)
+    for key in ("METRICS_DIR", "METRICS_STAGE"):
+        os.environ.pop(key, None)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            return executor.submit(func, *args).result()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def run_e2e(run_dir, source_dir, scenes, mode):
+    """
+    One full pipeline run over the synthetic scenes with the fake UP42
+    catalog (assets served over local HTTP), a fake GCS bucket and the stub
+    detector; returns the metrics report. Meant to run via run_isolated.
+    """
+    from src import convert, metrics, pipeline, upload_delete
+    from offline import fakes
+    from src import orderFromUp42_parallel as ordering
+    server, base_url = fakes.serve_directory(source_dir)
+    up42 = fakes.FakeCatalog(scenes, base_url=base_url)
+    bucket = fakes.FakeStorageClient(os.path.join(run_dir, "gcs")).bucket(os.environ["BUCKET_NAME"])
+    config_path, input_path, output_path = (os.environ[key] for key in ("CONFIG_PATH", "INPUT_PATH", "OUTPUT_PATH"))
+    dates_path = os.environ["DATES_PATH"]
+    start = time.time()
+    try:
+        if mode == "streaming":
+            pipeline.run_pipeline(config_path, catalog=up42, bucket=bucket, predict_func=synthetic.stub_detector,
+                                  input_path=input_path, output_path=output_path, dates_path=dates_path)
+        else:
+            downloaded = []
+            with metrics.stage("order"):
+                ordering.download_from_up42(config_path, catalog=up42, on_downloaded=downloaded.append,
+                                            input_path=input_path)
+            zip_processing.process_all(input_path)  # timed as "merge"
+            with metrics.stage("predict"):
+                prediction.main(predict_func=synthetic.stub_detector)
+            with metrics.stage("convert"):
+                convert.convert_images(output_path)
+            with metrics.stage("upload"):
+                upload_delete.upload_delete(os.environ["BUCKET_NAME"], output_path, dates_path, None, bucket=bucket)
+    finally:
+        server.shutdown()
+    return metrics.build_report(metrics.METRICS, start, {"objects_uploaded": len(list(bucket.list_blobs()))})
+
+
+def git_commit():
+    """Short hash of the checked-out commit (with "+dirty" for local changes), or None outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ("+dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_result(results_dir, config):
+    """The most recent stored end-to-end result with the same configuration, or None."""
+    if not os.path.isdir(results_dir):
+        return None
+    for file_name in sorted(os.listdir(results_dir), reverse=True):
+        if file_name.startswith("e2e_") and file_name.endswith(".json"):
+            with open(os.path.join(results_dir, file_name)) as f:
+                result = json.load(f)
+            if result.get("config") == config:
+                result["path"] = os.path.join(results_dir, file_name)
+                return result
+    return None
+
+
+def compare_results(result, baseline, tolerance=0.2, min_seconds=0.5):
+    """
+    Stages (and the total run) that became more than `tolerance` slower
+    than in baseline; differences below min_seconds are treated as noise.
+    """
+    regressions = []
+    pairs = [("total", result["seconds"], baseline["seconds"])]
+    pairs += [(name, seconds, baseline["stages"].get(name)) for name, seconds in result["stages"].items()]
+    for name, seconds, before in pairs:
+        if before is None:
+            continue
+        change = seconds / max(before, 1e-9) - 1
+        logging.info(f"{name:>8}: {before:8.2f}s -> {seconds:8.2f}s ({change:+.0%})")
+        if change > tolerance and seconds - before > min_seconds:
+            regressions.append({"stage": name, "baseline_seconds": before, "seconds": seconds,
+                                "change": round(change, 3)})
+    return regressions
+
+
+def benchmark_e2e(scenes=4, size=1024, bands=None, mode="sequential", repeat=1, results_dir=RESULTS_DIR,
+                  baseline=None, tolerance=0.2):
+    """
+    Run the whole pipeline offline on synthetic Sentinel-2 zips `repeat`
+    times and keep the best time per stage. The result is stored in
+    results_dir and compared with `baseline` (default: the latest stored
+    result with the same configuration); regressions are returned in it.
+    """
+    config = {"scenes": scenes, "size": size, "bands": bands or synthetic.S2_BANDS, "mode": mode}
+    previous = baseline_result = None
+    if baseline:
+        with open(baseline) as f:
+            baseline_result = json.load(f)
+        baseline_result["path"] = baseline
+    else:
+        previous = latest_result(results_dir, config)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as scratch:
+        source_dir = os.path.join(scratch, "up42")
+        records = synthetic.write_scenes(source_dir, scenes, size, config["bands"])
+        for run in range(repeat):
+            run_dir = os.path.join(scratch, f"run{run}")
+            runs.append(run_isolated(run_e2e, e2e_environment(run_dir, source_dir), run_dir, source_dir, records, mode))
+
+    stages = [name for name in E2E_STAGES if name in runs[0]["stages"]]
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "config": config,
+        "seconds": min(run["seconds"] for run in runs),
+        "stages": {name: min(run["stages"][name]["seconds"] for run in runs) for name in stages},
+        "peak_rss_mb": {name: max(run["stages"][name]["peak_rss_mb"] for run in runs) for name in stages},
+        "runs": runs,
+    }
+    reference = baseline_result or previous
+    result["baseline"] = reference["path"] if reference else None
+    result["regressions"] = compare_results(result, reference, tolerance) if reference else []
+
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"e2e_{result['created'].replace(':', '-')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=4)
+    logging.info(f"End-to-end benchmark: {json.dumps({k: result[k] for k in ('seconds', 'stages', 'regressions')})}")
+    logging.info(f"Result stored in {path}" + (f", compared with {result['baseline']}" if reference else ""))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the marine litter pipeline stages.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    predict_parser = subparsers.add_parser("prediction", help="CLI-per-tile vs. in-process prediction engine")
+    predict_parser.add_argument("tiles", nargs="+", help="merged Sentinel-2 GeoTIFF tiles")
+    predict_parser.add_argument("--device", default="cpu")
+
+    zip_parser = subparsers.add_parser("zip", help="extract-to-disk vs. /vsizip/ band merging")
+    zip_parser.add_argument("archives", nargs="+", help="Sentinel-2 zips with metadata.xml and B*.tif")
+
+    clip_parser = subparsers.add_parser("clip", help="whole-tile vs. AOI-clipped band merging")
+    clip_parser.add_argument("archives", nargs="+", help="Sentinel-2 zips with metadata.xml and B*.tif")
+
+    vector_parser = subparsers.add_parser("vectorize", help="vectorizing a synthetic sparse prediction raster")
+    vector_parser.add_argument("--size", type=int, default=10980, help="raster width and height in pixels")
+    vector_parser.add_argument("--blobs", type=int, default=500, help="number of detections")
+
+    catalog_parser = subparsers.add_parser("catalog", help="prediction catalog vs. dates.json with years of entries")
+    catalog_parser.add_argument("--years", type=int, default=10)
+    catalog_parser.add_argument("--tiles-per-day", type=int, default=20)
+
+    rescale_parser = subparsers.add_parser("rescale", help="gdal.Translate vs. windowed NumPy band rescaling")
+    rescale_parser.add_argument("archives", nargs="+", help="Sentinel-2 zips with metadata.xml and B*.tif")
+    rescale_parser.add_argument("--bands", nargs="*", help="band subset to compare, e.g. B02 B03 B04 B08")
+
+    e2e_parser = subparsers.add_parser("e2e", help="whole pipeline on synthetic scenes with fake UP42/GCS")
+    e2e_parser.add_argument("--scenes", type=int, default=4, help="number of synthetic Sentinel-2 zips")
+    e2e_parser.add_argument("--size", type=int, default=1024, help="scene width and height in pixels")
+    e2e_parser.add_argument("--bands", nargs="*", help="bands per zip (default: all 12 L2A bands)")
+    e2e_parser.add_argument("--mode", choices=["sequential", "streaming"], default="sequential")
+    e2e_parser.add_argument("--repeat", type=int, default=1, help="runs; the best time per stage is kept")
+    e2e_parser.add_argument("--results-dir", default=RESULTS_DIR)
+    e2e_parser.add_argument("--baseline", help="result file to compare with (default: latest with same config)")
+    e2e_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown per stage, e.g. 0.2")
+
+    args = parser.parse_args()
+    if args.benchmark == "prediction":
+        benchmark_prediction(args.tiles, args.device)
+    elif args.benchmark == "zip":
+        benchmark_zip(args.archives)
+    elif args.benchmark == "clip":
+        benchmark_clip(args.archives)
+    elif args.benchmark == "rescale":
+        benchmark_rescale(args.archives, args.bands)
+    elif args.benchmark == "vectorize":
+        benchmark_vectorize(args.size, args.blobs)
+    elif args.benchmark == "catalog":
+        benchmark_catalog(args.years, args.tiles_per_day)
+    elif args.benchmark == "e2e":
+        result = benchmark_e2e(args.scenes, args.size, args.bands, args.mode, args.repeat, args.results_dir,
+                               args.baseline, args.tolerance)
+        if result["regressions"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
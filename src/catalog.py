@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DATES_PATH   = os.getenv("DATES_PATH")
+CATALOG_PATH = os.getenv("CATALOG_PATH")  # default: dates.json's path with .sqlite
+
+TILE_PATTERN = re.compile(r"_(T\d{2}[A-Z]{3})_")
+DATE_PATTERN = re.compile(r"_(\d{4})(\d{2})(\d{2})T\d{6}_")
+
+
+def tile_of(file_name):
+    """MGRS tile (e.g. T33TYE) in a Sentinel-2 product or prediction file name, or None."""
+    match = TILE_PATTERN.search(file_name)
+    return match.group(1) if match else None
+
+
+def date_of(file_name):
+    """ISO date of the first timestamp (e.g. _20240601T101031_) in a Sentinel-2 file name, or None."""
+    match = DATE_PATTERN.search(file_name)
+    return "-".join(match.groups()) if match else None
+
+
+class PredictionCatalog:
+    """
+    SQLite store of which prediction files exist for which date.
+
+    (date, file) is the primary key and (tile, date) has an index, so date
+    ranges and tiles are B-tree lookups and duplicates cannot occur. The
+    database runs in WAL mode, every update is one transaction and several
+    workers may write at once. dates.json is no longer the source of truth,
+    only an export for the GEE frontend.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions (date TEXT NOT NULL, file TEXT NOT NULL, "
+                             "tile TEXT, PRIMARY KEY (date, file)) WITHOUT ROWID")
+            self._db.execute("CREATE INDEX IF NOT EXISTS predictions_tile ON predictions (tile, date)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS predictions_file ON predictions (file)")
+
+    def add(self, date, files):
+        """Record prediction files for a date in one transaction; already known files are ignored."""
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?)",
+                                 [(date, file, tile_of(file)) for file in files])
+
+    def add_many(self, entries):
+        """Record (date, file) pairs in one transaction."""
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?)",
+                                 [(date, file, tile_of(file)) for date, file in entries])
+
+    def date_of_file(self, file):
+        """Latest date a prediction file is recorded under, or None."""
+        with self._lock:
+            return self._db.execute("SELECT MAX(date) FROM predictions WHERE file = ?", (file,)).fetchone()[0]
+
+    def files_for_date(self, date):
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT file FROM predictions WHERE date = ? ORDER BY file", (date,))]
+
+    def date_range(self, start, end):
+        """{date: [files]} for start <= date <= end (ISO dates)."""
+        with self._lock:
+            rows = self._db.execute("SELECT date, file FROM predictions WHERE date BETWEEN ? AND ? "
+                                    "ORDER BY date, file", (start, end)).fetchall()
+        result = {}
+        for date, file in rows:
+            result.setdefault(date, []).append(file)
+        return result
+
+    def for_tile(self, tile, start=None, end=None):
+        """[(date, file)] of one MGRS tile, optionally limited to a date range."""
+        with self._lock:
+            return self._db.execute("SELECT date, file FROM predictions WHERE tile = ? AND date BETWEEN ? AND ? "
+                                    "ORDER BY date, file", (tile, start or "", end or "9999")).fetchall()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def import_dates_json(self, json_path):
+        """
+        Load an existing dates.json, dropping its duplicate entries. A file
+        that is not valid JSON raises instead of being replaced by {}.
+        """
+        with open(json_path) as f:
+            try:
+                json_data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{json_path} is not valid JSON, refusing to import it: {e}") from e
+        entries = [(date, file) for date, files in json_data.items() for file in files]
+        self.add_many(entries)
+        logging.info(f"Imported {len(entries)} entries ({self.count()} unique) from {json_path}")
+
+    def export_dates_json(self, json_path):
+        """Write {date: [files]} in the dates.json format via a temp file and os.replace."""
+        with self._lock:
+            rows = self._db.execute("SELECT date, file FROM predictions ORDER BY date, file").fetchall()
+        json_data = {}
+        for date, file in rows:
+            json_data.setdefault(date, []).append(file)
+        temp_path = f"{json_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as json_file:
+            json.dump(json_data, json_file, indent=4)
+            json_file.flush()
+            os.fsync(json_file.fileno())
+        os.replace(temp_path, json_path)
+        return json_data
+
+
+def open_catalog(dates_path=DATES_PATH, catalog_path=CATALOG_PATH):
+    """
+    The catalog at catalog_path (default: next to dates_path); on first use
+    it is seeded from the existing dates.json so no history is lost.
+    """
+    catalog_path = catalog_path or os.path.splitext(dates_path)[0] + ".sqlite"
+    fresh = not os.path.exists(catalog_path)
+    catalog = PredictionCatalog(catalog_path)
+    if fresh and dates_path and os.path.exists(dates_path):
+        try:
+            catalog.import_dates_json(dates_path)
+        except Exception:
+            # Do not leave an empty catalog behind that the next run would trust
+            catalog._db.close()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(catalog_path + suffix):
+                    os.remove(catalog_path + suffix)
+            raise
+    return catalog
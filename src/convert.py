@@ -1,34 +1,122 @@
 import os
-import subprocess
+import sys
+import time
 import logging
-import tempfile
-import shutil
+from osgeo import gdal
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.scheduler import MB, run_pool, worker_count
+from src.zip_processing import gdal_budget, init_gdal_worker, worker_threads
+from src.job_state import default_job_store, tile_of_path
+from src import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 OUTPUT_PATH = os.getenv("OUTPUT_PATH")
+COG_COMPRESS  = os.environ.get("COG_COMPRESS", "DEFLATE")  # DEFLATE or ZSTD
+COG_LEVEL     = os.environ.get("COG_LEVEL")                # optional compression level
+COG_PREDICTOR = os.environ.get("COG_PREDICTOR", "2")       # 2 = horizontal differencing
+CONVERT_WORKERS = int(os.environ["CONVERT_WORKERS"]) if os.getenv("CONVERT_WORKERS") else None  # optional cap
+CONVERT_TASK_MEMORY_MB = int(os.environ.get("CONVERT_TASK_MEMORY_MB", 512))
+
+def compression():
+    """COG_COMPRESS if this GDAL build supports it, DEFLATE otherwise."""
+    options = gdal.GetDriverByName("COG").GetMetadataItem("DMD_CREATIONOPTIONLIST") or ""
+    if COG_COMPRESS.upper() in options:
+        return COG_COMPRESS.upper()
+    logging.warning(f"{COG_COMPRESS} is not supported by this GDAL build, using DEFLATE")
+    return "DEFLATE"
+
+def cog_options():
+    """
+    Creation options of the COG driver: tiled, compressed, with predictor and
+    generated overviews, compressing on this worker's share of the cores.
+    """
+    method = compression()
+    options = [f"COMPRESS={method}", f"PREDICTOR={COG_PREDICTOR}", "OVERVIEWS=AUTO",
+               "OVERVIEW_RESAMPLING=AVERAGE", "BIGTIFF=IF_SAFER", f"NUM_THREADS={worker_threads()}"]
+    if COG_LEVEL:
+        options.append(f"LEVEL={COG_LEVEL}")
+    return options
+
+def convert_file(input_file):
+    """Rewrite one GeoTIFF in place as a Cloud-Optimized GeoTIFF; return size and throughput stats."""
+    input_folder, file_name = os.path.split(input_file)
+    temp_file = os.path.join(input_folder, f"temp_{file_name}")
+
+    start = time.time()
+    size_before = os.path.getsize(input_file)
+    try:
+        if gdal.Translate(temp_file, input_file, format="COG", creationOptions=cog_options()) is None:
+            raise RuntimeError(gdal.GetLastErrorMsg())
+        os.replace(temp_file, input_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+    seconds = time.time() - start
+    size_after = os.path.getsize(input_file)
+    metrics.count("bytes_in", size_before)
+    metrics.count("bytes_out", size_after)
+
+    stats = {
+        "file": file_name,
+        "seconds": round(seconds, 3),
+        "input_mb": round(size_before / MB, 2),
+        "output_mb": round(size_after / MB, 2),
+        "reduction": round(1 - size_after / max(size_before, 1), 4),
+        "mb_per_second": round(size_before / MB / max(seconds, 1e-9), 2),
+    }
+    logging.info(f"Converted {file_name}: {stats['input_mb']} MB -> {stats['output_mb']} MB "
+                 f"({stats['reduction']:.0%} smaller) in {seconds:.1f}s, {stats['mb_per_second']} MB/s")
+    return stats
+
+def convert_image(input_file):
+    """Convert one TIFF image in place to a COG; return True on success."""
+    jobs = default_job_store()
+    try:
+        if jobs is not None and jobs.tile_reached(tile_of_path(input_file), "converted"):
+            logging.info(f"Already converted: {input_file}")
+            return True
+        logging.info(f"Processing file: {input_file}")
+        convert_file(input_file)
+        if jobs is not None:
+            jobs.advance_tile(tile_of_path(input_file), "converted")
+        return True
+    except Exception as e:
+        logging.error(f"Error converting file {os.path.basename(input_file)}: {e}")
+        return False
+
+def convert_images(input_folder, max_workers=CONVERT_WORKERS):
+    """Convert all *_prediction.tif in the input folder to COGs in parallel worker processes."""
+    files = sorted(os.path.join(input_folder, file_name) for file_name in os.listdir(input_folder)
+                   if file_name.endswith("_prediction.tif"))
+    jobs = default_job_store()
+    if jobs is not None:
+        # Already COGs from an interrupted run; converting them again would only cost time
+        files = [path for path in files if not jobs.tile_reached(tile_of_path(path), "converted")]
+    if not files:
+        logging.info(f"No predictions to convert in {input_folder}")
+        return {}
+
+    workers = min(worker_count(CONVERT_TASK_MEMORY_MB * MB, max_workers, label="conversion"), len(files))
+    cache_mb, threads = gdal_budget(workers, CONVERT_TASK_MEMORY_MB)
+    start = time.time()
+    results = run_pool(convert_file, files, workers, initializer=init_gdal_worker,
+                       initargs=(cache_mb, threads), label="predictions")
 
-def convert_images(input_folder):
-    """Convert all TIFF images in the input folder using gdal_translate."""
-    for file_name in os.listdir(input_folder):
-        if file_name.endswith("_prediction.tif"):
-            input_file = os.path.join(input_folder, file_name)
-
-            temp_file = os.path.join(input_folder, f"temp_{file_name}")
-
-            command = f"gdal_translate {input_file} {temp_file} -co TILED=YES -co COPY_SRC_OVERVIEWS=YES"
-            try:
-                logging.info(f"Processing file: {input_file}")
-                subprocess.run(command, shell=True, check=True)
-                
-                os.replace(temp_file, input_file)
-
-                logging.info(f"Successfully converted: {file_name}")
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Error converting file {file_name}: {e}")
-                if os.path.exists(temp_file):
-                    os.remove(temp_file) 
+    converted = [stats for stats in results.values() if stats is not None]
+    for path, stats in results.items():
+        if stats is None:
+            logging.error(f"Error converting file {os.path.basename(path)}")
+        elif jobs is not None:
+            jobs.advance_tile(tile_of_path(path), "converted")
+    seconds = time.time() - start
+    input_mb = sum(stats["input_mb"] for stats in converted)
+    output_mb = sum(stats["output_mb"] for stats in converted)
+    logging.info(f"Converted {len(converted)} of {len(files)} files with {workers} workers in {seconds:.1f}s: "
+                 f"{input_mb:.1f} MB -> {output_mb:.1f} MB, {input_mb / max(seconds, 1e-9):.1f} MB/s")
+    return results
 
 if __name__ == "__main__":
     if not os.path.exists(OUTPUT_PATH):
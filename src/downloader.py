@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import base64
+import hashlib
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.request
+import concurrent.futures
+from collections import namedtuple
+
+from src import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DOWNLOAD_WORKERS     = int(os.environ.get("DOWNLOAD_WORKERS", 3))
+DOWNLOAD_CHUNK_BYTES = int(os.environ.get("DOWNLOAD_CHUNK_BYTES", 8 * 1024 * 1024))
+DOWNLOAD_RETRIES     = int(os.environ.get("DOWNLOAD_RETRIES", 5))
+DOWNLOAD_TIMEOUT     = float(os.environ.get("DOWNLOAD_TIMEOUT", 60))
+
+# checksum is "md5:<hex>" or "sha256:<hex>"; size and checksum may be None
+DownloadJob = namedtuple("DownloadJob", ["url", "filename", "size", "checksum"], defaults=(None, None))
+
+# Caps concurrent transfers process-wide, however many orders download at once
+_SLOTS = threading.BoundedSemaphore(DOWNLOAD_WORKERS)
+
+
+def asset_filename(file):
+    """
+    The name the UP42 SDK saves an asset file under: the filename in the
+    signed URL's content-disposition, falling back to file.file_name.
+    """
+    default = getattr(file, "file_name", None)
+    url = getattr(file, "url", None)
+    if not url:
+        return default
+    try:
+        from up42 import utils
+    except ImportError:
+        return default
+    return utils.get_filename(url, default_filename=default)
+
+
+def job_for_asset(asset):
+    """Build a DownloadJob from an UP42 asset, or None if it exposes no direct download URL."""
+    url = getattr(asset.file, "url", None)
+    if not url:
+        return None
+    filename = asset_filename(asset.file) or f"{asset.asset_id}.dat"
+    info = getattr(asset, "info", None) or {}
+    return DownloadJob(url, filename, info.get("size"), info.get("checksum"))
+
+
+def file_digest(path, algorithm):
+    """Hash a file in chunks and return the hashlib object."""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest
+
+
+def expected_checksum(job, headers):
+    """Checksum to verify against: the job's own, else the md5 in GCS's x-goog-hash header."""
+    if job.checksum:
+        algorithm, value = job.checksum.split(":", 1)
+        return algorithm, value.lower()
+    match = re.search(r"md5=([A-Za-z0-9+/=]+)", headers.get("x-goog-hash", "") if headers else "")
+    if match:
+        return "md5", base64.b64decode(match.group(1)).hex()
+    return None
+
+
+def total_size(response, offset):
+    """Full object size from Content-Range (partial responses) or Content-Length."""
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length is not None else None
+
+
+def unsatisfiable_size(headers):
+    """Object size from the Content-Range (bytes */<size>) of a 416 response, or None."""
+    match = re.search(r"\*/(\d+)", headers.get("Content-Range", "") if headers else "")
+    return int(match.group(1)) if match else None
+
+
+def download_file(job, target_dir):
+    """
+    Stream one file to `<name>.part` in chunks, resuming from the bytes already
+    on disk after a dropped connection, verify size and checksum, then rename
+    it into place. Returns the final path.
+    """
+    with _SLOTS:
+        return _download(job, target_dir)
+
+
+def _download(job, target_dir):
+    target = os.path.join(target_dir, job.filename)
+    part = target + ".part"
+    os.makedirs(target_dir, exist_ok=True)
+
+    start = time.time()
+    fetched = 0
+    retries = 0
+    size = job.size
+    headers = None
+
+    while True:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if size is not None and offset == size:
+            break
+        request = urllib.request.Request(job.url, headers={"Range": f"bytes={offset}-"} if offset else {})
+        try:
+            with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+                if offset and response.status != 206:
+                    logging.warning(f"{job.filename}: server ignored the range request; restarting")
+                    offset = 0
+                headers = response.headers
+                size = total_size(response, offset) or size
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_BYTES), b""):
+                        f.write(chunk)
+                        fetched += len(chunk)
+            if size is None or os.path.getsize(part) >= size:
+                break
+            raise http.client.IncompleteRead(b"", size - os.path.getsize(part))
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Nothing left at `offset`: the .part file holds the whole object, unless it is stale or too long
+                size = size or unsatisfiable_size(e.headers)
+                checksum = expected_checksum(job, e.headers)
+                if size == offset or (size is None and checksum):
+                    headers = headers or e.headers
+                    break  # verified below
+                logging.warning(f"{job.filename}: server rejected resuming at byte {offset} and the .part file "
+                                f"cannot be verified (size {size}, checksum {'known' if checksum else 'unknown'}); "
+                                f"restarting from byte 0")
+                os.remove(part)
+                continue
+            if e.code < 500 or retries >= DOWNLOAD_RETRIES:
+                raise
+            retries += 1
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if retries >= DOWNLOAD_RETRIES:
+                raise
+            retries += 1
+            logging.warning(f"{job.filename}: interrupted at byte {os.path.getsize(part) if os.path.exists(part) else 0} "
+                            f"({e}); retry {retries}/{DOWNLOAD_RETRIES}")
+        time.sleep(min(2 ** retries, 30))
+
+    actual_size = os.path.getsize(part)
+    if size is not None and actual_size != size:
+        os.remove(part)
+        raise ValueError(f"{job.filename}: size mismatch, expected {size} bytes, got {actual_size}")
+
+    checksum = expected_checksum(job, headers)
+    if checksum:
+        algorithm, value = checksum
+        actual = file_digest(part, algorithm).hexdigest()
+        if actual != value:
+            os.remove(part)
+            raise ValueError(f"{job.filename}: {algorithm} mismatch, expected {value}, got {actual}")
+
+    os.replace(part, target)
+    seconds = time.time() - start
+    metrics.count("bytes_in", fetched)
+    metrics.count("download_retries", retries)
+    metrics.observe("download_seconds", seconds)
+    logging.info(f"Downloaded {job.filename}: {actual_size / 1e6:.1f} MB ({fetched / 1e6:.1f} MB this run) "
+                 f"in {seconds:.1f}s, {fetched / 1e6 / max(seconds, 1e-6):.1f} MB/s, {retries} retries, "
+                 f"checksum {'verified' if checksum else 'not available'}")
+    return target
+
+
+def download_all(jobs, target_dir, workers=DOWNLOAD_WORKERS):
+    """Download jobs with at most `workers` in flight; return {filename: path or None}."""
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file, job, target_dir): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                results[job.filename] = future.result()
+            except Exception as e:
+                logging.error(f"Download of {job.filename} failed: {e}")
+                results[job.filename] = None
+    return results
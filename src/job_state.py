@@ -0,0 +1,147 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+JOB_STATE_PATH = os.environ.get("JOB_STATE_PATH", "images/jobs.sqlite")  # "" disables the job store
+
+# Lifecycle of a scene, in order; a scene only ever moves forward (see JobStore.reset)
+STATES = ["searched", "ordered", "fulfilled", "downloaded", "merged", "predicted", "converted", "uploaded"]
+RANK = {state: rank for rank, state in enumerate(STATES)}
+# Terminal like "uploaded": the pre-filter dropped the merged tile, so there is nothing left to do
+RANK["screened_out"] = RANK["uploaded"]
+
+_DEFAULT = None
+
+
+def default_job_store():
+    """The process-wide job store at JOB_STATE_PATH, or None when it is disabled."""
+    global _DEFAULT
+    if _DEFAULT is None and JOB_STATE_PATH:
+        _DEFAULT = JobStore(JOB_STATE_PATH)
+    return _DEFAULT
+
+
+def tile_of_path(path):
+    """
+    Tile ID (the merged file's stem) of {tile}.tif, {tile}_prediction.tif or
+    {tile}_detections.*; the job store, the upload manifest and the tile
+    cache all key tiles by it.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for suffix in ("_prediction", "_detections"):
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+class JobStore:
+    """
+    SQLite record of every scene's progress through the pipeline: searched,
+    ordered (with the UP42 order ID), fulfilled, downloaded, merged,
+    predicted, converted and uploaded, or screened_out when the pre-filter
+    dropped the tile. Each stage consults it before doing
+    work and records what it finished, so a run that restarts after a crash
+    re-attaches to the orders it already paid for and continues each scene
+    from its last completed state.
+
+    Scenes are keyed by UP42 image ID; after the download they are also
+    known by tile ID (the TILE_ID of the zip), which later stages work with.
+    """
+
+    def __init__(self, path=JOB_STATE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS scenes (image_id TEXT PRIMARY KEY, date TEXT, state TEXT, "
+                             "order_id TEXT, tile_id TEXT, error TEXT, updated REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS scenes_tile ON scenes (tile_id)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS scenes_date ON scenes (date, state)")
+
+    def get(self, image_id):
+        """{"image_id", "date", "state", "order_id", "tile_id", "error"} of a scene, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT image_id, date, state, order_id, tile_id, error FROM scenes "
+                                   "WHERE image_id = ?", (image_id,)).fetchone()
+        return dict(zip(("image_id", "date", "state", "order_id", "tile_id", "error"), row)) if row else None
+
+    def reached(self, image_id, state):
+        """True if the scene has completed `state` (or a later one)."""
+        job = self.get(image_id)
+        return job is not None and RANK[job["state"]] >= RANK[state]
+
+    def advance(self, image_id, state, date=None, order_id=None, tile_id=None):
+        """
+        Move a scene to `state` unless it is already further along; the
+        order ID and tile ID are stored when given, the date only when the
+        scene has none yet (it stays the day it was searched for). Clears a
+        previous error.
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT state FROM scenes WHERE image_id = ?", (image_id,)).fetchone()
+            if row is None:
+                self._db.execute("INSERT INTO scenes VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                                 (image_id, date, state, order_id, tile_id, time.time()))
+                return
+            if RANK[state] < RANK[row[0]]:
+                state = row[0]
+            self._db.execute("UPDATE scenes SET state = ?, date = COALESCE(date, ?), order_id = COALESCE(?, order_id), "
+                             "tile_id = COALESCE(?, tile_id), error = NULL, updated = ? WHERE image_id = ?",
+                             (state, date, order_id, tile_id, time.time(), image_id))
+
+    def advance_tile(self, tile_id, state):
+        """Move every scene that became `tile_id` to `state` (stages after the download work per tile)."""
+        with self._lock, self._db:
+            rows = self._db.execute("SELECT image_id, state FROM scenes WHERE tile_id = ?", (tile_id,)).fetchall()
+            for image_id, current in rows:
+                if RANK[state] > RANK[current]:
+                    self._db.execute("UPDATE scenes SET state = ?, error = NULL, updated = ? WHERE image_id = ?",
+                                     (state, time.time(), image_id))
+        return len(rows)
+
+    def tile_reached(self, tile_id, state):
+        """True if a scene with this tile ID has completed `state`."""
+        with self._lock:
+            rows = self._db.execute("SELECT state FROM scenes WHERE tile_id = ?", (tile_id,)).fetchall()
+        return any(RANK[row[0]] >= RANK[state] for row in rows)
+
+    def date_of_tile(self, tile_id):
+        """The date the scene that became `tile_id` was searched for, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(date) FROM scenes WHERE tile_id = ?", (tile_id,)).fetchone()
+        return row[0]
+
+    def reset(self, image_id, error, state="searched"):
+        """Send a scene back (e.g. its order failed) and drop its order ID, so the next run orders it again."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE scenes SET state = ?, order_id = NULL, error = ?, updated = ? WHERE image_id = ?",
+                             (state, error, time.time(), image_id))
+
+    def in_state(self, *states, date=None):
+        """Scenes currently in one of `states`, optionally of one date."""
+        query = f"SELECT image_id FROM scenes WHERE state IN ({', '.join('?' * len(states))})"
+        params = list(states)
+        if date is not None:
+            query += " AND date = ?"
+            params.append(date)
+        with self._lock:
+            return [row[0] for row in self._db.execute(query + " ORDER BY image_id", params)]
+
+    def pending_tiles(self):
+        """Tile IDs that are predicted or converted but not uploaded yet."""
+        with self._lock:
+            return sorted({row[0] for row in self._db.execute(
+                "SELECT tile_id FROM scenes WHERE state IN ('predicted', 'converted') AND tile_id IS NOT NULL")})
+
+    def summary(self):
+        """{state: number of scenes}."""
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM scenes GROUP BY state").fetchall())
@@ -1,30 +1,29 @@
 import os
-import subprocess
+import sys
+import json
+import time
 import logging
+import argparse
+import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def execute_script(script_path, args=""):
-    """Executes a given Python script with optional arguments."""
-    try:
-        command = f"python {script_path} {args}"
-        logging.info(f"Executing: {command}")
-        subprocess.run(command, shell=True, check=True)
-        logging.info(f"Successfully executed: {script_path}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error executing {script_path}: {e}")
-
-def main():
-    # Define script paths with correct relative paths
-    scripts = {
-        "order": "src/orderFromUp42_parallel.py",
-        "predict": "src/prediction.py",
-        "convert": "src/convert.py",
-        "upload_delete": "src/upload_delete.py"
-    }
-
-    # Environment variables for order
+# Stage → stages it needs; run in this order
+STAGES = {
+    "order": [],
+    "predict": ["order"],
+    "convert": ["predict"],
+    "upload": ["convert"],
+}
+RUN_STATE_PATH = os.environ.get("RUN_STATE_PATH", "images/reports/run_state.json")  # stages finished per date
+
+
+def configure_environment():
+    """Settings every stage module reads at import time; set before the stages are imported."""
     os.environ["CONFIG_PATH"] = "src/resources/config.geojson"
     os.environ["DATES_PATH"] = "src/resources/dates.json"
     os.environ["INPUT_PATH"] = "images/downloaded"
@@ -33,17 +32,179 @@ def main():
     os.environ["GOOGLE_CRED_PATH"] = "secrets/google_credentials.json"
     os.environ["BUCKET_NAME"] = "marinelitter_predicted"
 
-    # Execute scripts in sequence
-    logging.info("--------------Starting workflow--------------")
-    logging.info("--------------Order and Download Images--------------")
-    execute_script(scripts["order"])
-    logging.info("--------------Analyse Images--------------")
-    execute_script(scripts["predict"])
-    logging.info("--------------Convert Images--------------")
-    execute_script(scripts["convert"])
-    logging.info("--------------Upload and Delete Images--------------")
-    execute_script(scripts["upload_delete"])
+
+class Clients:
+    """
+    Clients shared by all stages of a run, created on first use: the UP42
+    catalog session and the storage bucket. GDAL gets this process's cache
+    and thread settings once.
+    """
+
+    def __init__(self, catalog=None, bucket=None):
+        self._catalog = catalog
+        self._bucket = bucket
+        from src.zip_processing import gdal_budget, init_gdal_worker
+        init_gdal_worker(*gdal_budget(1))
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            from src import orderFromUp42_parallel as ordering
+            self._catalog = ordering.initialize_catalog()
+        return self._catalog
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from src import upload_delete
+            self._bucket = upload_delete.open_bucket(os.environ["BUCKET_NAME"], os.environ["GOOGLE_CRED_PATH"])
+        return self._bucket
+
+
+def run_order(clients):
+    from src import orderFromUp42_parallel as ordering
+    ordering.download_from_up42(os.environ["CONFIG_PATH"], catalog=clients.catalog)
+
+
+def run_predict(clients):
+    from src import prediction
+    results = prediction.main()
+    failed = [path for path, output_path in results.items() if output_path is None]
+    if failed:
+        # Converting and uploading would publish an incomplete day
+        raise RuntimeError(f"{len(failed)} of {len(results)} tiles could not be predicted")
+
+
+def run_convert(clients):
+    from src import convert
+    results = convert.convert_images(os.environ["OUTPUT_PATH"])
+    failed = [path for path, stats in results.items() if stats is None]
+    if failed:
+        # Uploading would publish unconverted rasters
+        raise RuntimeError(f"{len(failed)} of {len(results)} predictions could not be converted")
+
+
+def run_upload(clients):
+    from src import upload_delete
+    failed = upload_delete.upload_delete(os.environ["BUCKET_NAME"], os.environ["OUTPUT_PATH"],
+                                         os.environ["DATES_PATH"], os.environ["GOOGLE_CRED_PATH"],
+                                         bucket=clients.bucket)
+    if failed:
+        raise RuntimeError(f"{len(failed)} files could not be uploaded: {failed}")
+
+
+STAGE_FUNCTIONS = {"order": run_order, "predict": run_predict, "convert": run_convert, "upload": run_upload}
+
+
+def run_date():
+    """The acquisition date a run processes; resume state is only reused for the same date."""
+    return (datetime.date.today() - datetime.timedelta(days=int(os.environ.get("DAYBEFORE", 2)))).isoformat()
+
+
+def load_run_state(path=RUN_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_run_state(state, path=RUN_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+
+def run_stages(clients, skip=(), start_at=None, resume=False):
+    """
+    Run the stages in order in this process. A stage only runs when every
+    stage it needs has succeeded or was skipped; after a failure the stages
+    depending on it are blocked instead of working on incomplete output.
+    `start_at` skips the stages before it, `resume` those that already
+    succeeded for today's date. Returns {stage: status}.
+    """
+    names = list(STAGES)
+    skip = set(skip) | (set(names[:names.index(start_at)]) if start_at else set())
+    state = load_run_state()
+    if state.get("date") != run_date():
+        state = {"date": run_date(), "stages": {}}
+    if resume:
+        skip |= {name for name, status in state["stages"].items() if status == "done"}
+
+    statuses = {}
+    for name, requires in STAGES.items():
+        blocked = [required for required in requires if statuses.get(required) not in ("done", "skipped")]
+        if name in skip:
+            statuses[name] = "skipped"
+            logging.info(f"--------------Skipping {name}--------------")
+            continue
+        if blocked:
+            statuses[name] = "blocked"
+            logging.error(f"--------------Not running {name}: {', '.join(blocked)} did not succeed--------------")
+            continue
+        logging.info(f"--------------Running {name}--------------")
+        try:
+            with metrics.stage(name):
+                STAGE_FUNCTIONS[name](clients)
+            statuses[name] = "done"
+        except Exception as e:
+            statuses[name] = "failed"
+            metrics.count("failed", stage=name)
+            logging.exception(f"Stage {name} failed: {e}")
+        state["stages"][name] = statuses[name]
+        save_run_state(state)
+    return statuses
+
+
+def run_streaming(clients):
+    """
+    Each fulfilled tile flows through all stages on its own (src/pipeline.py).
+    Returns {stage: status}; a stage is "failed" if any of its items failed.
+    """
+    from src import pipeline
+    with metrics.stage("pipeline"):
+        summary = pipeline.run_pipeline(os.environ["CONFIG_PATH"], catalog=clients.catalog, bucket=clients.bucket)
+    return {name: "failed" if summary["failed"].get(name) else "done" for name in pipeline.STAGES}
+
+
+def write_run_report(started, mode, statuses):
+    """Run report and Prometheus file from the metrics of this process (pool workers included)."""
+    report = metrics.build_report(metrics.METRICS, started, {"mode": mode, "stages_status": statuses})
+    metrics.write_report(report)
+    metrics.write_prometheus(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the marine litter workflow in one process.")
+    parser.add_argument("--skip", nargs="*", default=[], choices=list(STAGES), help="stages not to run")
+    parser.add_argument("--from", dest="start_at", choices=list(STAGES), help="start at this stage")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the stages that already succeeded for today's date")
+    args = parser.parse_args(argv)
+
+    configure_environment()
+    started = time.time()
+    clients = Clients()
+
+    mode = os.environ.get("PIPELINE_MODE", "sequential")
+    logging.info(f"--------------Starting {mode} workflow--------------")
+    try:
+        if mode == "streaming":
+            statuses = run_streaming(clients)
+        else:
+            statuses = run_stages(clients, args.skip, args.start_at, args.resume)
+    except Exception as e:
+        logging.exception(f"Workflow failed: {e}")
+        statuses = {mode: "failed"}
+    write_run_report(started, mode, statuses)
+
+    if any(status in ("failed", "blocked") for status in statuses.values()):
+        logging.error(f"--------------Workflow finished with errors: {statuses}--------------")
+        return 1
     logging.info("--------------Workflow completed successfully.--------------")
+    return 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
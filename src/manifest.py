@@ -0,0 +1,99 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from src.job_state import tile_of_path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MANIFEST_PATH = os.environ.get("MANIFEST_PATH", "images/manifest.sqlite")  # "" disables the manifest
+
+_DEFAULT = None
+
+
+def default_manifest():
+    """The process-wide manifest at MANIFEST_PATH, or None when it is disabled."""
+    global _DEFAULT
+    if _DEFAULT is None and MANIFEST_PATH:
+        _DEFAULT = Manifest(MANIFEST_PATH)
+    return _DEFAULT
+
+
+class Manifest:
+    """
+    SQLite index of the objects in the bucket (name, size, md5, crc32c,
+    tile ID, date), updated on every upload and delete. Snapshots and
+    existence checks read it instead of listing the bucket, which grows
+    with every archived day; `reconcile` syncs it with a real listing.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects (name TEXT PRIMARY KEY, size INTEGER, md5 TEXT, "
+                             "crc32c TEXT, tile_id TEXT, date TEXT, updated REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS objects_tile ON objects (tile_id, date)")
+
+    def record_upload(self, name, stat, date=None):
+        """
+        Store an object after a verified upload; `stat` as returned by a
+        storage backend, `date` the acquisition date (None if the object
+        belongs to no scene, e.g. dates.json).
+        """
+        self._insert(name, stat, date)
+
+    def _insert(self, name, stat, date):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (name, stat["size"], stat.get("md5"), stat.get("crc32c"), tile_of_path(name), date,
+                              time.time()))
+
+    def record_delete(self, name):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM objects WHERE name = ?", (name,))
+
+    def stat(self, name):
+        """The recorded {"size", "md5", "crc32c"} of an object, or None if the manifest does not know it."""
+        with self._lock:
+            row = self._db.execute("SELECT size, md5, crc32c FROM objects WHERE name = ?", (name,)).fetchone()
+        return {"size": row[0], "md5": row[1], "crc32c": row[2]} if row else None
+
+    def names(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT name FROM objects ORDER BY name")]
+
+    def objects_for_tile(self, tile_id):
+        with self._lock:
+            return [dict(zip(("name", "size", "date"), row)) for row in self._db.execute(
+                "SELECT name, size, date FROM objects WHERE tile_id = ? ORDER BY date", (tile_id,))]
+
+    def summary(self):
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        return {"objects": count, "bytes": size}
+
+    def reconcile(self, backend):
+        """
+        Make the manifest match a full listing of `backend`: add objects it
+        is missing (stat'ing each one) and drop rows for objects that are
+        gone. Returns the names added and removed.
+        """
+        listed = set(backend.names())
+        known = set(self.names())
+        added, removed = sorted(listed - known), sorted(known - listed)
+        for name in added:
+            stat = backend.stat(name)
+            if stat is not None:
+                self._insert(name, stat, None)  # acquisition date unknown for objects found by listing
+        for name in removed:
+            self.record_delete(name)
+        logging.info(f"Manifest reconciled: {len(listed)} objects listed, {len(added)} added, "
+                     f"{len(removed)} removed")
+        return added, removed
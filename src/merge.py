@@ -1,50 +1,329 @@
 #!/usr/bin/env python3
-import glob, os
+import glob, os, sys, json, math, time, logging, functools
 from osgeo import gdal
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.scheduler import MB, run_pool, worker_count
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
 # ───────── PARAMETERS ─────────────────────────────────────────────────────────
-INPUT_PATTERN = "examples_for_merging/*prediction.tif" # that's where I put my samples
-TARGET_SRS    = "EPSG:4326" # standard parameter but can be changed
-PIXEL_SIZE    = 0.0000898315
+INPUT_PATTERN = os.environ.get("MOSAIC_INPUT_PATTERN", "examples_for_merging/*prediction.tif")
+TARGET_SRS    = os.environ.get("MOSAIC_SRS", "EPSG:4326") # standard parameter but can be changed
+PIXEL_SIZE    = float(os.environ.get("MOSAIC_PIXEL_SIZE", 0.0000898315))
+REPROJ_DIR    = os.environ.get("MOSAIC_REPROJ_DIR", "reproj")
 VRT_FILENAME  = "mosaic.vrt"
-OUTPUT_TIF    = "mosaic.tif"
+OUTPUT_TIF    = os.environ.get("MOSAIC_OUTPUT", "mosaic.tif")
+MOSAIC_MODE   = os.environ.get("MOSAIC_MODE", "warp")  # "warp" (parallel GeoTIFFs) or "vrt" (warped VRTs)
+MOSAIC_WORKERS = int(os.environ["MOSAIC_WORKERS"]) if os.getenv("MOSAIC_WORKERS") else None  # optional cap
+WARP_TASK_MEMORY_MB = int(os.environ.get("WARP_TASK_MEMORY_MB", 512))
 REPROJ_COPTS  = ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=YES"]
-FINAL_COPTS   = ["TILED=YES", "COMPRESS=DEFLATE",
-                 "PREDICTOR=2", "BIGTIFF=YES", "COPY_SRC_OVERVIEWS=YES"]
-
-# 1) Reproject & resample each tile
-os.makedirs("reproj", exist_ok=True)
-reproj_files = []
-for src in glob.glob(INPUT_PATTERN):
-    dst = os.path.join("reproj", os.path.basename(src))
-    print(f"Reprojecting {src} → {dst}")
+COG_COPTS     = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES",
+                 "OVERVIEWS=AUTO", "OVERVIEW_RESAMPLING=AVERAGE", "NUM_THREADS=ALL_CPUS"]
+# Incremental mode keeps an updatable tiled GeoTIFF (a COG cannot be patched in place)
+GTIFF_COPTS   = ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "COMPRESS=DEFLATE",
+                 "PREDICTOR=2", "BIGTIFF=YES", "NUM_THREADS=ALL_CPUS"]
+MOSAIC_INCREMENTAL = os.environ.get("MOSAIC_INCREMENTAL", "0") == "1"
+OVERVIEW_MIN_SIZE  = 256  # stop adding overview levels below this many pixels
+
+
+def reprojected_path(src, reproj_dir=REPROJ_DIR, mode=MOSAIC_MODE):
+    """Where the reprojected version of a tile lives: a GeoTIFF, or a warped VRT in "vrt" mode."""
+    name = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(reproj_dir, f"{name}.{'vrt' if mode == 'vrt' else 'tif'}")
+
+
+def reproject_tile(src, reproj_dir=REPROJ_DIR, mode=MOSAIC_MODE):
+    """
+    Reproject & resample one tile to TARGET_SRS/PIXEL_SIZE unless an up-to-date
+    result already exists; return (path, reprocessed).
+    """
+    dst = reprojected_path(src, reproj_dir, mode)
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        return dst, False
+
+    temp = f"{dst}.{os.getpid()}.tmp"
     gdal.Warp(
-        dst, src,
-        format="GTiff",
+        temp, os.path.abspath(src),  # a warped VRT refers to its source, so keep the path absolute
+        format="VRT" if mode == "vrt" else "GTiff",
         dstSRS=TARGET_SRS,
         xRes=PIXEL_SIZE, yRes=PIXEL_SIZE,
         resampleAlg="bilinear",
-        creationOptions=REPROJ_COPTS
+        creationOptions=[] if mode == "vrt" else REPROJ_COPTS
+    )
+    os.replace(temp, dst)
+    return dst, True
+
+
+def build_vrt(vrt_filename, reproj_files):
+    """Build the mosaic VRT (with explicit xRes/yRes + tap) over the reprojected tiles."""
+    vrt_opts = gdal.BuildVRTOptions(
+        xRes                 = PIXEL_SIZE,      # required for targetAlignedPixels
+        yRes                 = PIXEL_SIZE,
+        resampleAlg          = "bilinear",
+        targetAlignedPixels  = True,
+        addAlpha             = True,
+        VRTNodata            = "0 0 0"
     )
-    reproj_files.append(dst)
-
-# 2) Build the VRT (now with explicit xRes/yRes + tap)
-print(f"Building VRT: {VRT_FILENAME}")
-vrt_opts = gdal.BuildVRTOptions(
-    xRes                 = PIXEL_SIZE,      # required for targetAlignedPixels
-    yRes                 = PIXEL_SIZE,
-    resampleAlg          = "bilinear",      
-    targetAlignedPixels  = True,            
-    addAlpha             = True,            
-    VRTNodata            = "0 0 0"         
-)
-gdal.BuildVRT(VRT_FILENAME, reproj_files, options=vrt_opts)
-
-# 3) Translate VRT to the final GeoTIFF
-print(f"Translating VRT → {OUTPUT_TIF}")
-gdal.Translate(
-    OUTPUT_TIF, VRT_FILENAME,
-    creationOptions=FINAL_COPTS
-)
-
-print("Done! Your seamless mosaic is:", OUTPUT_TIF)
+    gdal.BuildVRT(vrt_filename, reproj_files, options=vrt_opts)
+
+
+def overview_levels(width, height):
+    """Power-of-two overview factors down to about OVERVIEW_MIN_SIZE pixels."""
+    levels, factor = [], 2
+    while max(width, height) / factor >= OVERVIEW_MIN_SIZE:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def write_cog(output_tif, vrt_filename, output_format="COG"):
+    """
+    Translate the VRT into a Cloud-Optimized GeoTIFF with internal overviews
+    in one pass, or into a tiled GeoTIFF with internal overviews that
+    update_mosaic can patch ("GTiff").
+    """
+    temp = f"{output_tif}.tmp"
+    if output_format == "COG":
+        gdal.Translate(temp, vrt_filename, format="COG", creationOptions=COG_COPTS)
+    else:
+        gdal.Translate(temp, vrt_filename, format="GTiff", creationOptions=GTIFF_COPTS)
+        ds = gdal.Open(temp, gdal.GA_Update)
+        ds.BuildOverviews("AVERAGE", overview_levels(ds.RasterXSize, ds.RasterYSize))
+        ds = None
+    os.replace(temp, output_tif)
+
+
+def build_mosaic(input_files=None, output_tif=OUTPUT_TIF, reproj_dir=REPROJ_DIR, mode=MOSAIC_MODE,
+                 max_workers=MOSAIC_WORKERS, output_format="COG"):
+    """
+    Mosaic prediction tiles into one COG and return timing per stage.
+
+    Tiles are reprojected in parallel processes into reproj_dir ("warp") or
+    described as warped VRTs that GDAL resolves while writing the COG
+    ("vrt", no intermediate rasters). Reprojected tiles are kept and reused
+    while they are newer than their source, so adding a tile only warps that
+    tile before the mosaic VRT and COG are rebuilt.
+    """
+    if input_files is None:
+        input_files = sorted(glob.glob(INPUT_PATTERN))
+    if not input_files:
+        raise ValueError(f"No tiles to mosaic (pattern {INPUT_PATTERN})")
+    os.makedirs(reproj_dir, exist_ok=True)
+    timings = {"tiles": len(input_files), "mode": mode}
+
+    # 1) Reproject & resample each tile
+    start = time.time()
+    if mode == "vrt":
+        results = {src: reproject_tile(src, reproj_dir, mode) for src in input_files}
+    else:
+        workers = min(worker_count(WARP_TASK_MEMORY_MB * MB, max_workers, label="reprojection"), len(input_files))
+        results = run_pool(functools.partial(reproject_tile, reproj_dir=reproj_dir, mode=mode), input_files, workers,
+                           label="tiles")
+    failed = [src for src, result in results.items() if result is None]
+    if failed:
+        raise RuntimeError(f"Reprojection failed for {len(failed)} tiles: {failed}")
+    reproj_files = [results[src][0] for src in input_files]
+    timings["reprojected"] = sum(reprocessed for _, reprocessed in results.values())
+    timings["reproject_seconds"] = time.time() - start
+
+    # 2) Build the VRT
+    start = time.time()
+    vrt_filename = os.path.join(reproj_dir, VRT_FILENAME)
+    build_vrt(vrt_filename, reproj_files)
+    timings["vrt_seconds"] = time.time() - start
+
+    # 3) Write the COG with overviews
+    start = time.time()
+    write_cog(output_tif, vrt_filename, output_format)
+    timings["cog_seconds"] = time.time() - start
+
+    logging.info(f"Mosaic {output_tif}: {timings['reprojected']} of {timings['tiles']} tiles reprojected; "
+                 f"reproject {timings['reproject_seconds']:.1f}s, vrt {timings['vrt_seconds']:.1f}s, "
+                 f"cog {timings['cog_seconds']:.1f}s")
+    return timings
+
+
+def state_path(output_tif):
+    """Sidecar recording which tiles (and their mtimes) the mosaic contains."""
+    return f"{output_tif}.json"
+
+
+def load_state(output_tif):
+    try:
+        with open(state_path(output_tif)) as f:
+            return json.load(f)["tiles"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_state(output_tif, input_files):
+    temp = f"{state_path(output_tif)}.tmp"
+    with open(temp, "w") as f:
+        json.dump({"tiles": {os.path.abspath(src): os.path.getmtime(src) for src in input_files}}, f, indent=4)
+    os.replace(temp, state_path(output_tif))
+
+
+def tile_window(mosaic, reproj_file):
+    """
+    Pixel window (xoff, yoff, xsize, ysize) of the mosaic covered by a
+    reprojected tile, snapped outwards to the mosaic grid; None if the tile
+    reaches beyond the mosaic's extent.
+    """
+    x0, dx, _, y0, _, dy = mosaic.GetGeoTransform()
+    tile = gdal.Open(reproj_file)
+    tx0, tdx, _, ty0, _, tdy = tile.GetGeoTransform()
+    tx1, ty1 = tx0 + tdx * tile.RasterXSize, ty0 + tdy * tile.RasterYSize
+    col_start, col_end = math.floor((tx0 - x0) / dx), math.ceil((tx1 - x0) / dx)
+    row_start, row_end = math.floor((ty0 - y0) / dy), math.ceil((ty1 - y0) / dy)
+    if col_start < 0 or row_start < 0 or col_end > mosaic.RasterXSize or row_end > mosaic.RasterYSize:
+        return None
+    return col_start, row_start, col_end - col_start, row_end - row_start
+
+
+def union_window(first, second):
+    """Smallest window (xoff, yoff, xsize, ysize) containing both windows; either may be None."""
+    if first is None or second is None:
+        return first or second
+    x0, y0 = min(first[0], second[0]), min(first[1], second[1])
+    x1 = max(first[0] + first[2], second[0] + second[2])
+    y1 = max(first[1] + first[3], second[1] + second[3])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def patch_window(mosaic, vrt, window):
+    """
+    Copy `window` of the mosaic VRT (value band and alpha) into the mosaic.
+    The VRT composites every tile in its order, so the window ends up as a
+    full rebuild would write it: overlaps keep the tile that comes last and
+    pixels no tile covers any more become nodata. Both grids are snapped to
+    PIXEL_SIZE (targetAlignedPixels), so they differ by whole pixels only.
+    """
+    xoff, yoff, xsize, ysize = window
+    x0, dx, _, y0, _, dy = mosaic.GetGeoTransform()
+    vx0, _, _, vy0, _, _ = vrt.GetGeoTransform()
+    shift_x, shift_y = round((x0 - vx0) / dx), round((y0 - vy0) / dy)
+    # Part of the window inside the VRT; the rest lies beyond every tile
+    cx0, cy0 = max(xoff + shift_x, 0), max(yoff + shift_y, 0)
+    cx1 = min(xoff + xsize + shift_x, vrt.RasterXSize)
+    cy1 = min(yoff + ysize + shift_y, vrt.RasterYSize)
+    for number in range(1, mosaic.RasterCount + 1):
+        band = mosaic.GetRasterBand(number)
+        values = band.ReadAsArray(xoff, yoff, xsize, ysize)
+        values[:] = 0  # nodata wherever the window reaches beyond the VRT
+        if cx1 > cx0 and cy1 > cy0:
+            values[cy0 - shift_y - yoff:cy1 - shift_y - yoff, cx0 - shift_x - xoff:cx1 - shift_x - xoff] = \
+                vrt.GetRasterBand(number).ReadAsArray(cx0, cy0, cx1 - cx0, cy1 - cy0)
+        band.WriteArray(values, xoff, yoff)
+
+
+def refresh_overviews(mosaic, full_res, window):
+    """
+    Recompute only the overview pixels that cover `window`, averaging the
+    full-resolution data read through `full_res` (the mosaic opened with
+    OVERVIEW_LEVEL=NONE, so GDAL cannot answer from the stale overviews).
+    """
+    xoff, yoff, xsize, ysize = window
+    for number in range(1, mosaic.RasterCount + 1):
+        band = mosaic.GetRasterBand(number)
+        source = full_res.GetRasterBand(number)
+        for level in range(band.GetOverviewCount()):
+            overview = band.GetOverview(level)
+            fx, fy = band.XSize / overview.XSize, band.YSize / overview.YSize
+            ox0, oy0 = math.floor(xoff / fx), math.floor(yoff / fy)
+            ox1 = min(math.ceil((xoff + xsize) / fx), overview.XSize)
+            oy1 = min(math.ceil((yoff + ysize) / fy), overview.YSize)
+            bx0, by0 = int(ox0 * fx), int(oy0 * fy)
+            bx1, by1 = min(math.ceil(ox1 * fx), band.XSize), min(math.ceil(oy1 * fy), band.YSize)
+            data = source.ReadAsArray(bx0, by0, bx1 - bx0, by1 - by0, buf_xsize=ox1 - ox0, buf_ysize=oy1 - oy0,
+                                    resample_alg=gdal.GRIORA_Average)
+            overview.WriteArray(data, ox0, oy0)
+
+
+def update_mosaic(input_files=None, output_tif=OUTPUT_TIF, reproj_dir=REPROJ_DIR, mode=MOSAIC_MODE,
+                  max_workers=MOSAIC_WORKERS):
+    """
+    Add new or changed prediction tiles to an existing mosaic in place.
+
+    Only tiles missing from the mosaic's sidecar state (or modified since)
+    are reprojected. The mosaic VRT is rebuilt over all tiles (metadata
+    only) and copied into the windows the changed tiles cover now or
+    covered before, so overlaps follow the VRT order and pixels a tile no
+    longer covers are cleared; only the overview pixels above those windows
+    are recomputed, so the cost follows the new data, not the archive. Falls
+    back to a full build_mosaic when there is no mosaic yet, a tile was
+    removed, or a new tile lies outside the current extent.
+    """
+    if input_files is None:
+        input_files = sorted(glob.glob(INPUT_PATTERN))
+    state = load_state(output_tif)
+    current = {os.path.abspath(src): src for src in input_files}
+
+    reason = None
+    if state is None or not os.path.exists(output_tif):
+        reason = "no existing mosaic"
+    elif set(state) - set(current):
+        reason = f"{len(set(state) - set(current))} tiles were removed"
+    if reason is None:
+        changed = [src for path, src in current.items()
+                   if path not in state or os.path.getmtime(src) > state[path]]
+        if not changed:
+            logging.info(f"Mosaic {output_tif} is up to date")
+            return {"tiles": len(input_files), "patched": 0}
+
+        timings = {"tiles": len(input_files), "patched": len(changed)}
+        start = time.time()
+        os.makedirs(reproj_dir, exist_ok=True)
+        mosaic = gdal.Open(output_tif, gdal.GA_Update)
+        # Where the changed tiles were, before their reprojected files are replaced
+        old_windows = [tile_window(mosaic, reprojected_path(src, reproj_dir, mode))
+                       if os.path.exists(reprojected_path(src, reproj_dir, mode)) else None for src in changed]
+        new_windows = [tile_window(mosaic, reproject_tile(src, reproj_dir, mode)[0]) for src in changed]
+        # Unchanged tiles reuse their reprojected files; they are needed where tiles overlap
+        reproj_files = [reproject_tile(src, reproj_dir, mode)[0] for src in input_files]
+        timings["reproject_seconds"] = time.time() - start
+
+        if any(window is None for window in new_windows):
+            reason = "a new tile lies outside the mosaic extent"
+            mosaic = None
+        else:
+            windows = [union_window(old, new) for old, new in zip(old_windows, new_windows)]
+
+    if reason is not None:
+        logging.info(f"Rebuilding {output_tif}: {reason}")
+        timings = build_mosaic(input_files, output_tif, reproj_dir, mode, max_workers, output_format="GTiff")
+        save_state(output_tif, input_files)
+        return timings
+
+    start = time.time()
+    vrt_filename = os.path.join(reproj_dir, VRT_FILENAME)
+    build_vrt(vrt_filename, reproj_files)
+    vrt = gdal.Open(vrt_filename)
+    for window in windows:
+        patch_window(mosaic, vrt, window)
+    vrt = None
+    timings["patch_seconds"] = time.time() - start
+
+    start = time.time()
+    mosaic.FlushCache()  # the full-resolution handle must see the patched pixels
+    full_res = gdal.OpenEx(output_tif, gdal.OF_RASTER, open_options=["OVERVIEW_LEVEL=NONE"])
+    for window in windows:
+        refresh_overviews(mosaic, full_res, window)
+    full_res = None
+    mosaic.FlushCache()
+    mosaic = None
+    timings["overview_seconds"] = time.time() - start
+
+    save_state(output_tif, input_files)
+    logging.info(f"Mosaic {output_tif}: patched {len(changed)} of {len(input_files)} tiles; "
+                 f"reproject {timings['reproject_seconds']:.1f}s, patch {timings['patch_seconds']:.1f}s, "
+                 f"overviews {timings['overview_seconds']:.1f}s")
+    return timings
+
+
+if __name__ == "__main__":
+    if MOSAIC_INCREMENTAL:
+        update_mosaic()
+    else:
+        build_mosaic()
+    print("Done! Your seamless mosaic is:", OUTPUT_TIF)
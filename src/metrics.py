@@ -0,0 +1,271 @@
+"""
+Lightweight run instrumentation shared by all stages.
+
+    with metrics.stage("merge"):
+        ...
+        metrics.count("pixels", width * height * bands)
+        metrics.observe("tile_seconds", seconds)
+
+Counters and latencies are kept per stage together with wall time and peak
+RSS, sampled while the stage runs (not the process's lifetime high-water
+mark, which would carry an earlier stage's peak into every later one). Process pool workers hand theirs back with each task result (see
+scheduler.run_pool), and main.main turns them into one JSON run report and
+a Prometheus textfile. Stage scripts started on their own dump their
+numbers to METRICS_DIR when they exit, for load_dumps to merge.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import resource
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+METRICS_DIR = os.environ.get("METRICS_DIR")                      # per-process dumps of this run
+PROMETHEUS_TEXTFILE_DIR = os.environ.get("PROMETHEUS_TEXTFILE_DIR")  # node exporter textfile collector
+REPORT_DIR = os.environ.get("REPORT_DIR", "images/reports")
+METRICS_RSS_INTERVAL = float(os.environ.get("METRICS_RSS_INTERVAL", 0.2))  # seconds between RSS samples
+METRIC_PREFIX = "marine_litter"
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its reaped children in MB (Linux reports KB)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def current_rss_mb():
+    """Resident memory of this process right now in MB, from /proc/self/statm (peak_rss_mb elsewhere)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+class RssSampler:
+    """
+    Context manager recording the highest RSS of this process while it is
+    open, sampled every `interval` seconds by a daemon thread and once at
+    each end. Spikes shorter than the interval can be missed.
+    """
+
+    def __init__(self, interval=METRICS_RSS_INTERVAL):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        self.peak = max(self.peak, current_rss_mb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def summarize(values):
+    """count/sum/mean/p50/p95/max of a list of latencies."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "sum": round(sum(ordered), 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class Metrics:
+    """Per-stage timers, counters, latency samples and peak RSS of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"seconds": 0.0, "peak_rss_mb": 0.0, "counters": {}, "samples": {}})
+
+    @property
+    def current(self):
+        return getattr(self._local, "stage", None) or os.environ.get("METRICS_STAGE", "main")
+
+    def stage(self, name, log=True):
+        """Context manager timing a stage; counters recorded inside it (on this thread) belong to it."""
+        return _StageTimer(self, name, log)
+
+    def count(self, name, value=1, stage=None):
+        with self._lock:
+            counters = self._stage(stage or self.current)["counters"]
+            counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, seconds, stage=None):
+        with self._lock:
+            self._stage(stage or self.current)["samples"].setdefault(name, []).append(seconds)
+
+    def snapshot(self):
+        """Copy of all stages, e.g. to return from a pool worker."""
+        with self._lock:
+            return json.loads(json.dumps(self.stages))
+
+    def merge(self, stages, into=None):
+        """
+        Add another process's stages. With `into`, everything is booked on
+        that stage (pool workers do not know which stage called them).
+        Stage wall times are not added up but the longest one is kept:
+        main.py times the same stage its subprocess times.
+        """
+        with self._lock:
+            for name, data in stages.items():
+                target = self._stage(into or name)
+                if into is None:
+                    target["seconds"] = max(target["seconds"], data["seconds"])
+                target["peak_rss_mb"] = max(target["peak_rss_mb"], data["peak_rss_mb"])
+                for key, value in data["counters"].items():
+                    target["counters"][key] = target["counters"].get(key, 0) + value
+                for key, values in data["samples"].items():
+                    target["samples"].setdefault(key, []).extend(values)
+
+    def dump(self, directory=METRICS_DIR):
+        """Write this process's stages to directory/<pid>.json (no-op without a directory)."""
+        if not directory or not self.stages:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        stages = self.snapshot()
+        for data in stages.values():
+            if not data["peak_rss_mb"]:
+                # Recorded outside any stage timer: a stage script's whole process is that stage
+                data["peak_rss_mb"] = peak_rss_mb()
+        with open(path, "w") as f:
+            json.dump(stages, f)
+        return path
+
+
+class _StageTimer:
+    def __init__(self, metrics, name, log=True):
+        self.metrics = metrics
+        self.name = name
+        self.log = log
+
+    def __enter__(self):
+        self.previous = getattr(self.metrics._local, "stage", None)
+        self.metrics._local.stage = self.name
+        self.rss = RssSampler().__enter__()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.time() - self.start
+        self.rss.__exit__(*exc)
+        with self.metrics._lock:
+            data = self.metrics._stage(self.name)
+            data["seconds"] += seconds
+            data["peak_rss_mb"] = max(data["peak_rss_mb"], self.rss.peak)
+        self.metrics._local.stage = self.previous
+        if self.log:
+            logging.info(f"Stage {self.name} took {seconds:.1f}s (peak RSS {self.rss.peak:.0f} MB)")
+        return False
+
+
+METRICS = Metrics()
+stage = METRICS.stage
+count = METRICS.count
+observe = METRICS.observe
+atexit.register(METRICS.dump)
+
+
+def load_dumps(directory):
+    """Merge every per-process dump in directory into one Metrics."""
+    merged = Metrics()
+    for file_name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if file_name.endswith(".json"):
+            with open(os.path.join(directory, file_name)) as f:
+                merged.merge(json.load(f))
+    return merged
+
+
+def build_report(metrics, started, extra=None):
+    """JSON-serialisable run report: wall time plus per-stage seconds, peak RSS, counters and latencies."""
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "seconds": round(time.time() - started, 1),
+        "stages": {},
+    }
+    for name, data in metrics.stages.items():
+        report["stages"][name] = {
+            "seconds": round(data["seconds"], 2),
+            "peak_rss_mb": round(data["peak_rss_mb"], 1),
+            "counters": data["counters"],
+            "latency": {key: summarize(values) for key, values in data["samples"].items()},
+        }
+    report.update(extra or {})
+    return report
+
+
+def write_report(report, report_dir=REPORT_DIR):
+    """Write the run report to REPORT_DIR/run_<timestamp>.json."""
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"run_{report['started'].replace(':', '-')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    logging.info(f"Run report written to {path}")
+    return path
+
+
+def prometheus_text(report):
+    """The run report in the Prometheus text exposition format."""
+    lines = [f"# TYPE {METRIC_PREFIX}_run_seconds gauge",
+             f"{METRIC_PREFIX}_run_seconds {report['seconds']}",
+             f"# TYPE {METRIC_PREFIX}_run_timestamp_seconds gauge",
+             f"{METRIC_PREFIX}_run_timestamp_seconds {int(time.time())}"]
+    for name, data in report["stages"].items():
+        label = f'stage="{name}"'
+        lines.append(f"{METRIC_PREFIX}_stage_seconds{{{label}}} {data['seconds']}")
+        lines.append(f"{METRIC_PREFIX}_stage_peak_rss_bytes{{{label}}} {int(data['peak_rss_mb'] * 1024 * 1024)}")
+        for key, value in data["counters"].items():
+            lines.append(f"{METRIC_PREFIX}_{key}_total{{{label}}} {value}")
+        for key, summary in data["latency"].items():
+            if summary["count"]:
+                lines.append(f"{METRIC_PREFIX}_{key}_count{{{label}}} {summary['count']}")
+                lines.append(f"{METRIC_PREFIX}_{key}_sum{{{label}}} {summary['sum']}")
+                for quantile in ("p50", "p95"):
+                    lines.append(f'{METRIC_PREFIX}_{key}{{{label},quantile="0.{quantile[1:]}"}} {summary[quantile]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(report, directory=PROMETHEUS_TEXTFILE_DIR):
+    """Atomically write marine_litter.prom for the node exporter's textfile collector."""
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{METRIC_PREFIX}.prom")
+    with open(f"{path}.tmp", "w") as f:
+        f.write(prometheus_text(report))
+    os.replace(f"{path}.tmp", path)
+    logging.info(f"Prometheus metrics written to {path}")
+    return path
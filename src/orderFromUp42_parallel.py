@@ -8,7 +8,13 @@ from datetime import date, timedelta
 
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from src.zip_processing import process_zip
+from src.zip_processing import merge_params, process_all, read_tile_id
+from src.tile_cache import default_cache
+from src.order_tracker import OrderTracker
+from src.downloader import DOWNLOAD_WORKERS, asset_filename, download_file, job_for_asset
+from src.aoi import AoiIndex, load_features
+from src.job_state import default_job_store, tile_of_path
+from src import metrics, order_planner
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -17,42 +23,62 @@ CONFIG_PATH   = os.getenv("CONFIG_PATH")
 INPUT_PATH    = os.getenv("INPUT_PATH")
 UP42_CRED_PATH= os.getenv("UP42_CRED_PATH")
 ORDER_WORKERS = int(os.environ.get("ORDER_WORKERS", 3))
-
-
-def process_order(image_id: str, geometry: dict, input_path: str, catalog) -> dict:
+ORDER_POLL_SECONDS = int(os.environ.get("ORDER_POLL_SECONDS", 60))
+ORDER_TRACKING = os.environ.get("ORDER_TRACKING", "async")  # "async" (one event loop) or "threads"
+SEARCH_LIMIT  = int(os.environ.get("SEARCH_LIMIT", 500))  # results per AOI search; the planner picks from all of them
+
+# AOIs of this run and the scenes/tiles serving them; set by download_from_up42
+AOI_INDEX = None
+
+
+def place_order(image_id: str, geometry: dict, catalog):
+    """Build and place an order for one image and return the order object."""
+    order_params = catalog.construct_order_parameters(
+        data_product_id=PRODUCT_ID,
+        image_id=image_id,
+        aoi=geometry,
+    )
+    order = catalog.place_order(order_params)
+    logging.info(f"Order {order.order_id} placed for image {image_id}")  # old‐style attribute
+    jobs = default_job_store()
+    if jobs is not None:
+        # Recorded at once: a crash from here on must not lead to a second, paid order
+        jobs.advance(image_id, "ordered", order_id=order.order_id)
+    return order
+
+
+def resume_order(order_id: str, catalog):
+    """The order object of an order placed by an earlier run."""
+    if hasattr(catalog, "get_order"):
+        return catalog.get_order(order_id)
+    return up42.initialize_order(order_id=order_id)
+
+
+def open_order(image_id: str, geometry: dict, catalog):
+    """Re-attach to the order an earlier run placed for this image, or place a new one."""
+    jobs = default_job_store()
+    job = jobs.get(image_id) if jobs is not None else None
+    if job is not None and job["order_id"]:
+        try:
+            order = resume_order(job["order_id"], catalog)
+            metrics.count("orders_resumed")
+            logging.info(f"Resuming order {job['order_id']} for image {image_id} ({job['state']})")
+            return order
+        except Exception as e:
+            logging.warning(f"Could not resume order {job['order_id']} for {image_id}, ordering again: {e}")
+    return place_order(image_id, geometry, catalog)
+
+
+def download_assets(image_id: str, order, input_path: str, on_downloaded=None) -> dict:
     """
-    Place an order via catalog.place_order(), wait for fulfillment,
-    then download each asset via asset.file.download(...).
+    Download each asset of a fulfilled order via asset.file.download(...).
+    `on_downloaded(path)` is called for every asset as soon as it is on disk.
     """
+    order_id = order.order_id
+    jobs = default_job_store()
     try:
-        logging.info(f"Processing order for image {image_id}")
-
-        # 1) Build and place order
-        order_params = catalog.construct_order_parameters(
-            data_product_id=PRODUCT_ID,
-            image_id=image_id,
-            aoi=geometry,
-        )
-        order = catalog.place_order(order_params)
-        order_id = order.order_id  # old‐style attribute
-        logging.info(f"Order {order_id} placed for image {image_id}")
-
-        # 2) Poll until FULFILLED or FAILED
-        while order.status not in ("FULFILLED", "FAILED"):
-            time.sleep(60)
-            order.track_status(report_time=60)
-            logging.info(f"Order {order_id} status: {order.status}")
-
-        if order.status == "FAILED":
-            logging.error(f"Order {order_id} failed")
-            return {
-                "order_id": order_id,
-                "image_id": image_id,
-                "status": "FAILED",
-                "assets_processed": 0
-            }
-
-        # 3) Download assets (if any)
+        if jobs is not None:
+            jobs.advance(image_id, "fulfilled")
         assets = order.get_assets()
         logging.info(f"Order {order_id} fulfilled with {len(assets)} assets")
         if not assets:
@@ -69,23 +95,39 @@ def process_order(image_id: str, geometry: dict, input_path: str, catalog) -> di
         # Silence tqdm (if used internally)
         logging.getLogger("tqdm").setLevel(logging.ERROR)
 
-        for asset in assets:
-            try:
-                asset.file.download(input_path)
-                logging.info(f"Asset {asset.asset_id or asset.file.id} downloaded for order {order_id}")
-                assets_processed += 1
-
-            except Exception as e:
-                logging.error(f"Error downloading asset {asset.asset_id or asset.file.id} for order {order_id}: {e}")
-
-        # (Optional) If you want to process zips immediately, uncomment:
-        # for fname in os.listdir(input_path):
-        #     if fname.endswith(".zip"):
-        #         try:
-        #             process_zip(os.path.join(input_path, fname))
-        #             logging.info(f"Processed zip {fname} for order {order_id}")
-        #         except Exception as e:
-        #             logging.error(f"Error processing {fname} for order {order_id}: {e}")
+        def fetch(asset):
+            # Chunked, resumable and verified when the asset has a direct URL, SDK download otherwise
+            job = job_for_asset(asset)
+            if job is not None:
+                downloaded = download_file(job, input_path)
+            else:
+                downloaded = asset.file.download(input_path)
+                downloaded = str(downloaded or os.path.join(input_path, asset_filename(asset.file)))
+            # Remember which tile this image became so a rerun can skip ordering it
+            if downloaded.endswith(".zip"):
+                tile_id = read_tile_id(downloaded)
+                cache = default_cache()
+                if cache is not None:
+                    cache.link_image(image_id, tile_id)
+                if AOI_INDEX is not None:
+                    AOI_INDEX.link_tile(image_id, tile_id)
+                if jobs is not None:
+                    jobs.advance(image_id, "downloaded", tile_id=tile_id)
+            return downloaded
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            futures = {executor.submit(fetch, asset): asset for asset in assets}
+            for future in concurrent.futures.as_completed(futures):
+                asset = futures[future]
+                try:
+                    downloaded = future.result()
+                    logging.info(f"Asset {asset.asset_id or asset.file.id} downloaded for order {order_id}")
+                    assets_processed += 1
+                    if on_downloaded is not None:
+                        on_downloaded(downloaded)
+
+                except Exception as e:
+                    logging.error(f"Error downloading asset {asset.asset_id or asset.file.id} for order {order_id}: {e}")
 
         return {
             "order_id": order_id,
@@ -95,8 +137,9 @@ def process_order(image_id: str, geometry: dict, input_path: str, catalog) -> di
         }
 
     except Exception as e:
-        logging.error(f"Error in process_order for {image_id}: {e}")
+        logging.error(f"Error downloading order {order_id} for {image_id}: {e}")
         return {
+            "order_id": order_id,
             "image_id": image_id,
             "status": "ERROR",
             "error": str(e),
@@ -104,77 +147,309 @@ def process_order(image_id: str, geometry: dict, input_path: str, catalog) -> di
         }
 
 
-def download_from_up42(config_path):
+def process_order(image_id: str, geometry: dict, input_path: str, catalog, on_downloaded=None) -> dict:
     """
-    Authenticate → search with catalog.construct_search_parameters →
-    place orders in parallel → download assets.
+    Place an order via catalog.place_order(), wait for fulfillment,
+    then download each asset via asset.file.download(...).
+    Holds one thread per order; used with ORDER_TRACKING=threads.
     """
     try:
-        if not os.path.exists(UP42_CRED_PATH):
-            raise FileNotFoundError(f"Credentials file not found at {UP42_CRED_PATH}")
+        logging.info(f"Processing order for image {image_id}")
 
-        with open(UP42_CRED_PATH) as f:
-            creds = json.load(f)
+        # 1) Build and place order (or re-attach to the one an earlier run placed)
+        order = open_order(image_id, geometry, catalog)
+        order_id = order.order_id
 
-        up42.authenticate(username=creds["username"], password=creds["password"])
-        logging.info("Successfully authenticated with UP42")
+        # 2) Poll until FULFILLED or FAILED
+        while order.status not in ("FULFILLED", "FAILED"):
+            time.sleep(ORDER_POLL_SECONDS)
+            order.track_status(report_time=ORDER_POLL_SECONDS)
+            logging.info(f"Order {order_id} status: {order.status}")
 
-        # Load configuration (GeoJSON, product_id)
-        with open(config_path) as f:
-            config = json.load(f)
+        if order.status == "FAILED":
+            logging.error(f"Order {order_id} failed")
+            if default_job_store() is not None:
+                default_job_store().reset(image_id, f"order {order_id} failed")
+            return {
+                "order_id": order_id,
+                "image_id": image_id,
+                "status": "FAILED",
+                "assets_processed": 0
+            }
 
-        geom = config["features"][0]["geometry"]
-        geometry = {"type": geom["type"], "coordinates": geom["coordinates"]}
-        global PRODUCT_ID
-        PRODUCT_ID = config.get("product_id", "c3de9ed8-f6e5-4bb5-a157-f6430ba756da")
+        # 3) Download assets (if any)
+        return download_assets(image_id, order, input_path, on_downloaded)
 
-        date_of_interest = (date.today() - timedelta(days=DAYBEFORE)).strftime("%Y-%m-%d")
-        logging.info(f"Date of interest is: {date_of_interest}")
+    except Exception as e:
+        logging.error(f"Error in process_order for {image_id}: {e}")
+        return {
+            "image_id": image_id,
+            "status": "ERROR",
+            "error": str(e),
+            "assets_processed": 0
+        }
 
-        # Initialize the old-style catalog entry-point
-        catalog = up42.initialize_catalog()  # DeprecationWarning: but still present
 
-        # Build search parameters and run search
+def skip_cached_images(image_ids, input_path: str, on_downloaded=None) -> list:
+    """
+    Restore merged tiles of already-processed images from the tile cache into
+    input_path and return only the image IDs that still have to be ordered.
+    """
+    cache = default_cache()
+    if cache is None:
+        return list(image_ids)
+
+    remaining = []
+    os.makedirs(input_path, exist_ok=True)
+    for image_id in image_ids:
+        tile_id = cache.tile_for_image(image_id)
+        restored = tile_id and cache.get("merged", tile_id, merge_params(), os.path.join(input_path, f"{tile_id}.tif"))
+        if restored:
+            if AOI_INDEX is not None:
+                AOI_INDEX.link_tile(image_id, tile_id)
+            logging.info(f"Image {image_id} already cached as {tile_id}; not ordering it again")
+            if on_downloaded is not None:
+                on_downloaded(restored)
+        else:
+            remaining.append(image_id)
+    return remaining
+
+
+def local_files(input_path: str) -> dict:
+    """{tile_id: path} of the merged tiles and downloaded zips in input_path."""
+    files = {}
+    for file_name in sorted(os.listdir(input_path)) if os.path.isdir(input_path) else []:
+        path = os.path.join(input_path, file_name)
+        if file_name.endswith(".zip"):
+            try:
+                files.setdefault(read_tile_id(path), path)
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable archive {file_name}: {e}")
+        elif file_name.endswith(".tif") and not file_name.endswith("_prediction.tif"):
+            files[os.path.splitext(file_name)[0]] = path  # a merged tile wins over its zip
+    return files
+
+
+def skip_finished_images(image_ids, input_path: str, on_downloaded=None) -> list:
+    """
+    Leave out the images the job store knows are downloaded or further along,
+    and return those that still need their order (a new one, or the one an
+    earlier run placed). Predicted and screened-out images are finished;
+    downloaded images whose files are gone are fetched again from their
+    existing order.
+    """
+    jobs = default_job_store()
+    files = local_files(input_path)
+    remaining = []
+    for image_id in image_ids:
+        job = jobs.get(image_id)
+        if not jobs.reached(image_id, "downloaded"):
+            remaining.append(image_id)
+        elif jobs.reached(image_id, "predicted"):
+            logging.info(f"Image {image_id} is already {job['state']}; not ordering it again")
+        elif job["tile_id"] in files:
+            logging.info(f"Image {image_id} is already {job['state']} as {os.path.basename(files[job['tile_id']])}")
+            if AOI_INDEX is not None:
+                AOI_INDEX.link_tile(image_id, job["tile_id"])
+            if on_downloaded is not None:
+                on_downloaded(files[job["tile_id"]])
+        else:
+            logging.warning(f"Image {image_id} was {job['state']} but its files are gone; downloading it again")
+            remaining.append(image_id)
+    return remaining
+
+
+def search_scenes(catalog, features, date_of_interest, index):
+    """
+    Run one catalog search per AOI feature and merge the results, keeping
+    every scene once (by sceneId, or id without one). Each kept scene is
+    registered in `index` with all AOIs it serves.
+    """
+    import pandas as pd
+    frames = []
+    for feature in features:
         search_params = catalog.construct_search_parameters(
             collections=["sentinel-2"],
-            geometry=geometry,
+            geometry=feature["geometry"],
             start_date=date_of_interest,
             end_date=date_of_interest,
             max_cloudcover=100,
-            limit=10
+            limit=SEARCH_LIMIT
         )
-        search_results_df = catalog.search(search_params)
-        logging.info(f"Found {len(search_results_df)} images matching criteria")
+        results = catalog.search(search_params)
+        logging.info(f"AOI {feature['name']}: found {len(results)} images")
+        if not results.empty:
+            frames.append(results.assign(aoi=feature["name"]))
+
+    if not frames:
+        return pd.DataFrame(columns=["id"]), {}
+    results = pd.concat(frames, ignore_index=True)
+    key = "sceneId" if "sceneId" in results.columns else "id"
+    for row in results.itertuples():
+        names = [row.aoi]
+        if "geometry" in results.columns and row.geometry is not None:
+            # The footprint may also touch AOIs whose search did not return it (e.g. the limit cut it)
+            names += index.query(row.geometry)
+        index.assign(row.id, names)
+    unique = results.drop_duplicates(subset=key).drop(columns="aoi")
+    logging.info(f"{len(results)} search results across {len(features)} AOIs, "
+                 f"{len(unique)} unique scenes after deduplication by {key}")
+    # Duplicate rows may carry another id for the same scene; fold their AOIs into the kept one
+    for scene, group in results.groupby(key):
+        kept = group.iloc[0]["id"]
+        for other in group["id"].iloc[1:]:
+            index.assign(kept, index.scenes.get(other, ()))
+    return unique, {row.id: sorted(index.scenes[row.id]) for row in unique.itertuples()}
+
+
+def estimate_credits(search_results_df, catalog):
+    """Add a "credits" column with catalog.estimate_order per scene, for the planner's credit budget."""
+    credits = []
+    for row in search_results_df.itertuples():
+        try:
+            order_params = catalog.construct_order_parameters(
+                data_product_id=PRODUCT_ID, image_id=row.id, aoi=AOI_INDEX.order_geometry(row.id))
+            credits.append(float(catalog.estimate_order(order_params)))
+        except Exception as e:
+            logging.warning(f"Could not estimate credits for {row.id}: {e}")
+            credits.append(float("nan"))
+    return search_results_df.assign(credits=credits)
+
+
+def track_orders(image_ids, geometries: dict, input_path: str, catalog, on_downloaded=None) -> dict:
+    """
+    Place every order up front (or re-attach to those an earlier run placed),
+    then track all of them from one asyncio loop and download each order's
+    assets as soon as it is fulfilled.
+    `geometries` maps each image ID to the AOI it is ordered for.
+    """
+    orders = {}
+    placed = {}
+    for image_id in image_ids:
+        try:
+            orders[image_id] = open_order(image_id, geometries[image_id], catalog)
+            placed[image_id] = time.time()
+            metrics.count("orders_placed")
+        except Exception as e:
+            metrics.count("orders_failed")
+            logging.error(f"Error placing order for {image_id}: {e}")
+
+    def on_fulfilled(image_id, order):
+        # Order placement -> fulfilment, i.e. how long UP42 took for this tile
+        metrics.observe("fulfillment_seconds", time.time() - placed[image_id])
+        return download_assets(image_id, order, input_path, on_downloaded)
+
+    tracker = OrderTracker(on_fulfilled, download_workers=ORDER_WORKERS)
+    results = tracker.run(orders)
+    jobs = default_job_store()
+    if jobs is not None:
+        # Failed orders are ordered again next run; timed-out ones are resumed
+        for image_id, result in results.items():
+            if result.get("status", "").startswith("FAILED"):
+                jobs.reset(image_id, f"order {result.get('order_id')} failed")
+    return results
+
+
+def initialize_catalog():
+    """Authenticate with UP42 and return the old-style catalog entry-point."""
+    if not os.path.exists(UP42_CRED_PATH):
+        raise FileNotFoundError(f"Credentials file not found at {UP42_CRED_PATH}")
+
+    with open(UP42_CRED_PATH) as f:
+        creds = json.load(f)
+
+    up42.authenticate(username=creds["username"], password=creds["password"])
+    logging.info("Successfully authenticated with UP42")
+
+    return up42.initialize_catalog()  # DeprecationWarning: but still present
+
+
+def download_from_up42(config_path, catalog=None, on_downloaded=None, input_path=INPUT_PATH):
+    """
+    Authenticate → search with catalog.construct_search_parameters →
+    place orders in parallel → download assets.
+    A pre-built `catalog` (e.g. a fake for offline runs) skips authentication.
+    Assets are downloaded to and merged in `input_path`.
+    """
+    try:
+        # Initialize the old-style catalog entry-point
+        if catalog is None:
+            catalog = initialize_catalog()
 
-        if search_results_df.empty:
+        # Load configuration (GeoJSON, product_id)
+        with open(config_path) as f:
+            config = json.load(f)
+
+        features = load_features(config_path)
+        global PRODUCT_ID, AOI_INDEX
+        AOI_INDEX = AoiIndex(features)
+        PRODUCT_ID = config.get("product_id", "c3de9ed8-f6e5-4bb5-a157-f6430ba756da")
+
+        date_of_interest = (date.today() - timedelta(days=DAYBEFORE)).strftime("%Y-%m-%d")
+        logging.info(f"Date of interest is: {date_of_interest}")
+
+        # One search per AOI feature, merged and deduplicated
+        search_results_df, scene_aois = search_scenes(catalog, features, date_of_interest, AOI_INDEX)
+        if not len(search_results_df):
             logging.info("No images found; exiting.")
             return
-
-        # –––––––––––––––––––––––––––––––––––––––––––––––––––
-        # only keep the first 2 rows for testing:
-        search_results_df = search_results_df.head(2)
-        logging.info(f"Limiting to {len(search_results_df)} test images")
-        # –––––––––––––––––––––––––––––––––––––––––––––––––––
-
-        # Launch each process_order(...) in parallel, passing `catalog` as last arg
-        with concurrent.futures.ThreadPoolExecutor(max_workers=ORDER_WORKERS) as executor:
-            futures = [
-                executor.submit(
-                    process_order,
-                    row.id,        # image_id
-                    geometry,      # geometry
-                    INPUT_PATH,    # input_path
-                    catalog        # old-style catalog
-                )
-                for row in search_results_df.itertuples()
-            ]
-
-            for idx, future in enumerate(concurrent.futures.as_completed(futures), start=1):
-                res = future.result()
-                logging.info(f"Progress: {idx}/{len(futures)} → {res}")
+        for image_id, names in scene_aois.items():
+            logging.info(f"Image {image_id} serves AOIs {', '.join(names)}")
+
+        # Rank the scenes and keep those that fit the credit/time budget
+        if order_planner.PLAN_CREDIT_BUDGET and hasattr(catalog, "estimate_order"):
+            search_results_df = estimate_credits(search_results_df, catalog)
+        metrics.count("scenes_found", len(search_results_df))
+        search_results_df, _ = order_planner.plan_orders(search_results_df, AOI_INDEX)
+        metrics.count("scenes_planned", len(search_results_df))
+
+        image_ids = [row.id for row in search_results_df.itertuples()]
+        jobs = default_job_store()
+        if jobs is not None:
+            for image_id in image_ids:
+                jobs.advance(image_id, "searched", date=date_of_interest)
+            # Orders a crashed run already paid for are finished even if the planner would now pick other scenes,
+            # whatever day that run was for; the scenes keep their own date for the catalog
+            image_ids += [image_id for image_id in jobs.in_state("ordered", "fulfilled")
+                          if image_id not in image_ids]
+            image_ids = skip_finished_images(image_ids, input_path, on_downloaded)
+        image_ids = skip_cached_images(image_ids, input_path, on_downloaded)
+        # Order each scene for the union of the AOIs it serves
+        geometries = {image_id: AOI_INDEX.order_geometry(image_id) for image_id in image_ids}
+
+        if ORDER_TRACKING == "async":
+            results = track_orders(image_ids, geometries, input_path, catalog, on_downloaded)
+            for idx, res in enumerate(results.values(), start=1):
+                logging.info(f"Progress: {idx}/{len(results)} → {res}")
+        else:
+            # Launch each process_order(...) in parallel, passing `catalog` as last arg
+            with concurrent.futures.ThreadPoolExecutor(max_workers=ORDER_WORKERS) as executor:
+                futures = [
+                    executor.submit(
+                        process_order,
+                        image_id,      # image_id
+                        geometries[image_id],  # union of the AOIs it serves
+                        input_path,    # input_path
+                        catalog,       # old-style catalog
+                        on_downloaded  # per-asset hook for streaming runs
+                    )
+                    for image_id in image_ids
+                ]
+
+                for idx, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                    res = future.result()
+                    logging.info(f"Progress: {idx}/{len(futures)} → {res}")
 
         logging.info("All orders have been processed")
 
+        # Streaming runs merge each zip as it arrives; otherwise merge all archives in parallel now
+        if on_downloaded is None:
+            results = process_all(input_path)
+            if jobs is not None:
+                for result in results.values():
+                    if result is not None:
+                        jobs.advance_tile(tile_of_path(result["output"]), "merged")
+
     except Exception as e:
         logging.error(f"Error in download_from_up42: {e}")
         raise
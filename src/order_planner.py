@@ -0,0 +1,149 @@
+"""
+Choose which catalog scenes to order.
+
+The planner works on the plain search DataFrame (columns as returned by the
+UP42 catalog: id, sceneId, cloudCoverage, acquisitionDate, geometry), so it
+can be run on a canned DataFrame without any network access:
+
+    plan, rejected = plan_orders(df, credit_budget=200)
+"""
+import os
+import re
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PLAN_WEIGHT_CLOUD      = float(os.environ.get("PLAN_WEIGHT_CLOUD", 0.5))
+PLAN_WEIGHT_OVERLAP    = float(os.environ.get("PLAN_WEIGHT_OVERLAP", 0.3))
+PLAN_WEIGHT_RECENCY    = float(os.environ.get("PLAN_WEIGHT_RECENCY", 0.2))
+PLAN_MAX_CLOUD         = float(os.environ.get("PLAN_MAX_CLOUD", 100))          # percent
+PLAN_DUPLICATE_HOURS   = float(os.environ.get("PLAN_DUPLICATE_HOURS", 24))     # same MGRS tile within this window
+PLAN_CREDIT_BUDGET     = float(os.environ.get("PLAN_CREDIT_BUDGET", 0))        # 0 = unlimited
+PLAN_CREDITS_PER_SCENE = float(os.environ.get("PLAN_CREDITS_PER_SCENE", 0))    # used without a credits column
+PLAN_TIME_BUDGET_MINUTES = float(os.environ.get("PLAN_TIME_BUDGET_MINUTES", 0))  # 0 = unlimited
+PLAN_MINUTES_PER_SCENE = float(os.environ.get("PLAN_MINUTES_PER_SCENE", 10))   # order, download, merge, predict
+
+MGRS_PATTERN = re.compile(r"_T(\d{2}[A-Z]{3})_")
+
+
+def mgrs_tile(scene_id):
+    """MGRS tile (e.g. 33TUL) from a Sentinel-2 product name, or None."""
+    match = MGRS_PATTERN.search(str(scene_id or ""))
+    return match.group(1) if match else None
+
+
+def aoi_overlap(row, index):
+    """Share of the AOIs a scene serves that its footprint covers (1.0 without footprint or index)."""
+    if index is None or getattr(row, "geometry", None) is None:
+        return 1.0
+    from src.aoi import to_ogr
+    names = index.scenes.get(row.id) or index.query(row.geometry)
+    if not names:
+        return 0.0
+    area = None
+    for name in names:
+        geometry = index.geometries[name]
+        area = geometry.Clone() if area is None else area.Union(geometry)
+    total = area.GetArea()
+    return min(area.Intersection(to_ogr(row.geometry)).GetArea() / total, 1.0) if total else 0.0
+
+
+def score_scenes(df, index=None):
+    """Copy of df with cloud, overlap, mgrs, acquired and score columns; highest score first."""
+    import pandas as pd
+    scored = df.copy()
+    cloud = scored["cloudCoverage"] if "cloudCoverage" in scored.columns else pd.Series(0.0, index=scored.index)
+    scored["cloud"] = pd.to_numeric(cloud, errors="coerce").fillna(100.0).clip(0, 100)
+    scored["overlap"] = [aoi_overlap(row, index) for row in scored.itertuples()]
+    scene_ids = scored["sceneId"] if "sceneId" in scored.columns else scored["id"]
+    scored["mgrs"] = [mgrs_tile(scene_id) for scene_id in scene_ids]
+    if "acquisitionDate" in scored.columns:
+        scored["acquired"] = pd.to_datetime(scored["acquisitionDate"], utc=True, errors="coerce")
+    else:
+        scored["acquired"] = pd.NaT
+
+    # Newest acquisition scores 1, the oldest in this result set 0
+    acquired = scored["acquired"]
+    span = (acquired.max() - acquired.min()).total_seconds() if acquired.notna().any() else 0
+    if span > 0:
+        recency = (acquired - acquired.min()).dt.total_seconds() / span
+    else:
+        recency = pd.Series(1.0, index=scored.index)
+    scored["score"] = (PLAN_WEIGHT_CLOUD * (1 - scored["cloud"] / 100)
+                       + PLAN_WEIGHT_OVERLAP * scored["overlap"]
+                       + PLAN_WEIGHT_RECENCY * recency.fillna(0.0))
+    return scored.sort_values(["score", "cloud"], ascending=[False, True], kind="stable")
+
+
+def plan_orders(df, index=None, credit_budget=PLAN_CREDIT_BUDGET, time_budget_minutes=PLAN_TIME_BUDGET_MINUTES,
+                max_cloud=PLAN_MAX_CLOUD, duplicate_hours=PLAN_DUPLICATE_HOURS):
+    """
+    Rank the search results and pick the scenes to order.
+
+    Scenes above max_cloud are rejected, then of several acquisitions of the
+    same MGRS tile within duplicate_hours only the best one is kept, and the
+    remaining scenes are accepted best first while they fit the credit and
+    time budgets. Credits come from a "credits" column when present (e.g.
+    from catalog.estimate_order), PLAN_CREDITS_PER_SCENE otherwise; with a
+    credit budget, scenes whose price is still unknown are rejected.
+
+    Returns (plan, rejected): the accepted rows in priority order and a list
+    of {"id", "reason"} dicts.
+    """
+    scored = score_scenes(df, index)
+    accepted, rejected = [], []
+    kept_tiles = {}
+    credits_used = minutes_used = 0.0
+
+    for label, row in scored.iterrows():
+        scene = row["id"]
+        if row["cloud"] > max_cloud:
+            rejected.append({"id": scene, "reason": f"cloud cover {row['cloud']:.0f}% > {max_cloud:.0f}%"})
+            continue
+
+        duplicate = None
+        for other in kept_tiles.get(row["mgrs"], []) if row["mgrs"] else []:
+            hours = abs((row["acquired"] - other["acquired"]).total_seconds()) / 3600
+            if hours != hours or hours <= duplicate_hours:  # NaN (unknown dates) counts as duplicate
+                duplicate = other
+                break
+        if duplicate is not None:
+            rejected.append({"id": scene, "reason": f"near-duplicate of {duplicate['id']} (MGRS {row['mgrs']})"})
+            continue
+
+        estimated = "credits" in row and row["credits"] == row["credits"]  # NaN: the estimate failed
+        credits = float(row["credits"]) if estimated else PLAN_CREDITS_PER_SCENE
+        if credit_budget and not estimated and not PLAN_CREDITS_PER_SCENE:
+            # An unknown price must not count as free against the budget
+            rejected.append({"id": scene, "reason": "credits unknown (no estimate and PLAN_CREDITS_PER_SCENE is 0)"})
+            continue
+        if credit_budget and credits_used + credits > credit_budget:
+            rejected.append({"id": scene, "reason": f"credit budget: {credits_used + credits:.0f} > {credit_budget:.0f}"})
+            continue
+        if time_budget_minutes and minutes_used + PLAN_MINUTES_PER_SCENE > time_budget_minutes:
+            rejected.append({"id": scene, "reason": f"time budget: {minutes_used + PLAN_MINUTES_PER_SCENE:.0f} "
+                                                    f"> {time_budget_minutes:.0f} min"})
+            continue
+
+        credits_used += credits
+        minutes_used += PLAN_MINUTES_PER_SCENE
+        accepted.append(label)
+        if row["mgrs"]:
+            kept_tiles.setdefault(row["mgrs"], []).append(row)
+
+    plan = scored.loc[accepted]
+    log_plan(plan, rejected, credits_used, minutes_used)
+    return plan, rejected
+
+
+def log_plan(plan, rejected, credits_used=0.0, minutes_used=0.0):
+    """Log every accepted scene with its score and every rejection with its reason."""
+    logging.info(f"Order plan: {len(plan)} scenes accepted, {len(rejected)} rejected, "
+                 f"{credits_used:.0f} credits, ~{minutes_used:.0f} min")
+    for rank, row in enumerate(plan.itertuples(), start=1):
+        logging.info(f"  {rank}. {row.id} score={row.score:.3f} cloud={row.cloud:.0f}% "
+                     f"overlap={row.overlap:.2f} mgrs={row.mgrs}")
+    for rejection in rejected:
+        logging.info(f"  rejected {rejection['id']}: {rejection['reason']}")
+
@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+import logging
+import concurrent.futures
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+ORDER_POLL_MIN_SECONDS = float(os.environ.get("ORDER_POLL_MIN_SECONDS", 15))
+ORDER_POLL_MAX_SECONDS = float(os.environ.get("ORDER_POLL_MAX_SECONDS", 300))
+ORDER_POLL_BACKOFF     = float(os.environ.get("ORDER_POLL_BACKOFF", 1.5))
+ORDER_TIMEOUT_SECONDS  = float(os.environ.get("ORDER_TIMEOUT_SECONDS", 6 * 3600))
+STATUS_WORKERS         = int(os.environ.get("STATUS_WORKERS", 4))    # concurrent status requests, not orders
+ORDER_WORKERS          = int(os.environ.get("ORDER_WORKERS", 3))     # fulfilled orders downloading at once
+
+FINAL_STATUSES = ("FULFILLED", "FAILED", "FAILED_PERMANENTLY")
+
+
+class OrderTracker:
+    """
+    Track any number of placed UP42 orders from a single asyncio event loop.
+
+    Each order is a coroutine that polls `order.status` with its own adaptive
+    interval: it starts at `min_interval`, grows by `backoff` while the status
+    stays the same and snaps back when it changes. Blocking SDK calls run on a
+    small fixed thread pool, so pending orders cost no threads. As soon as an
+    order is FULFILLED, `on_fulfilled(image_id, order)` is run on the download
+    pool and its return value becomes the order's result.
+    """
+
+    def __init__(self, on_fulfilled, min_interval=ORDER_POLL_MIN_SECONDS, max_interval=ORDER_POLL_MAX_SECONDS,
+                 backoff=ORDER_POLL_BACKOFF, timeout=ORDER_TIMEOUT_SECONDS,
+                 status_workers=STATUS_WORKERS, download_workers=ORDER_WORKERS):
+        self.on_fulfilled = on_fulfilled
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.status_workers = status_workers
+        self.download_workers = download_workers
+
+    def run(self, orders):
+        """Track {image_id: order} until every order is final; return {image_id: result}."""
+        return asyncio.run(self._run(orders))
+
+    async def _run(self, orders):
+        status_pool = concurrent.futures.ThreadPoolExecutor(self.status_workers, thread_name_prefix="order-status")
+        download_pool = concurrent.futures.ThreadPoolExecutor(self.download_workers, thread_name_prefix="order-download")
+        try:
+            logging.info(f"Tracking {len(orders)} orders from one event loop")
+            results = await asyncio.gather(*(
+                self._track(image_id, order, status_pool, download_pool) for image_id, order in orders.items()
+            ))
+            return dict(zip(orders, results))
+        finally:
+            status_pool.shutdown()
+            download_pool.shutdown()
+
+    async def _track(self, image_id, order, status_pool, download_pool):
+        loop = asyncio.get_running_loop()
+        order_id = order.order_id
+        started = time.monotonic()
+        interval = self.min_interval
+        last_status = None
+        polls = 0
+
+        while True:
+            try:
+                status = await loop.run_in_executor(status_pool, lambda: order.status)
+                polls += 1
+            except Exception as e:
+                logging.warning(f"Order {order_id}: status request failed ({e}); retrying in {interval:.0f}s")
+                status = last_status
+
+            if status != last_status:
+                logging.info(f"Order {order_id} status: {status}")
+                last_status = status
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+
+            if status == "FULFILLED":
+                waited = time.monotonic() - started
+                logging.info(f"Order {order_id} fulfilled after {waited:.0f}s and {polls} polls; downloading")
+                return await loop.run_in_executor(download_pool, self.on_fulfilled, image_id, order)
+
+            if status in FINAL_STATUSES:
+                logging.error(f"Order {order_id} failed")
+                return {"order_id": order_id, "image_id": image_id, "status": "FAILED", "assets_processed": 0}
+
+            if time.monotonic() - started > self.timeout:
+                logging.error(f"Order {order_id} not fulfilled after {self.timeout:.0f}s; giving up")
+                return {"order_id": order_id, "image_id": image_id, "status": "TIMEOUT", "assets_processed": 0}
+
+            await asyncio.sleep(interval)
@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+import queue
+import shutil
+import logging
+import threading
+import concurrent.futures
+import multiprocessing
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import convert, metrics, prediction, prefilter, upload_delete, vectorize
+from src import orderFromUp42_parallel as ordering
+from src.scheduler import run_instrumented, worker_count
+from src.zip_processing import convert_archive
+from src.job_state import default_job_store, tile_of_path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CONFIG_PATH      = os.getenv("CONFIG_PATH")
+DATES_PATH       = os.getenv("DATES_PATH")
+INPUT_PATH       = os.getenv("INPUT_PATH")
+OUTPUT_PATH      = os.getenv("OUTPUT_PATH")
+GOOGLE_CRED_PATH = os.getenv("GOOGLE_CRED_PATH")
+BUCKET_NAME      = os.getenv("BUCKET_NAME")
+QUEUE_SIZE       = int(os.environ.get("PIPELINE_QUEUE_SIZE", 2))  # items buffered between two stages
+MERGE_WORKERS    = int(os.environ.get("MERGE_WORKERS", 2))
+CONVERT_WORKERS  = int(os.environ.get("CONVERT_WORKERS", 2))
+UPLOAD_WORKERS   = int(os.environ.get("UPLOAD_WORKERS", 4))
+
+# End-of-stream marker passed down the queues once a stage has no more input
+_DONE = object()
+
+STAGES = ["order", "merge", "predict", "convert", "upload"]
+
+
+def run_stage(name, func, inbox, outbox, workers, failures=None):
+    """
+    Start `workers` threads that apply func to every item from inbox and put
+    non-None results on outbox. The last worker to see _DONE forwards it.
+    Items whose func raised are counted in `failures` ({stage: count}).
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)  # let sibling workers see the marker too
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and outbox is not None:
+                    outbox.put(_DONE)
+                return
+            start = time.time()
+            try:
+                # Stage time adds up over the workers: it is the time spent busy, not wall time
+                with metrics.stage(name, log=False):
+                    result = func(item)
+            except Exception as e:
+                metrics.count(f"{name}_failed", stage=name)
+                logging.error(f"[{name}] {item} failed: {e}")
+                if failures is not None:
+                    with lock:
+                        failures[name] = failures.get(name, 0) + 1
+                continue
+            metrics.observe("item_seconds", time.time() - start, stage=name)
+            logging.info(f"[{name}] {os.path.basename(str(item))} done in {time.time() - start:.1f}s")
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+    threads = [threading.Thread(target=work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def predict_in_worker(executor, tif_path):
+    """predict_tile in the process pool; the counters it recorded there are booked on this thread's stage."""
+    result, _, worker = executor.submit(run_instrumented, prediction.predict_tile, tif_path).result()
+    metrics.METRICS.merge(worker, into=metrics.METRICS.current)
+    return result
+
+
+def run_pipeline(config_path=CONFIG_PATH, catalog=None, bucket=None, predict_func=None,
+                 input_path=INPUT_PATH, output_path=OUTPUT_PATH, dates_path=DATES_PATH):
+    """
+    Stream every fulfilled UP42 asset through merge → predict → convert → upload.
+
+    Stages are connected by bounded queues, so a tile is predicted while other
+    orders are still pending and a slow stage throttles the ones before it.
+    `catalog`, `bucket` and `predict_func` can be replaced by fakes or a stub
+    detector to run the whole chain offline. The summary's "failed" counts
+    the items each stage could not process ({stage: count}; "order" is 1
+    when ordering itself failed).
+    """
+    start = time.time()
+    os.makedirs(input_path, exist_ok=True)
+    os.makedirs(output_path, exist_ok=True)
+
+    if bucket is None:
+        bucket = upload_delete.open_bucket(BUCKET_NAME, GOOGLE_CRED_PATH)
+
+    downloaded, merged, predicted, converted = (queue.Queue(QUEUE_SIZE) for _ in range(4))
+    predicted_files = []
+    uploaded_files = []
+    screening = []
+    failures = {}
+
+    executor = None
+    if predict_func is None:
+        workers = worker_count(prediction.estimate_tile_memory(), prediction.PREDICTE_WORKERS, label="prediction")
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=prediction.init_worker,
+            initargs=(prediction.DEVICE, prediction.torch_threads(workers)),
+        )
+        predict_func = lambda tif_path: predict_in_worker(executor, tif_path)
+    else:
+        workers = 1
+
+    jobs = default_job_store()
+
+    def merge(path):
+        if path.endswith(".zip"):
+            output = convert_archive(path)["output"]
+            if jobs is not None:
+                jobs.advance_tile(tile_of_path(output), "merged")
+            return output
+        if path.endswith(".tif"):
+            return path
+        logging.info(f"[merge] Skipping non-image asset {path}")
+        return None
+
+    def predict(tif_path):
+        if prefilter.PREFILTER:
+            decision = prefilter.screen_tile(tif_path)
+            screening.append(decision)
+            if not decision["keep"]:
+                if jobs is not None:
+                    jobs.advance_tile(tile_of_path(tif_path), "screened_out")
+                return None
+        result = prediction.restore_cached_prediction(tif_path)
+        if result is None:
+            result = predict_func(tif_path)
+            if result is None:
+                raise RuntimeError("the detector wrote no prediction")
+            prediction.cache_prediction(tif_path, result)
+        target = os.path.join(output_path, os.path.basename(result))
+        shutil.move(result, target)
+        predicted_files.append(os.path.basename(target))
+        if jobs is not None:
+            jobs.advance_tile(tile_of_path(target), "predicted")
+        if vectorize.VECTORIZE:
+            vectorize.vectorize_prediction(target)
+        return target
+
+    def convert_prediction(path):
+        if not convert.convert_image(path):
+            raise RuntimeError("conversion to COG failed")
+        return path
+
+    def upload(path):
+        if not upload_delete.upload_file(bucket, path, output_path):
+            raise RuntimeError("upload failed")
+        uploaded_files.append(os.path.basename(path))
+        # Detections written next to the raster by the predict stage
+        vector_file = vectorize.vector_path(path)
+        if os.path.exists(vector_file) and not upload_delete.upload_file(bucket, vector_file, output_path):
+            raise RuntimeError(f"upload of {os.path.basename(vector_file)} failed")
+
+    threads = []
+    threads += run_stage("merge", merge, downloaded, merged, MERGE_WORKERS, failures)
+    threads += run_stage("predict", predict, merged, predicted, workers, failures)
+    threads += run_stage("convert", convert_prediction, predicted, converted, CONVERT_WORKERS, failures)
+    threads += run_stage("upload", upload, converted, None, UPLOAD_WORKERS, failures)
+
+    # Predictions an interrupted run did not upload yet go straight to convert and upload
+    for tile_id in jobs.pending_tiles() if jobs is not None else []:
+        pending = os.path.join(output_path, f"{tile_id}_prediction.tif")
+        if os.path.exists(pending):
+            predicted.put(pending)
+
+    try:
+        # Orders are polled on the order threads; every finished download enters the merge queue
+        with metrics.stage("order"):
+            ordering.download_from_up42(config_path, catalog=catalog, on_downloaded=downloaded.put,
+                                        input_path=input_path)
+    except Exception as e:
+        failures["order"] = 1
+        logging.error(f"Ordering failed, finishing the tiles already downloaded: {e}")
+    finally:
+        downloaded.put(_DONE)
+        for thread in threads:
+            thread.join()
+        if executor is not None:
+            executor.shutdown()
+
+    if screening:
+        prefilter.write_report(screening)
+    prediction.update_dates_json(dates_path, predicted_files)
+    if not upload_delete.upload_extra_file(bucket, dates_path):
+        failures["upload"] = failures.get("upload", 0) + 1
+    prediction.clean_input_folder(input_path)
+
+    summary = {
+        "predicted": len(predicted_files),
+        "uploaded": len(uploaded_files),
+        "failed": failures,
+        "seconds": round(time.time() - start, 1),
+    }
+    if failures:
+        logging.error(f"Streaming pipeline finished with failures: {summary}")
+    else:
+        logging.info(f"Streaming pipeline finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    if not CONFIG_PATH or not os.path.exists(CONFIG_PATH):
+        logging.error(f"Config file not found at {CONFIG_PATH}")
+        exit(1)
+
+    exit(1 if run_pipeline()["failed"] else 0)
@@ -4,19 +4,40 @@ import os
 import time
 import logging
 import shutil
-import json
 import datetime
+import glob
+import sys
+from osgeo import gdal
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.scheduler import MB, cpu_count, run_pool, track_progress, worker_count
+from src.tile_cache import default_cache, file_sha256
+from src.prefilter import screen_tiles
+from src.vectorize import VECTORIZE, vectorize_predictions
+from src.catalog import open_catalog
+from src.job_state import default_job_store, tile_of_path
+from src import metrics
 
 # Configure logging
 testing_format='%(asctime)s - %(levelname)s - %(message)s'
 logging.basicConfig(level=logging.INFO, format=testing_format)
 
 DAYBEFORE = int(os.environ.get("DAYBEFORE", 2))
-PREDICTE_WORKERS = int(os.environ.get("PREDICTE_WORKERS", 1))
+PREDICTE_WORKERS = int(os.environ["PREDICTE_WORKERS"]) if os.getenv("PREDICTE_WORKERS") else None  # optional cap
 DEVICE = os.environ.get("DEVICE", "cuda")
 DATES_PATH = os.getenv("DATES_PATH")
 INPUT_PATH = os.getenv("INPUT_PATH")
 OUTPUT_PATH = os.getenv("OUTPUT_PATH")
+PREDICTION_MODE = os.environ.get("PREDICTION_MODE", "engine")  # "engine", "windowed" or "cli"
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH")
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "/root/.cache/torch/hub/checkpoints")
+MODEL_MEMORY_MB = int(os.environ.get("MODEL_MEMORY_MB", 2048))
+TILE_MEMORY_FACTOR = float(os.environ.get("TILE_MEMORY_FACTOR", 8))  # RAM per decoded byte of the tile
+
+# Model and scene predictor, loaded once per worker process by load_model()
+_MODEL = None
+_PREDICTOR = None
+_CHECKPOINT_HASH = None
 
 
 def run_command(command):
@@ -39,16 +60,148 @@ def run_command(command):
         logging.error(f"An unexpected error occurred while executing command '{command}': {e}")
 
 
-def show_progress(futures):
-    """Track and log progress of parallel execution."""
-    total = len(futures)
-    while True:
-        done_count = sum(f.done() for f in futures)
-        running_count = sum(1 for f in futures if f.running())
-        logging.info(f"Progress: {done_count}/{total} completed, {running_count} running.")
-        if done_count == total:
-            break
-        time.sleep(5)
+def find_checkpoint(checkpoint_dir=CHECKPOINT_DIR):
+    """Return CHECKPOINT_PATH or the newest checkpoint in the torch hub cache."""
+    if CHECKPOINT_PATH:
+        return CHECKPOINT_PATH
+    checkpoints = glob.glob(os.path.join(checkpoint_dir, "*.ckpt"))
+    if not checkpoints:
+        raise FileNotFoundError(f"No model checkpoint found in {checkpoint_dir}")
+    return max(checkpoints, key=os.path.getmtime)
+
+
+def load_model(device=DEVICE):
+    """Load the marinedebrisdetector model once per process and return (model, predictor)."""
+    global _MODEL, _PREDICTOR
+    if _MODEL is None:
+        # Imported lazily so the CLI mode never pays the torch import cost
+        from marinedebrisdetector.model.segmentation_model import SegmentationModel
+        from marinedebrisdetector.predictor import ScenePredictor
+
+        checkpoint = find_checkpoint()
+        start = time.time()
+        model = SegmentationModel.load_from_checkpoint(checkpoint, map_location=device)
+        model.eval()
+        _MODEL = model.to(device)
+        _PREDICTOR = ScenePredictor(device=device)
+        logging.info(f"Loaded model {os.path.basename(checkpoint)} on {device} in {time.time() - start:.1f}s (pid {os.getpid()})")
+    return _MODEL, _PREDICTOR
+
+
+def checkpoint_hash():
+    """sha256 of the model checkpoint, or None if there is none (e.g. a stub detector)."""
+    global _CHECKPOINT_HASH
+    if _CHECKPOINT_HASH is None:
+        try:
+            _CHECKPOINT_HASH = file_sha256(find_checkpoint())
+        except FileNotFoundError:
+            return None
+    return _CHECKPOINT_HASH
+
+
+def prediction_params():
+    """Everything that changes a prediction's content; part of the tile cache key."""
+    from src.zip_processing import merge_params
+    params = {"checkpoint": checkpoint_hash(), "merge": merge_params(),
+              "mode": "windowed" if PREDICTION_MODE == "windowed" else "scene"}
+    if PREDICTION_MODE == "windowed":
+        from src.windowed_prediction import INPUT_SCALE, PATCH_OVERLAP, PATCH_SIZE
+        params.update(patch_size=PATCH_SIZE, overlap=PATCH_OVERLAP, input_scale=INPUT_SCALE)
+    return params
+
+
+def restore_cached_prediction(tif_path):
+    """Put a cached prediction for this tile next to it; return its path or None on a miss."""
+    cache = default_cache()
+    if cache is None:
+        return None
+    return cache.get("prediction", tile_of_path(tif_path), prediction_params(), prediction_path(tif_path))
+
+
+def cache_prediction(tif_path, output_path):
+    """Store a freshly computed prediction in the tile cache."""
+    cache = default_cache()
+    if cache is not None and output_path and os.path.exists(output_path):
+        cache.put("prediction", tile_of_path(tif_path), prediction_params(), output_path)
+
+
+def torch_threads(workers):
+    """This worker's share of the cores for torch's intra-op pool, like gdal_budget does for GDAL."""
+    return max(cpu_count() // workers, 1)
+
+
+def init_worker(device=DEVICE, threads=None):
+    """
+    Process pool initializer: limit torch to this worker's share of the cores
+    (by default every worker would start one thread per core) and load the
+    model before the first tile arrives.
+    """
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    load_model(device)
+
+
+def prediction_path(tif_path):
+    """Return the *_prediction.tif path the detector writes for a tile."""
+    return os.path.splitext(tif_path)[0] + "_prediction.tif"
+
+
+def decoded_tile_bytes(tif_path):
+    """
+    Size of a tile once decoded (width x height x bands x sample size), read
+    from its header. Merged tiles are DEFLATE-compressed and AOI clipping
+    leaves large nodata areas, so the file size says little about memory.
+    """
+    ds = gdal.Open(tif_path)
+    if ds is None:
+        raise FileNotFoundError(f"Cannot open {tif_path}")
+    sample_bytes = gdal.GetDataTypeSize(ds.GetRasterBand(1).DataType) // 8
+    return ds.RasterXSize * ds.RasterYSize * ds.RasterCount * sample_bytes
+
+
+def estimate_tile_memory(tif_path=None):
+    """
+    Rough memory one worker needs for a tile: the loaded model plus the tile's working set.
+    Without a path (tile not downloaded yet) a full 10980x10980 13-band Byte tile is assumed.
+    """
+    if PREDICTION_MODE == "windowed":
+        from src.windowed_prediction import BATCH_SIZE, PATCH_SIZE
+        # A float32 batch of 13-band patches plus the (patch x 10980) score strips
+        working_set = BATCH_SIZE * 13 * PATCH_SIZE ** 2 * 4 * 2 + PATCH_SIZE * 10980 * 9
+    else:
+        tile_bytes = decoded_tile_bytes(tif_path) if tif_path else 10980 * 10980 * 13
+        working_set = tile_bytes * TILE_MEMORY_FACTOR
+    return int(MODEL_MEMORY_MB * MB + working_set)
+
+
+def predict_tile(tif_path, device=DEVICE):
+    """Run one tile through the in-process model and write its *_prediction.tif."""
+    try:
+        model, predictor = load_model(device)
+        output_path = prediction_path(tif_path)
+        start = time.time()
+        if PREDICTION_MODE == "windowed":
+            # Bounded-memory batched patches instead of handing the whole tile to the predictor
+            from src.windowed_prediction import predict_windowed, torch_batch_predictor
+            predict_windowed(tif_path, output_path, torch_batch_predictor(model, device))
+        else:
+            # ScenePredictor feeds every band (dropping B10 from 13-band L1C tiles) to the model
+            from src.windowed_prediction import L1C_BANDS, MODEL_BANDS
+            bands = gdal.Open(tif_path).RasterCount
+            if bands not in (len(MODEL_BANDS), len(L1C_BANDS)):
+                raise ValueError(f"{os.path.basename(tif_path)} has {bands} bands; the model needs "
+                                 f"{len(MODEL_BANDS)} (see MERGE_BANDS)")
+            predictor.predict(model, tif_path, output_path)
+        logging.info(f"Predicted {os.path.basename(tif_path)} in {time.time() - start:.1f}s")
+        tile = gdal.Open(tif_path)
+        metrics.count("pixels", tile.RasterXSize * tile.RasterYSize)
+        metrics.count("bytes_in", os.path.getsize(tif_path))
+        metrics.count("bytes_out", os.path.getsize(output_path))
+        return output_path
+    except Exception as e:
+        logging.error(f"Prediction failed for {tif_path}: {e}")
+        return None
 
 
 def move_predictions(input_folder, output_folder):
@@ -68,36 +221,42 @@ def move_predictions(input_folder, output_folder):
 
 
 def update_dates_json(json_path, predicted_files):
-    """Update JSON file with yesterday's date and provided predicted filenames without duplicates."""
+    """
+    Record the predicted filenames in the prediction catalog, each under the
+    date its scene was searched for (yesterday's date for scenes the job
+    store does not know, e.g. without one), and re-export json_path from it.
+    Predictions of orders resumed from an earlier day keep that day. A
+    corrupt dates.json raises instead of being reset.
+    """
     yesterday = (datetime.date.today() - datetime.timedelta(days=DAYBEFORE)).isoformat()
+    jobs = default_job_store()
+    entries = [((jobs.date_of_tile(tile_of_path(file_name)) if jobs is not None else None) or yesterday, file_name)
+               for file_name in predicted_files]
 
-    # Load or initialize JSON data
-    if os.path.exists(json_path):
-        with open(json_path, "r") as json_file:
-            try:
-                json_data = json.load(json_file)
-            except json.JSONDecodeError:
-                logging.warning(f"Corrupted JSON found at {json_path}. Re-creating file.")
-                json_data = {}
-    else:
-        json_data = {}
-
-    # Ensure bucket for yesterday exists
-    json_data.setdefault(yesterday, [])
+    catalog = open_catalog(json_path)
+    catalog.add_many(entries)
+    catalog.export_dates_json(json_path)
 
-    # Append only new files for that date
-    for file in predicted_files:
-        if file not in json_data[yesterday]:
-            json_data[yesterday].append(file)
+    logging.info(f"Updated JSON with files: {entries}")
 
-    # Deduplicate and sort
-    json_data[yesterday] = sorted(set(json_data[yesterday]))
 
-    # Write out
-    with open(json_path, "w") as json_file:
-        json.dump(json_data, json_file, indent=4)
-
-    logging.info(f"Updated JSON for {yesterday} with files: {predicted_files}")
+def clear_output_folder(output_folder, keep_tiles=()):
+    """Empty the output folder, keeping the files of `keep_tiles` (tile IDs)."""
+    if keep_tiles and os.path.exists(output_folder):
+        for file_name in os.listdir(output_folder):
+            path = os.path.join(output_folder, file_name)
+            if tile_of_path(file_name) in keep_tiles:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        logging.info(f"Cleared {output_folder}, keeping {len(keep_tiles)} tiles that are not uploaded yet")
+    elif os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+        logging.info(f"Cleared existing output directory: {output_folder}")
+    os.makedirs(output_folder, exist_ok=True)
+    logging.info(f"Created output directory: {output_folder}")
 
 
 def clean_input_folder(input_folder):
@@ -112,30 +271,81 @@ def clean_input_folder(input_folder):
         logging.error(f"Error while deleting files from input folder: {e}")
 
 
-def main():
-    # Ensure output folder is fresh
-    if os.path.exists(OUTPUT_PATH):
-        shutil.rmtree(OUTPUT_PATH)
-        logging.info(f"Cleared existing output directory: {OUTPUT_PATH}")
-    os.makedirs(OUTPUT_PATH, exist_ok=True)
-    logging.info(f"Created output directory: {OUTPUT_PATH}")
+def main(predict_func=None):
+    """
+    Predict every merged tile in INPUT_PATH; `predict_func(tif_path)` (e.g. a
+    stub detector) replaces the model. Returns {tif_path: prediction path, or
+    None if it failed} for the tiles the detector ran on.
+    """
+    # Ensure output folder is fresh, except for predictions an interrupted run has not uploaded yet
+    jobs = default_job_store()
+    pending = set(jobs.pending_tiles()) if jobs is not None else set()
+    clear_output_folder(OUTPUT_PATH, keep_tiles=pending)
 
-    tif_files = [f for f in os.listdir(INPUT_PATH) if f.endswith(".tif")]
+    tif_files = [f for f in os.listdir(INPUT_PATH) if f.endswith(".tif") and not f.endswith("_prediction.tif")]
+    if jobs is not None:
+        done = [f for f in tif_files if jobs.tile_reached(tile_of_path(f), "predicted")]
+        if done:
+            logging.info(f"{len(done)} tiles were already predicted or screened out by an earlier run: {done}")
+        tif_files = [f for f in tif_files if f not in done]
     if not tif_files:
         logging.warning("No TIFF files found in the input directory.")
-        return
+        return {}
+
+    # Mostly cloudy, dry or empty tiles are not worth running the detector on
+    screened = screen_tiles([os.path.join(INPUT_PATH, tif_file) for tif_file in tif_files])
+    if jobs is not None:
+        # Their files are deleted with the input folder; a restart must not download them again
+        for tif_file in tif_files:
+            if os.path.join(INPUT_PATH, tif_file) not in screened:
+                jobs.advance_tile(tile_of_path(tif_file), "screened_out")
 
-    commands = [
-        f"marinedebrisdetector --device={DEVICE} {os.path.join(INPUT_PATH, tif_file)}"
-        for tif_file in tif_files
-    ]
-    with concurrent.futures.ThreadPoolExecutor(max_workers=PREDICTE_WORKERS) as executor:
-        futures = [executor.submit(run_command, cmd) for cmd in commands]
-        show_progress(futures)
-    logging.info("All prediction commands have been executed.")
+    # Tiles predicted by an earlier (e.g. crashed) run with the same model and parameters are reused
+    tif_paths = []
+    for tif_path in screened:
+        if restore_cached_prediction(tif_path) is None:
+            tif_paths.append(tif_path)
+        elif jobs is not None:
+            jobs.advance_tile(tile_of_path(tif_path), "predicted")
+    logging.info(f"{len(screened) - len(tif_paths)} of {len(screened)} tiles restored from the tile cache")
+    metrics.count("tiles_screened_out", len(tif_files) - len(screened))
+    metrics.count("tiles_cached", len(screened) - len(tif_paths))
+
+    results = {}
+    if tif_paths and predict_func is not None:
+        for tif_path in tif_paths:
+            predict_func(tif_path)
+    elif tif_paths and PREDICTION_MODE == "cli":
+        commands = [f"marinedebrisdetector --device={DEVICE} {tif_path}" for tif_path in tif_paths]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=PREDICTE_WORKERS or 1) as executor:
+            futures = [executor.submit(run_command, cmd) for cmd in commands]
+            track_progress(futures, "prediction commands")
+        logging.info("All prediction commands have been executed.")
+    elif tif_paths:
+        # Each spawned worker loads the model exactly once; the pool is sized to cores and free RAM
+        task_bytes = max(estimate_tile_memory(tif_path) for tif_path in tif_paths)
+        workers = worker_count(task_bytes, max_workers=PREDICTE_WORKERS, label="prediction")
+        sizes = {tif_path: decoded_tile_bytes(tif_path) for tif_path in tif_paths}
+        results = run_pool(predict_tile, tif_paths, workers, sizes=sizes, initializer=init_worker,
+                           initargs=(DEVICE, torch_threads(workers)), label="tiles")
+        logging.info("All tiles have been predicted.")
+    # The stub detector and the CLI only leave their output behind
+    for tif_path in tif_paths:
+        if tif_path not in results:
+            results[tif_path] = prediction_path(tif_path) if os.path.exists(prediction_path(tif_path)) else None
+
+    for tif_path in tif_paths:
+        cache_prediction(tif_path, prediction_path(tif_path))
 
     # Move predicted images and capture filenames
     moved_files = move_predictions(INPUT_PATH, OUTPUT_PATH)
+    if jobs is not None:
+        for file_name in moved_files:
+            jobs.advance_tile(tile_of_path(file_name), "predicted")
+
+    # Detections as compact polygons next to each raster; uploaded with the rest of OUTPUT_PATH
+    if VECTORIZE:
+        vectorize_predictions([os.path.join(OUTPUT_PATH, file_name) for file_name in moved_files])
 
     # Update JSON with only today's predictions
     update_dates_json(DATES_PATH, moved_files)
@@ -143,7 +353,12 @@ def main():
     # Clean up input folder
     clean_input_folder(INPUT_PATH)
 
-    logging.info("Workflow completed successfully.")
+    failed = [tif_path for tif_path, output_path in results.items() if output_path is None]
+    if failed:
+        logging.error(f"Prediction failed for {len(failed)} of {len(results)} tiles: {failed}")
+    else:
+        logging.info("Workflow completed successfully.")
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import logging
+import datetime
+import numpy as np
+from osgeo import gdal
+
+from src.aoi import default_aoi, inside_mask, to_raster_crs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PREFILTER            = os.environ.get("PREFILTER", "1") == "1"
+PREFILTER_SIZE       = int(os.environ.get("PREFILTER_SIZE", 512))            # longest side of the decimated read
+PREFILTER_MIN_VALID  = float(os.environ.get("PREFILTER_MIN_VALID", 0.1))     # share of non-nodata pixels inside the AOI
+PREFILTER_MIN_WATER  = float(os.environ.get("PREFILTER_MIN_WATER", 0.05))    # share of valid pixels that are water
+PREFILTER_MAX_CLOUD  = float(os.environ.get("PREFILTER_MAX_CLOUD", 0.9))     # share of valid pixels that are cloud
+NDWI_THRESHOLD       = float(os.environ.get("NDWI_THRESHOLD", 0.0))
+CLOUD_BLUE_THRESHOLD = float(os.environ.get("CLOUD_BLUE_THRESHOLD", 0.2))    # B02 reflectance of bright cloud tops
+REPORT_DIR           = os.environ.get("REPORT_DIR", "images/reports")
+
+# Band order of a merged tile: zip_processing stacks the sorted B*.tif files
+DEFAULT_BANDS = ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B09", "B11", "B12", "B8A"]
+REFLECTANCE_SCALE = 1 / 255  # Byte value -> reflectance for tiles without band scale/offset
+
+
+def band_numbers(ds):
+    """Map band names (B02, B03, ...) to 1-based band numbers from descriptions or the default order."""
+    names = [ds.GetRasterBand(i).GetDescription() for i in range(1, ds.RasterCount + 1)]
+    if not all(names):
+        names = DEFAULT_BANDS[:ds.RasterCount]
+    return {name: number for number, name in enumerate(names, start=1)}
+
+
+def screen_tile(tif_path, size=PREFILTER_SIZE, aoi=None):
+    """
+    Estimate valid, water and cloud fractions of a merged tile from a
+    decimated read and decide whether it is worth running the detector on.
+
+    With an AOI (default: the one tiles are clipped to) the fractions only
+    count pixels inside it: mask_outside zeroes the rest of the tile, and
+    that nodata says nothing about the sensor, so a tile that only partly
+    overlaps the AOI is not dropped for it.
+    """
+    start = time.time()
+    ds = gdal.Open(tif_path)
+    if ds is None:
+        raise FileNotFoundError(f"Cannot open {tif_path}")
+    factor = max(ds.RasterXSize, ds.RasterYSize) / size
+    buf_x = max(int(ds.RasterXSize / factor), 1)
+    buf_y = max(int(ds.RasterYSize / factor), 1)
+    bands = band_numbers(ds)
+
+    def read(name):
+        band = ds.GetRasterBand(bands[name])
+        # Tiles merged by the NumPy engine carry value -> reflectance as band scale/offset
+        scale, offset = band.GetScale(), band.GetOffset() or 0.0
+        if not scale or (scale == 1 and not offset):
+            scale, offset = REFLECTANCE_SCALE, 0.0
+        values = band.ReadAsArray(buf_xsize=buf_x, buf_ysize=buf_y).astype(np.float32)
+        return np.where(values > 0, values * scale + offset, 0.0)
+
+    aoi = default_aoi() if aoi is None else aoi
+    if aoi is not None:
+        inside = inside_mask(ds, to_raster_crs(aoi, ds), buf_x, buf_y)
+    else:
+        inside = np.ones((buf_y, buf_x), dtype=bool)
+
+    blue, green, nir = read("B02"), read("B03"), read("B08")
+    valid = inside & (green > 0) & (nir > 0)
+    valid_count = max(int(valid.sum()), 1)
+
+    ndwi = (green - nir) / np.maximum(green + nir, 1e-6)
+    water = valid & (ndwi > NDWI_THRESHOLD)
+    cloud = valid & (blue > CLOUD_BLUE_THRESHOLD) & (green > CLOUD_BLUE_THRESHOLD) & (nir > CLOUD_BLUE_THRESHOLD)
+
+    decision = {
+        "tile": os.path.basename(tif_path),
+        "aoi_fraction": round(float(inside.mean()), 4),
+        "valid_fraction": round(float(valid.sum()) / max(int(inside.sum()), 1), 4),
+        "water_fraction": round(float(water.sum()) / valid_count, 4),
+        "cloud_fraction": round(float(cloud.sum()) / valid_count, 4),
+    }
+    reasons = []
+    if decision["valid_fraction"] < PREFILTER_MIN_VALID:
+        reasons.append(f"valid {decision['valid_fraction']:.2f} < {PREFILTER_MIN_VALID}")
+    if decision["water_fraction"] < PREFILTER_MIN_WATER:
+        reasons.append(f"water {decision['water_fraction']:.2f} < {PREFILTER_MIN_WATER}")
+    if decision["cloud_fraction"] > PREFILTER_MAX_CLOUD:
+        reasons.append(f"cloud {decision['cloud_fraction']:.2f} > {PREFILTER_MAX_CLOUD}")
+    decision["keep"] = not reasons
+    decision["reason"] = "; ".join(reasons) or "ok"
+    decision["seconds"] = round(time.time() - start, 3)
+
+    logging.info(f"Pre-filter {'kept' if decision['keep'] else 'dropped'} {decision['tile']}: "
+                 f"valid={decision['valid_fraction']:.2f} water={decision['water_fraction']:.2f} "
+                 f"cloud={decision['cloud_fraction']:.2f} ({decision['reason']})")
+    return decision
+
+
+def write_report(decisions, report_dir=REPORT_DIR):
+    """Write this run's pre-filter decisions to REPORT_DIR/prefilter_<timestamp>.json."""
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"prefilter_{datetime.datetime.now():%Y-%m-%dT%H-%M-%S}.json")
+    report = {
+        "thresholds": {"min_valid": PREFILTER_MIN_VALID, "min_water": PREFILTER_MIN_WATER,
+                       "max_cloud": PREFILTER_MAX_CLOUD},
+        "kept": sum(d["keep"] for d in decisions),
+        "dropped": sum(not d["keep"] for d in decisions),
+        "tiles": decisions,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    logging.info(f"Pre-filter report written to {path}")
+    return path
+
+
+def screen_tiles(tif_paths):
+    """Screen tiles, write the run report and return the paths worth predicting."""
+    if not PREFILTER:
+        return list(tif_paths)
+    decisions = []
+    kept = []
+    for tif_path in tif_paths:
+        try:
+            decision = screen_tile(tif_path)
+        except Exception as e:
+            logging.error(f"Pre-filter failed for {tif_path}, keeping it: {e}")
+            decision = {"tile": os.path.basename(tif_path), "keep": True, "reason": f"error: {e}"}
+        decisions.append(decision)
+        if decision["keep"]:
+            kept.append(tif_path)
+    write_report(decisions)
+    logging.info(f"Pre-filter kept {len(kept)} of {len(decisions)} tiles")
+    return kept
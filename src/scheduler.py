@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+
+from src import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MEMORY_RESERVE_MB = int(os.environ.get("MEMORY_RESERVE_MB", 1024))  # left free for the OS and the parent process
+
+MB = 1024 * 1024
+
+
+def cpu_count():
+    """Number of cores this process may run on (respects container CPU affinity)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory():
+    """Bytes of RAM available for new work, from /proc/meminfo with a sysconf fallback."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def worker_count(task_bytes, max_workers=None, threads_per_worker=1, label="tasks"):
+    """Pick a pool size from free cores and free RAM given the memory one worker needs."""
+    cores = max(cpu_count() // threads_per_worker, 1)
+    free = max(available_memory() - MEMORY_RESERVE_MB * MB, 0)
+    by_memory = max(int(free // max(task_bytes, 1)), 1)
+    workers = min(cores, by_memory)
+    if max_workers:
+        workers = min(workers, max_workers)
+    logging.info(f"Scheduler for {label}: {workers} workers (cores={cores}, free RAM={free // MB} MB, "
+                 f"estimated {task_bytes // MB} MB per worker, memory allows {by_memory}, cap={max_workers})")
+    return workers
+
+
+def track_progress(futures, label="tasks"):
+    """Log progress from completion callbacks and block until every future is done."""
+    total = len(futures)
+    done = [0]
+    lock = threading.Lock()
+    start = time.time()
+
+    def on_done(future):
+        with lock:
+            done[0] += 1
+            count = done[0]
+        error = future.exception()
+        if error is not None:
+            logging.error(f"{label}: task failed: {error}")
+        logging.info(f"Progress: {count}/{total} {label} completed after {time.time() - start:.1f}s")
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    concurrent.futures.wait(futures)
+
+
+def run_instrumented(func, item):
+    """
+    Pool task wrapper: run func(item) and return its result together with
+    its wall time and the metrics it recorded, so the parent can book them.
+    """
+    metrics.METRICS.reset()
+    start = time.time()
+    with metrics.RssSampler() as rss:
+        result = func(item)
+    seconds = time.time() - start
+    worker = metrics.METRICS.snapshot()
+    metrics.METRICS.reset()  # handed back here, so the worker's exit dump must not repeat it
+    for data in worker.values():
+        data["peak_rss_mb"] = max(data["peak_rss_mb"], rss.peak)
+    return result, seconds, worker
+
+
+def run_pool(func, items, workers, sizes=None, initializer=None, initargs=(), label="tasks"):
+    """
+    Run func(item) for every item in a spawned process pool and return {item: result}.
+
+    Items are dispatched largest first (by `sizes`, default file size) so the
+    longest tasks do not end up as stragglers at the end of the run. Each
+    task's latency ("<label>_seconds") and the counters it recorded are
+    added to this process's current metrics stage.
+    """
+    if sizes is None:
+        sizes = {item: os.path.getsize(item) for item in items}
+    ordered = sorted(items, key=lambda item: sizes[item], reverse=True)
+    logging.info(f"Dispatching {len(ordered)} {label} largest first: "
+                 f"{[(os.path.basename(str(item)), sizes[item] // MB) for item in ordered]} (MB)")
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as executor:
+        futures = {executor.submit(run_instrumented, func, item): item for item in ordered}
+        track_progress(list(futures), label)
+
+    results = {}
+    for future, item in futures.items():
+        if future.exception() is not None:
+            metrics.count(f"{label}_failed")
+            results[item] = None
+            continue
+        result, seconds, worker = future.result()
+        metrics.observe(f"{label}_seconds", seconds)
+        metrics.METRICS.merge(worker, into=metrics.METRICS.current)
+        results[item] = result
+    return results
@@ -0,0 +1,157 @@
+"""
+Storage backends for uploading results.
+
+The uploader only needs stat (size and checksums), upload and delete per
+object, plus a full listing for snapshots. `GcsBackend` implements them on a
+google.cloud.storage bucket (or the directory-backed fake in offline/fakes.py),
+`LocalBackend` on a plain directory, e.g. to run the pipeline offline:
+
+    backend = LocalBackend("/tmp/bucket")
+    upload_delete.upload_files(backend, paths, OUTPUT_PATH)
+"""
+import os
+import base64
+import shutil
+import hashlib
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MB = 1024 ** 2
+UPLOAD_CHUNK_MB    = int(os.environ.get("UPLOAD_CHUNK_MB", 16))      # resumable upload chunk, multiple of 256 KB
+PARALLEL_UPLOAD_MB = int(os.environ.get("PARALLEL_UPLOAD_MB", 256))  # files this large go up in parallel parts
+PARALLEL_UPLOAD_WORKERS = int(os.environ.get("PARALLEL_UPLOAD_WORKERS", 8))
+
+
+def _digest(path, hasher):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * MB), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+def local_md5(path):
+    """Base64 md5 of a file, as GCS reports it in md5_hash."""
+    return base64.b64encode(_digest(path, hashlib.md5()).digest()).decode()
+
+
+def local_crc32c(path):
+    """Base64 big-endian CRC32C of a file as GCS reports it, or None without google-crc32c."""
+    try:
+        import google_crc32c
+    except ImportError:
+        return None
+    return base64.b64encode(_digest(path, google_crc32c.Checksum()).digest()).decode()
+
+
+def matches(path, remote):
+    """
+    True if the remote object (from stat) has the local file's size and
+    checksum. md5 is compared when the object has one; composite and
+    multipart objects only carry CRC32C.
+    """
+    if remote is None or remote.get("size") != os.path.getsize(path):
+        return False
+    if remote.get("md5"):
+        return remote["md5"] == local_md5(path)
+    if remote.get("crc32c"):
+        return remote["crc32c"] == local_crc32c(path)
+    return False
+
+
+class StorageBackend:
+    """Interface of an upload target; object names are '/'-separated paths."""
+
+    def stat(self, name):
+        """{"size", "md5", "crc32c"} of an object (checksums base64, None if unknown) or None if missing."""
+        raise NotImplementedError
+
+    def upload(self, local_path, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def names(self):
+        """Names of all objects; lists the whole bucket."""
+        raise NotImplementedError
+
+
+class GcsBackend(StorageBackend):
+    """
+    Google Cloud Storage bucket. Files above one chunk use resumable, chunked
+    uploads; files above PARALLEL_UPLOAD_MB are sent as concurrent parts with
+    the transfer manager when the installed client provides it.
+    """
+
+    def __init__(self, bucket, chunk_size=UPLOAD_CHUNK_MB * MB, parallel_threshold=PARALLEL_UPLOAD_MB * MB):
+        self.bucket = bucket
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+
+    def stat(self, name):
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            return None
+        return {"size": blob.size, "md5": blob.md5_hash, "crc32c": blob.crc32c}
+
+    def upload(self, local_path, name):
+        size = os.path.getsize(local_path)
+        if size >= self.parallel_threshold:
+            try:
+                from google.cloud.storage import transfer_manager
+            except ImportError:
+                transfer_manager = None
+            if transfer_manager is not None:
+                blob = self.bucket.blob(name)
+                transfer_manager.upload_chunks_concurrently(local_path, blob, chunk_size=self.chunk_size,
+                                                            max_workers=PARALLEL_UPLOAD_WORKERS)
+                return
+        # A chunk_size makes the client use a resumable session that retries chunk by chunk
+        blob = self.bucket.blob(name, chunk_size=self.chunk_size if size > self.chunk_size else None)
+        blob.upload_from_filename(local_path)
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+    def names(self):
+        return [blob.name for blob in self.bucket.list_blobs()]
+
+
+class LocalBackend(StorageBackend):
+    """A directory standing in for a bucket; uploads are copied in atomically."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def stat(self, name):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        return {"size": os.path.getsize(path), "md5": local_md5(path), "crc32c": None}
+
+    def upload(self, local_path, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(local_path, temp)
+        os.replace(temp, path)
+
+    def delete(self, name):
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def names(self):
+        return sorted(os.path.relpath(os.path.join(directory, file), self.root).replace(os.sep, "/")
+                      for directory, _, files in os.walk(self.root) for file in files)
+
+
+def backend_for(bucket):
+    """Wrap a storage bucket in a GcsBackend; backends are passed through."""
+    return bucket if isinstance(bucket, StorageBackend) else GcsBackend(bucket)
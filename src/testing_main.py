@@ -1,50 +1,14 @@
 import os
-import subprocess
+import sys
 import logging
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import main
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def execute_script(script_path, args=""):
-    """Executes a given Python script with optional arguments."""
-    try:
-        command = f"python {script_path} {args}"
-        logging.info(f"Executing: {command}")
-        subprocess.run(command, shell=True, check=True)
-        logging.info(f"Successfully executed: {script_path}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error executing {script_path}: {e}")
-
-def main():
-    # Define script paths with correct relative paths
-    scripts = {
-        #"order": "src/orderFromUp42_parallel.py",
-        "predict": "src/prediction.py",
-        #"convert": "src/convert.py",
-        #"upload_delete": "src/upload_delete.py"
-    }
-
-    # Environment variables for order
-    os.environ["CONFIG_PATH"] = "src/resources/config.geojson"
-    os.environ["DATES_PATH"] = "src/resources/dates.json"
-    os.environ["INPUT_PATH"] = "images/downloaded"
-    os.environ["OUTPUT_PATH"] = "images/predicted"
-    os.environ["UP42_CRED_PATH"] = "secrets/up42_credentials.json"
-    os.environ["GOOGLE_CRED_PATH"] = "secrets/google_credentials.json"
-    os.environ["BUCKET_NAME"] = "marinelitter_predicted"
-    os.environ["ORDER_WORKERS"] = "10"
-
-    # Execute scripts in sequence
-    logging.info("--------------Starting workflow--------------")
-    #logging.info("--------------Order and Download Images--------------")
-    #execute_script(scripts["order"])
-    logging.info("--------------Analise Images--------------")
-    execute_script(scripts["predict"])
-    #logging.info("--------------Convert Images--------------")
-    #execute_script(scripts["convert"])
-    #logging.info("--------------Upload and Delete Images--------------")
-    #execute_script(scripts["upload_delete"])
-    logging.info("--------------Workflow completed successfully.--------------")
-
 if __name__ == "__main__":
-    main()
+    # Only analyse the images already in INPUT_PATH
+    os.environ["ORDER_WORKERS"] = "10"
+    sys.exit(main.main(["--skip", "order", "convert", "upload"]))
@@ -0,0 +1,140 @@
+import os
+import time
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+CACHE_PATH   = os.environ.get("CACHE_PATH", "images/cache")
+CACHE_MAX_GB = float(os.environ.get("CACHE_MAX_GB", 50))  # 0 disables the cache
+
+_DEFAULT = None
+
+
+def default_cache():
+    """The process-wide cache at CACHE_PATH, or None when CACHE_MAX_GB is 0."""
+    global _DEFAULT
+    if _DEFAULT is None and CACHE_MAX_GB > 0:
+        _DEFAULT = TileCache(CACHE_PATH, int(CACHE_MAX_GB * 1024 ** 3))
+    return _DEFAULT
+
+
+def file_sha256(path, chunk_size=8 * 1024 * 1024):
+    """Hex sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def place(src, dst):
+    """Hard-link src to dst (cache files are never modified in place), copying across filesystems."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class TileCache:
+    """
+    Persistent, content-addressed store for merged tiles and predictions.
+
+    An entry is keyed by sha256 over (kind, tile ID, processing parameters),
+    where the parameters include the model checkpoint hash for predictions.
+    The SQLite index records size and last use; once the cache is larger
+    than `max_bytes` the least recently used entries are evicted. It also
+    remembers which UP42 image produced which tile, so the order stage can
+    skip images whose tile is already cached.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=int(CACHE_MAX_GB * 1024 ** 3)):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite"), timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, kind TEXT, tile_id TEXT, "
+                             "size INTEGER, last_used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS images (image_id TEXT PRIMARY KEY, tile_id TEXT)")
+
+    @staticmethod
+    def key(kind, tile_id, params):
+        payload = json.dumps({"kind": kind, "tile_id": tile_id, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _object_path(self, key):
+        return os.path.join(self.path, "objects", key[:2], f"{key}.tif")
+
+    def get(self, kind, tile_id, params, target_path):
+        """Place the cached file at target_path and return it, or return None on a miss."""
+        key = self.key(kind, tile_id, params)
+        object_path = self._object_path(key)
+        with self._lock, self._db:
+            hit = self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+            if hit and not os.path.exists(object_path):
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                hit = None
+            if hit:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        if not hit:
+            return None
+        place(object_path, target_path)
+        logging.info(f"Cache hit: {kind} {tile_id}")
+        return target_path
+
+    def put(self, kind, tile_id, params, src_path):
+        """Store src_path under (kind, tile_id, params) and evict old entries if over the limit."""
+        key = self.key(kind, tile_id, params)
+        object_path = self._object_path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temp_path = f"{object_path}.{os.getpid()}.tmp"
+        place(src_path, temp_path)
+        os.replace(temp_path, object_path)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (key, kind, tile_id, os.path.getsize(object_path), time.time()))
+        logging.info(f"Cached {kind} {tile_id}")
+        self.evict()
+
+    def has(self, kind, tile_id, params):
+        key = self.key(kind, tile_id, params)
+        with self._lock:
+            hit = self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+        return bool(hit) and os.path.exists(self._object_path(key))
+
+    def link_image(self, image_id, tile_id):
+        """Remember that UP42 image `image_id` was delivered as tile `tile_id`."""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO images VALUES (?, ?)", (image_id, tile_id))
+
+    def tile_for_image(self, image_id):
+        with self._lock:
+            row = self._db.execute("SELECT tile_id FROM images WHERE image_id = ?", (image_id,)).fetchone()
+        return row[0] if row else None
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits into max_bytes."""
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, kind, tile_id, size in self._db.execute(
+                    "SELECT key, kind, tile_id, size FROM entries ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                object_path = self._object_path(key)
+                if os.path.exists(object_path):
+                    os.remove(object_path)
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                logging.info(f"Evicted {kind} {tile_id} from cache ({size / 1e6:.0f} MB)")
@@ -1,6 +1,15 @@
 import os
+import sys
+import time
 import logging
-from google.cloud import storage
+import concurrent.futures
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.storage import LocalBackend, backend_for, matches
+from src.manifest import default_manifest
+from src.catalog import date_of, open_catalog
+from src.job_state import default_job_store, tile_of_path
+from src import metrics
 
 # Logging konfigurieren
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -9,63 +18,162 @@ DATES_PATH       = os.getenv("DATES_PATH")
 GOOGLE_CRED_PATH = os.getenv("GOOGLE_CRED_PATH")
 BUCKET_NAME      = os.getenv("BUCKET_NAME")
 OUTPUT_PATH      = os.getenv("OUTPUT_PATH")
+UPLOAD_WORKERS   = int(os.environ.get("UPLOAD_WORKERS", 4))
+STORAGE_BACKEND  = os.environ.get("STORAGE_BACKEND", "gcs")  # "gcs" or "local"
+LOCAL_BUCKET_PATH = os.environ.get("LOCAL_BUCKET_PATH", "images/bucket")
+
+_CATALOG = None
+
+def acquisition_date(name):
+    """
+    Acquisition date of an uploaded object: the date the prediction catalog
+    lists its tile's prediction under, else the date in the tile name; None
+    for files of no scene (e.g. dates.json).
+    """
+    global _CATALOG
+    tile_id = tile_of_path(name)
+    if _CATALOG is None and DATES_PATH:
+        _CATALOG = open_catalog(DATES_PATH)
+    date = _CATALOG.date_of_file(f"{tile_id}_prediction.tif") if _CATALOG is not None else None
+    return date or date_of(tile_id)
+
+def upload_file(bucket, source_file_path, source_folder, manifest=None, delete=True):
+    """
+    Upload one file under its path relative to source_folder unless the
+    remote object already has the same checksum, verify it and only then
+    delete it locally (unless `delete` is False). `bucket` is a GCS bucket
+    or a storage backend; the manifest (default: MANIFEST_PATH) records the
+    verified object with its acquisition date. Even when the manifest knows
+    the object, the bucket is asked before the local file goes.
+    """
+    backend = backend_for(bucket)
+    manifest = manifest or default_manifest()
+    destination_blob = os.path.relpath(source_file_path, source_folder).replace("\\", "/")
 
-def upload_delete(bucket_name, source_folder, extra_file, credential):
     try:
-        client = storage.Client.from_service_account_json(credential)
-        bucket = client.bucket(bucket_name)
+        # A manifest entry alone does not justify deleting the local file: the object may have been
+        # removed or replaced behind the manifest's back, so the bucket confirms it
+        known = manifest.stat(destination_blob) if manifest is not None else None
+        remote = backend.stat(destination_blob)
+        if matches(source_file_path, remote):
+            logging.info(f"Already uploaded: {source_file_path} -> {destination_blob}")  # checksum matches
+            if known != remote and manifest is not None:
+                manifest.record_upload(destination_blob, remote, acquisition_date(destination_blob))
+            metrics.count("uploads_skipped")
+        else:
+            if matches(source_file_path, known):
+                logging.warning(f"Manifest lists {destination_blob} but the bucket copy is missing or differs; "
+                                f"uploading again")
+            start = time.time()
+            backend.upload(source_file_path, destination_blob)
+            remote = backend.stat(destination_blob)
+            if not matches(source_file_path, remote):
+                raise IOError(f"checksum mismatch after upload of {destination_blob}, keeping local file")
+            if manifest is not None:
+                manifest.record_upload(destination_blob, remote, acquisition_date(destination_blob))
+            metrics.count("bytes_out", remote["size"])
+            metrics.observe("upload_seconds", time.time() - start)
+            logging.info(f"Uploaded: {source_file_path} -> {destination_blob}")  # per-file upload
 
-        # Prüfen, ob der Ordner existiert
-        if not os.path.exists(source_folder):
-            logging.error(f"Source folder '{source_folder}' does not exist.")
-            return
+        if not delete:
+            return True
+        os.remove(source_file_path)
+        logging.info(f"Deleted: {source_file_path}")  # per-file delete
+        jobs = default_job_store()
+        if jobs is not None and source_file_path.endswith("_prediction.tif"):
+            jobs.advance_tile(tile_of_path(source_file_path), "uploaded")
+        return True
+
+    except Exception as e:
+        metrics.count("uploads_failed")
+        logging.error(f"Failed to upload {source_file_path}: {e}")  # upload error
+        return False
 
-        # Upload & Delete aller Dateien aus source_folder
-        for root, dirs, files in os.walk(source_folder):
-            for file in files:
-                source_file_path = os.path.join(root, file)
-                destination_blob = os.path.relpath(source_file_path, source_folder).replace("\\", "/")
+def upload_files(bucket, file_paths, source_folder, workers=UPLOAD_WORKERS):
+    """Upload (and verify, then delete) files with at most `workers` transfers at once; return the uploaded ones."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(file_paths, executor.map(lambda path: upload_file(bucket, path, source_folder),
+                                                    file_paths)))
+    uploaded = [path for path, ok in results.items() if ok]
+    logging.info(f"Uploaded {len(uploaded)} of {len(file_paths)} files with {workers} parallel transfers")
+    return uploaded
 
-                try:
-                    blob = bucket.blob(destination_blob)
-                    blob.upload_from_filename(source_file_path)
-                    logging.info(f"Uploaded: {source_file_path} -> {destination_blob}")  # per-file upload
+def open_bucket(bucket_name=BUCKET_NAME, credential=GOOGLE_CRED_PATH):
+    """The configured storage backend: the GCS bucket, or LOCAL_BUCKET_PATH with STORAGE_BACKEND=local."""
+    if STORAGE_BACKEND == "local":
+        return LocalBackend(os.path.join(LOCAL_BUCKET_PATH, bucket_name or "bucket"))
+    from google.cloud import storage
+    client = storage.Client.from_service_account_json(credential)
+    return client.bucket(bucket_name)
 
-                    os.remove(source_file_path)
-                    logging.info(f"Deleted: {source_file_path}")  # per-file delete
+def delete_object(bucket, name, manifest=None):
+    """Delete an object from the bucket and from the manifest."""
+    backend_for(bucket).delete(name)
+    manifest = manifest or default_manifest()
+    if manifest is not None:
+        manifest.record_delete(name)
+    logging.info(f"Deleted remote object: {name}")
 
-                except Exception as e:
-                    logging.error(f"Failed to upload {source_file_path}: {e}")  # upload error
+def upload_extra_file(bucket, extra_file, manifest=None):
+    """
+    Upload a file to the bucket root without deleting it (e.g. dates.json),
+    verified and recorded in the manifest like every other upload; return
+    False if that failed.
+    """
+    if os.path.exists(extra_file):
+        return upload_file(bucket, extra_file, os.path.dirname(extra_file), manifest, delete=False)
+    logging.warning(f"Extra file '{extra_file}' does not exist.")  # fehlende extra-file
+    return True
+
+def upload_delete(bucket_name, source_folder, extra_file, credential, reconcile=False, bucket=None):
+    """
+    Upload, verify and delete everything in source_folder; `bucket` (e.g. a
+    fake) skips opening BUCKET_NAME. Returns the files that could not be
+    uploaded; a storage error is re-raised after logging.
+    """
+    try:
+        if bucket is None:
+            bucket = open_bucket(bucket_name, credential)
+
+        # Prüfen, ob der Ordner existiert
+        if not os.path.exists(source_folder):
+            logging.error(f"Source folder '{source_folder}' does not exist.")
+            return [source_folder]
+
+        # Upload & Delete aller Dateien aus source_folder (parallel, verifiziert)
+        file_paths = [os.path.join(root, file) for root, dirs, files in os.walk(source_folder) for file in files]
+        uploaded = upload_files(bucket, file_paths, source_folder)
+        failed = [path for path in file_paths if path not in uploaded]
 
         # Extra Datei hochladen (nicht löschen!)
-        if os.path.exists(extra_file):
-            destination_blob = os.path.basename(extra_file)
-            try:
-                blob = bucket.blob(destination_blob)
-                blob.upload_from_filename(extra_file)
-                logging.info(f"Uploaded extra file: {extra_file} -> {destination_blob}")  # extra-file upload
-            except Exception as e:
-                logging.error(f"Failed to upload extra file {extra_file}: {e}")  # extra-file error
-        else:
-            logging.warning(f"Extra file '{extra_file}' does not exist.")  # fehlende extra-file
+        if not upload_extra_file(bucket, extra_file):
+            failed.append(extra_file)
 
         # Lokaler Snapshot nach Upload/Delete
         remaining_local = os.listdir(source_folder)
         logging.info(f"Directory snapshot after uploads & deletes: {remaining_local}")  # lokale Dateien
 
         # ——————————————
-        # SERVER-SNAPSHOT: liste alle Objekte, die aktuell im Bucket liegen
-        blobs = list(bucket.list_blobs())  
-        blob_names = [b.name for b in blobs]
-        logging.info(f"Server snapshot (bucket contents): {blob_names}")  # server-seitige Dateien
+        # SERVER-SNAPSHOT aus dem Manifest; die Bucket-Liste wird nur auf Wunsch abgeglichen
+        manifest = default_manifest()
+        if manifest is None:
+            logging.info(f"Server snapshot (bucket contents): {backend_for(bucket).names()}")
+        else:
+            if reconcile:
+                manifest.reconcile(backend_for(bucket))
+            logging.info(f"Server snapshot (manifest): {manifest.summary()}")  # server-seitige Dateien
+        return failed
 
     except Exception as e:
         logging.critical(f"Error initializing storage client: {e}")
+        raise
 
 if __name__ == "__main__":
-    upload_delete(
+    failed = upload_delete(
         bucket_name=BUCKET_NAME,
         source_folder=OUTPUT_PATH,
         extra_file=DATES_PATH,
-        credential=GOOGLE_CRED_PATH
-    )
\ No newline at end of file
+        credential=GOOGLE_CRED_PATH,
+        reconcile="--reconcile" in sys.argv or os.environ.get("MANIFEST_RECONCILE") == "1"
+    )
+    sys.exit(1 if failed else 0)
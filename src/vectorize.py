@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import datetime
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DAYBEFORE           = int(os.environ.get("DAYBEFORE", 2))
+VECTORIZE           = os.environ.get("VECTORIZE", "1") == "1"
+DETECTION_THRESHOLD = float(os.environ.get("DETECTION_THRESHOLD", 0.5))  # probability, 0-1
+MIN_DETECTION_PIXELS = int(os.environ.get("MIN_DETECTION_PIXELS", 1))
+VECTOR_FORMAT       = os.environ.get("VECTOR_FORMAT", "FlatGeobuf")      # "FlatGeobuf" or "GeoJSON"
+
+SCORE_SCALE = 1 / 255  # Byte prediction value -> probability
+EXTENSIONS = {"FlatGeobuf": ".fgb", "GeoJSON": ".geojson"}
+
+
+def vector_path(prediction_path, vector_format=VECTOR_FORMAT):
+    """{tile}_detections.fgb/.geojson next to {tile}_prediction.tif."""
+    base = prediction_path[:-len("_prediction.tif")] if prediction_path.endswith("_prediction.tif") \
+        else os.path.splitext(prediction_path)[0]
+    return f"{base}_detections{EXTENSIONS[vector_format]}"
+
+
+def detection_window(mask):
+    """Bounding window (xoff, yoff, xsize, ysize) of all True pixels, or None."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+
+def mem_raster(array, geotransform, projection):
+    """Single-band in-memory dataset holding `array`."""
+    types = {np.uint8: gdal.GDT_Byte, np.int32: gdal.GDT_Int32}
+    ds = gdal.GetDriverByName("MEM").Create("", array.shape[1], array.shape[0], 1, types[array.dtype.type])
+    ds.SetGeoTransform(geotransform)
+    ds.SetProjection(projection)
+    ds.GetRasterBand(1).WriteArray(array)
+    return ds
+
+
+def vectorize_prediction(prediction_path, output_path=None, threshold=DETECTION_THRESHOLD,
+                         date=None, vector_format=VECTOR_FORMAT):
+    """
+    Threshold a prediction raster and write one polygon per connected
+    detection (8-connected) in EPSG:4326 with tile_id, date, pixels, area_m2,
+    max_score and mean_score. Only the bounding window of the detections is
+    polygonized, so sparse rasters cost little beyond one read.
+    Returns (output_path, number of polygons).
+    """
+    start = time.time()
+    output_path = output_path or vector_path(prediction_path, vector_format)
+    tile_id = os.path.basename(prediction_path).replace("_prediction.tif", "")
+    date = date or (datetime.date.today() - datetime.timedelta(days=DAYBEFORE)).isoformat()
+
+    ds = gdal.Open(prediction_path)
+    if ds is None:
+        raise FileNotFoundError(f"Cannot open {prediction_path}")
+    scores = ds.GetRasterBand(1).ReadAsArray()
+    mask = scores >= np.ceil(threshold / SCORE_SCALE)
+    x0, dx, rx, y0, ry, dy = ds.GetGeoTransform()
+    source_srs = osr.SpatialReference()
+    source_srs.ImportFromWkt(ds.GetProjection())
+    source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    target_srs = osr.SpatialReference()
+    target_srs.ImportFromEPSG(4326)
+    target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    to_wgs84 = osr.CoordinateTransformation(source_srs, target_srs)
+
+    # Output layer
+    driver = ogr.GetDriverByName(vector_format)
+    temp_path = f"{os.path.splitext(output_path)[0]}.tmp{os.path.splitext(output_path)[1]}"
+    if os.path.exists(temp_path):
+        driver.DeleteDataSource(temp_path)
+    out = driver.CreateDataSource(temp_path)
+    layer = out.CreateLayer("detections", srs=target_srs, geom_type=ogr.wkbMultiPolygon)
+    for name, field_type in (("tile_id", ogr.OFTString), ("date", ogr.OFTString), ("pixels", ogr.OFTInteger),
+                             ("area_m2", ogr.OFTReal), ("max_score", ogr.OFTReal), ("mean_score", ogr.OFTReal)):
+        layer.CreateField(ogr.FieldDefn(name, field_type))
+
+    count = 0
+    window = detection_window(mask)
+    if window is not None:
+        xoff, yoff, xsize, ysize = window
+        geotransform = (x0 + xoff * dx + yoff * rx, dx, rx, y0 + xoff * ry + yoff * dy, ry, dy)
+        sub_mask = mask[yoff:yoff + ysize, xoff:xoff + xsize].astype(np.uint8)
+        sub_scores = scores[yoff:yoff + ysize, xoff:xoff + xsize]
+        mask_ds = mem_raster(sub_mask, geotransform, ds.GetProjection())
+
+        # Connected components → polygons (only mask pixels become features)
+        polygons = (ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")).CreateDataSource("components")
+        components = polygons.CreateLayer("components", srs=source_srs, geom_type=ogr.wkbPolygon)
+        components.CreateField(ogr.FieldDefn("value", ogr.OFTInteger))
+        components.CreateField(ogr.FieldDefn("label", ogr.OFTInteger))
+        band = mask_ds.GetRasterBand(1)
+        gdal.Polygonize(band, band, components, 0, ["8CONNECTED=8"])
+
+        # Number the polygons, burn the numbers back into a label image and aggregate scores with bincount
+        fids = []
+        for label, feature in enumerate(components, start=1):
+            feature.SetField("label", label)
+            components.SetFeature(feature)
+            fids.append(feature.GetFID())
+        labels = mem_raster(np.zeros(sub_mask.shape, dtype=np.int32), geotransform, ds.GetProjection())
+        gdal.RasterizeLayer(labels, [1], components, options=["ATTRIBUTE=label"])
+        label_image = labels.GetRasterBand(1).ReadAsArray()
+        label_image[sub_mask == 0] = 0
+
+        flat_labels = label_image.ravel()
+        flat_scores = sub_scores.ravel().astype(np.float64)
+        pixels = np.bincount(flat_labels, minlength=len(fids) + 1)
+        sums = np.bincount(flat_labels, weights=flat_scores, minlength=len(fids) + 1)
+        maxima = np.zeros(len(fids) + 1)
+        np.maximum.at(maxima, flat_labels, flat_scores)
+
+        for label, fid in enumerate(fids, start=1):
+            if pixels[label] < MIN_DETECTION_PIXELS:
+                continue
+            geometry = components.GetFeature(fid).GetGeometryRef().Clone()
+            area = geometry.GetArea() if source_srs.IsProjected() else None
+            geometry.Transform(to_wgs84)
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(ogr.ForceToMultiPolygon(geometry))
+            feature.SetField("tile_id", tile_id)
+            feature.SetField("date", date)
+            feature.SetField("pixels", int(pixels[label]))
+            if area is not None:
+                feature.SetField("area_m2", round(area, 1))
+            feature.SetField("max_score", round(maxima[label] * SCORE_SCALE, 4))
+            feature.SetField("mean_score", round(sums[label] / pixels[label] * SCORE_SCALE, 4))
+            layer.CreateFeature(feature)
+            count += 1
+
+    out = None
+    os.replace(temp_path, output_path)
+    logging.info(f"Vectorized {os.path.basename(prediction_path)}: {count} detections >= {threshold} "
+                 f"-> {os.path.basename(output_path)} ({os.path.getsize(output_path) / 1e3:.1f} kB) "
+                 f"in {time.time() - start:.1f}s")
+    return output_path, count
+
+
+def vectorize_predictions(prediction_paths, date=None):
+    """Vectorize several predictions; return the written vector paths."""
+    written = []
+    for prediction_path in prediction_paths:
+        try:
+            written.append(vectorize_prediction(prediction_path, date=date)[0])
+        except Exception as e:
+            logging.error(f"Vectorizing {prediction_path} failed: {e}")
+    return written
@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import numpy as np
+from osgeo import gdal
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PATCH_SIZE = int(os.environ.get("PATCH_SIZE", 480))
+PATCH_OVERLAP = int(os.environ.get("PATCH_OVERLAP", 64))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 8))
+INPUT_SCALE = float(os.environ.get("INPUT_SCALE", 1 / 255))  # merged tiles are Byte-rescaled reflectance
+OUTPUT_COPTS = ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]
+
+# Input channels of the marinedebrisdetector checkpoints, in order (its L2ABANDS); L1C tiles also carry B10
+MODEL_BANDS = ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12"]
+L1C_BANDS = MODEL_BANDS[:10] + ["B10"] + MODEL_BANDS[10:]
+
+
+def patch_starts(length, patch_size, stride):
+    """Offsets of overlapping patches along one axis; the last patch is flush with the edge."""
+    if length <= patch_size:
+        return [0]
+    starts = list(range(0, length - patch_size + 1, stride))
+    if starts[-1] != length - patch_size:
+        starts.append(length - patch_size)
+    return starts
+
+
+def blend_weights(patch_size, overlap):
+    """2-D weights that ramp down linearly across the overlap so neighbouring patches cross-fade."""
+    ramp = np.ones(patch_size, dtype=np.float32)
+    if overlap > 0:
+        edge = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+
+def model_band_numbers(ds):
+    """
+    1-based numbers of the tile bands to feed the model, in MODEL_BANDS
+    order. Bands are found by their descriptions (B02, ...); tiles without
+    them are taken to hold the 12 L2A or 13 L1C bands in merge order (the
+    sorted band files), like the scene predictor drops B10 from L1C tiles.
+    Raises if a band the model needs is missing, e.g. left out by
+    MERGE_BANDS.
+    """
+    names = [ds.GetRasterBand(i).GetDescription() for i in range(1, ds.RasterCount + 1)]
+    if not all(names):
+        if ds.RasterCount not in (len(MODEL_BANDS), len(L1C_BANDS)):
+            raise ValueError(f"Tile has {ds.RasterCount} unnamed bands; the model needs the "
+                             f"{len(MODEL_BANDS)} bands {MODEL_BANDS}")
+        names = sorted(MODEL_BANDS if ds.RasterCount == len(MODEL_BANDS) else L1C_BANDS)
+    numbers = {name: number for number, name in enumerate(names, start=1)}
+    missing = [name for name in MODEL_BANDS if name not in numbers]
+    if missing:
+        raise ValueError(f"Tile lacks the bands {missing} the model was trained on (see MERGE_BANDS)")
+    return [numbers[name] for name in MODEL_BANDS]
+
+
+def torch_batch_predictor(model, device):
+    """
+    Wrap a segmentation model as a (N, C, H, W) -> (N, H, W) probability
+    function; C must be the len(MODEL_BANDS) channels it was trained on.
+    """
+    import torch
+
+    def predict_batch(batch):
+        if batch.shape[1] != len(MODEL_BANDS):
+            raise ValueError(f"Model expects {len(MODEL_BANDS)} bands, got {batch.shape[1]}")
+        with torch.no_grad():
+            logits = model(torch.from_numpy(batch).to(device))
+            return torch.sigmoid(logits)[:, 0].cpu().numpy()
+
+    return predict_batch
+
+
+def read_patch(ds, x, y, patch_size, bands=None):
+    """Read one window of `bands` (default all), zero-padded to patch_size at the raster edge."""
+    width = min(patch_size, ds.RasterXSize - x)
+    height = min(patch_size, ds.RasterYSize - y)
+    data = ds.ReadAsArray(x, y, width, height, band_list=bands)
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    if width < patch_size or height < patch_size:
+        data = np.pad(data, ((0, 0), (0, patch_size - height), (0, patch_size - width)))
+    return data
+
+
+def predict_windowed(input_path, output_path, predict_batch, patch_size=PATCH_SIZE,
+                     overlap=PATCH_OVERLAP, batch_size=BATCH_SIZE, input_scale=INPUT_SCALE, bands=None):
+    """
+    Predict a full tile in overlapping patches and write the blended probabilities as Byte.
+    `bands` (1-based numbers) defaults to the model's bands, see model_band_numbers.
+
+    Only one row of patches is held at a time: scores are accumulated in a
+    (patch_size x width) strip, and the rows no later patch can touch are
+    written out before the strip slides down, so memory does not grow with
+    the tile height.
+    """
+    start = time.time()
+    src = gdal.Open(input_path)
+    if src is None:
+        raise FileNotFoundError(f"Cannot open {input_path}")
+    xsize, ysize = src.RasterXSize, src.RasterYSize
+    bands = bands or model_band_numbers(src)
+
+    driver = gdal.GetDriverByName("GTiff")
+    dst = driver.Create(output_path, xsize, ysize, 1, gdal.GDT_Byte, options=OUTPUT_COPTS)
+    dst.SetGeoTransform(src.GetGeoTransform())
+    dst.SetProjection(src.GetProjection())
+    out_band = dst.GetRasterBand(1)
+
+    stride = max(patch_size - overlap, 1)
+    weights = blend_weights(patch_size, overlap)
+    xs = patch_starts(xsize, patch_size, stride)
+    ys = patch_starts(ysize, patch_size, stride)
+
+    strip_width = max(xsize, patch_size)
+    scores = np.zeros((patch_size, strip_width), dtype=np.float32)
+    weight_sum = np.zeros_like(scores)
+    valid = np.zeros((patch_size, strip_width), dtype=bool)
+
+    for row, y in enumerate(ys):
+        for i in range(0, len(xs), batch_size):
+            batch_xs = xs[i:i + batch_size]
+            patches = [read_patch(src, x, y, patch_size, bands) for x in batch_xs]
+            batch = np.stack(patches).astype(np.float32) * input_scale
+            probabilities = predict_batch(batch)
+            for x, patch, probability in zip(batch_xs, patches, probabilities):
+                scores[:, x:x + patch_size] += probability * weights
+                weight_sum[:, x:x + patch_size] += weights
+                valid[:, x:x + patch_size] |= patch.any(axis=0)
+
+        # Rows above the next patch row are final; flush them and slide the strip
+        next_y = ys[row + 1] if row + 1 < len(ys) else min(y + patch_size, ysize)
+        done = next_y - y
+        rows = min(done, ysize - y)
+        blended = scores[:rows, :xsize] / np.maximum(weight_sum[:rows, :xsize], 1e-6)
+        blended[~valid[:rows, :xsize]] = 0
+        out_band.WriteArray(np.rint(blended * 255).astype(np.uint8), 0, y)
+
+        for buffer in (scores, weight_sum, valid):
+            buffer[:patch_size - done] = buffer[done:]
+            buffer[patch_size - done:] = 0
+
+    out_band.FlushCache()
+    dst = None
+    src = None
+    logging.info(f"Windowed prediction of {os.path.basename(input_path)} ({xsize}x{ysize}, "
+                 f"{len(xs) * len(ys)} patches) finished in {time.time() - start:.1f}s")
+    return output_path
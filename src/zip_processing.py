@@ -1,11 +1,226 @@
 import os
+import sys
+import time
 import zipfile
 import glob
 import json
 import shutil
+import fnmatch
+import logging
+import numpy as np
 from osgeo import gdal
 
-def process_zip(zip_path):
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.scheduler import MB, available_memory, cpu_count, run_pool, worker_count
+from src.tile_cache import default_cache
+from src.aoi import aoi_hash, clip_window, default_aoi, mask_outside, to_raster_crs
+from src import metrics
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+INPUT_PATH = os.getenv("INPUT_PATH")
+ZIP_MODE = os.environ.get("ZIP_MODE", "vsizip")  # "vsizip" (read bands in place) or "extract"
+ZIP_WORKERS = int(os.environ["ZIP_WORKERS"]) if os.getenv("ZIP_WORKERS") else None  # optional cap
+ZIP_TASK_MEMORY_MB = int(os.environ.get("ZIP_TASK_MEMORY_MB", 768))  # GDAL cache plus VRT/translate overhead
+GDAL_CACHE_SHARE = float(os.environ.get("GDAL_CACHE_SHARE", 0.5))  # part of a task's memory budget for GDAL_CACHEMAX
+MERGE_ENGINE = os.environ.get("MERGE_ENGINE", "numpy")  # "numpy" (windowed rescale) or "gdal" (Translate, Byte only)
+MERGE_DTYPE  = os.environ.get("MERGE_DTYPE", "Byte")    # Byte, UInt16 or Float16
+MERGE_BANDS  = [b.strip() for b in os.environ.get("MERGE_BANDS", "").split(",") if b.strip()]  # empty = all B*.tif
+MERGE_SCALES = json.loads(os.environ.get("MERGE_SCALES", "{}"))  # per band: {"B08": [src_min, src_max, dst_min, dst_max]}
+MERGE_WINDOW_ROWS = int(os.environ.get("MERGE_WINDOW_ROWS", 256))
+
+# Default rescale per output type: Byte as before, UInt16 keeps the raw reflectance, Float16 is reflectance 0-1
+DEFAULT_SCALES = {"Byte": [0, 10000, 0, 255], "UInt16": [0, 10000, 0, 10000], "Float16": [0, 10000, 0, 1]}
+REFLECTANCE_QUANTIFICATION = 10000  # Sentinel-2 L2A digital number of reflectance 1.0
+# GDAL type and creation options per output type; Float16 is stored as 16-bit floats via NBITS
+OUTPUT_TYPES = {
+    "Byte":    (gdal.GDT_Byte,    ["PREDICTOR=2"]),
+    "UInt16":  (gdal.GDT_UInt16,  ["PREDICTOR=2"]),
+    "Float16": (gdal.GDT_Float32, ["NBITS=16"]),
+}
+OUTPUT_COPTS = ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]
+
+# Everything that changes the content of a merged tile; part of the tile cache key
+MERGE_PARAMS = {"scale": DEFAULT_SCALES[MERGE_DTYPE], "output_type": MERGE_DTYPE, "nodata": 0,
+                "bands": MERGE_BANDS, "scales": MERGE_SCALES, "engine": MERGE_ENGINE}
+
+def merge_params():
+    """MERGE_PARAMS plus the AOI tiles are clipped to, if any."""
+    return dict(MERGE_PARAMS, aoi=aoi_hash(default_aoi()))
+
+def parse_tile_id(metadata_content):
+    """Return the TILE_ID from the text of a Sentinel-2 metadata.xml."""
+    start_tag = '<TILE_ID metadataLevel="Brief">'
+    end_tag = '</TILE_ID>'
+    start_index = metadata_content.find(start_tag)
+    end_index = metadata_content.find(end_tag, start_index)
+    if start_index == -1 or end_index == -1:
+        raise ValueError("TILE_ID not found in metadata.xml")
+    return metadata_content[start_index + len(start_tag):end_index].strip()
+
+def read_tile_id(zip_path):
+    """Read the TILE_ID from metadata.xml inside the zip without extracting anything."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if 'metadata.xml' not in zip_ref.namelist():
+            raise FileNotFoundError("metadata.xml not found in ZIP.")
+        return parse_tile_id(zip_ref.read('metadata.xml').decode('utf-8'))
+
+def band_members(zip_path):
+    """Names of the top-level B*.tif band files inside the zip, sorted like the extracted glob."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return sorted(name for name in zip_ref.namelist()
+                      if '/' not in name and fnmatch.fnmatchcase(name, 'B*.tif'))
+
+def band_name(tif_file):
+    """B02 from .../B02.tif."""
+    return os.path.splitext(os.path.basename(tif_file))[0]
+
+def select_bands(tif_files, bands=MERGE_BANDS):
+    """The band files named in `bands` (all of them if empty), in their original order."""
+    if not bands:
+        return tif_files
+    selected = [tif_file for tif_file in tif_files if band_name(tif_file) in bands]
+    missing = set(bands) - {band_name(tif_file) for tif_file in selected}
+    if missing:
+        raise ValueError(f"Bands {sorted(missing)} not found in the archive")
+    return selected
+
+def band_scale(name, dtype=MERGE_DTYPE):
+    """[src_min, src_max, dst_min, dst_max] of one band."""
+    return MERGE_SCALES.get(name, DEFAULT_SCALES[dtype])
+
+def rescale_windowed(output_path, vrt, names, src_window=None, dtype=MERGE_DTYPE, window_rows=MERGE_WINDOW_ROWS):
+    """
+    Rescale the stacked VRT into a GeoTIFF of `dtype`, reading strips of
+    window_rows rows and scaling all bands at once with NumPy. Writes are
+    compressed on this worker's share of the cores (worker_threads). Each
+    band's scale/offset is set so that value * scale + offset is the
+    reflectance.
+    """
+    xoff, yoff, xsize, ysize = src_window or (0, 0, vrt.RasterXSize, vrt.RasterYSize)
+    gdal_type, type_options = OUTPUT_TYPES[dtype]
+    output = gdal.GetDriverByName("GTiff").Create(output_path, xsize, ysize, len(names), gdal_type,
+                                                  OUTPUT_COPTS + type_options + [f"NUM_THREADS={worker_threads()}"])
+    x0, dx, rx, y0, ry, dy = vrt.GetGeoTransform()
+    output.SetGeoTransform((x0 + xoff * dx + yoff * rx, dx, rx, y0 + xoff * ry + yoff * dy, ry, dy))
+    output.SetProjection(vrt.GetProjection())
+
+    scales = np.array([band_scale(name, dtype) for name in names], dtype=np.float32)
+    src_min, src_max, dst_min, dst_max = (scales[:, i].reshape(-1, 1, 1) for i in range(4))
+    factor = (dst_max - dst_min) / (src_max - src_min)
+    nodata = MERGE_PARAMS["nodata"]
+
+    for row in range(0, ysize, window_rows):
+        rows = min(window_rows, ysize - row)
+        data = vrt.ReadAsArray(xoff, yoff + row, xsize, rows).astype(np.float32).reshape(len(names), rows, xsize)
+        valid = data != nodata
+        scaled = np.clip((data - src_min) * factor + dst_min, dst_min, dst_max)
+        if dtype != "Float16":
+            np.rint(scaled, out=scaled)
+        scaled[~valid] = nodata
+        for number in range(len(names)):
+            output.GetRasterBand(number + 1).WriteArray(scaled[number], 0, row)
+
+    for number, (s_min, s_max, d_min, d_max) in enumerate(scales, start=1):
+        band = output.GetRasterBand(number)
+        band.SetNoDataValue(nodata)
+        # value -> digital number -> reflectance
+        k = (s_max - s_min) / (d_max - d_min)
+        band.SetScale(float(k / REFLECTANCE_QUANTIFICATION))
+        band.SetOffset(float((s_min - d_min * k) / REFLECTANCE_QUANTIFICATION))
+    output = None
+
+def check_engine(engine=MERGE_ENGINE, dtype=MERGE_DTYPE, scales=MERGE_SCALES):
+    """Raise ValueError for a merge engine that cannot produce the configured output."""
+    if engine not in ("numpy", "gdal"):
+        raise ValueError(f"Unknown MERGE_ENGINE {engine!r}, use 'numpy' or 'gdal'")
+    if engine == "gdal" and (dtype != "Byte" or scales):
+        raise ValueError(f"MERGE_ENGINE=gdal only writes Byte tiles with the default scale "
+                         f"(MERGE_DTYPE={dtype}, MERGE_SCALES={scales}); use MERGE_ENGINE=numpy")
+
+def merge_bands(output_path, vrt_filename, tif_files, aoi=None, engine=MERGE_ENGINE, dtype=MERGE_DTYPE,
+                bands=MERGE_BANDS):
+    """
+    Stack the selected bands into a VRT and rescale it into the final
+    GeoTIFF, windowed with NumPy (any MERGE_DTYPE) or with gdal.Translate
+    (Byte). With an AOI only its bounding box is read and rescaled, and
+    pixels outside the polygon are set to NoData.
+    """
+    check_engine(engine, dtype)
+    tif_files = select_bands(tif_files, bands)
+    # Use GDAL to merge bands into one file
+    vrt_options = gdal.BuildVRTOptions(separate=True, srcNodata=0, VRTNodata=0)
+    vrt = gdal.BuildVRT(vrt_filename, tif_files, options=vrt_options)
+
+    src_window = None
+    if aoi is not None:
+        geometry = to_raster_crs(aoi, vrt)
+        src_window = clip_window(vrt, geometry)
+        if src_window is None:
+            raise ValueError(f"{os.path.basename(output_path)} does not intersect the AOI")
+        logging.info(f"Clipping {os.path.basename(output_path)} to AOI window {src_window} "
+                     f"of {vrt.RasterXSize}x{vrt.RasterYSize}")
+
+    if engine == "gdal":
+        vrt = None
+        # Convert to final GeoTIFF with scaling and NoData handling
+        gdal.Translate(output_path, vrt_filename, format='GTiff',
+                       srcWin=src_window,                   # AOI bounding box (None = whole tile)
+                       scaleParams=[MERGE_PARAMS["scale"]],  # Rescale brightness
+                       outputType=gdal.GDT_Byte,            # Ensure Byte (0-255)
+                       noData=MERGE_PARAMS["nodata"])       # Preserve NoData
+    else:
+        rescale_windowed(output_path, vrt, [band_name(tif_file) for tif_file in tif_files], src_window, dtype)
+        vrt = None
+
+    output = gdal.Open(output_path, gdal.GA_Update)
+    if aoi is not None:
+        mask_outside(output, geometry, MERGE_PARAMS["nodata"])
+
+    # Name the bands (B02, B03, ...) so later stages can find them without relying on order
+    for number, tif_file in enumerate(tif_files, start=1):
+        output.GetRasterBand(number).SetDescription(band_name(tif_file))
+    metrics.count("pixels", output.RasterXSize * output.RasterYSize * output.RasterCount)
+    output = None
+
+def process_zip(zip_path, mode=ZIP_MODE, clip=True, **merge_options):
+    """
+    Merge the band files of a Sentinel-2 zip into {TILE_ID}.tif next to it,
+    clipped to the configured AOI unless clip is False; return its path.
+    merge_options (engine, dtype, bands) override the MERGE_* settings.
+    """
+    aoi = default_aoi() if clip else None
+    if mode == "extract":
+        return process_zip_extracted(zip_path, aoi, **merge_options)
+    return process_zip_vsizip(zip_path, aoi, **merge_options)
+
+def process_zip_vsizip(zip_path, aoi=None, **merge_options):
+    """
+    Read the bands in place through /vsizip/ and keep the VRT in /vsimem/,
+    so nothing but the final GeoTIFF is written to disk.
+    """
+    tif_members = band_members(zip_path)
+    if not tif_members:
+        raise ValueError("No .tif files starting with 'B' found in the ZIP.")
+
+    tile_id = read_tile_id(zip_path)
+    output_filename = f"{tile_id}.tif"
+    output_path = os.path.join(os.path.dirname(zip_path), output_filename)
+
+    archive = os.path.abspath(zip_path)
+    tif_files = [f"/vsizip/{archive}/{member}" for member in tif_members]
+    vrt_filename = f"/vsimem/{tile_id}.vrt"
+    try:
+        merge_bands(output_path, vrt_filename, tif_files, aoi, **merge_options)
+    finally:
+        gdal.Unlink(vrt_filename)
+
+    os.remove(zip_path)  # Delete ZIP file
+
+    print(f"Processing complete. Output file: {output_filename}")
+    return output_path
+
+def process_zip_extracted(zip_path, aoi=None, **merge_options):
     # Extract ZIP file
     extract_dir = os.path.splitext(zip_path)[0]
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -22,34 +237,103 @@ def process_zip(zip_path):
         raise FileNotFoundError("metadata.xml not found in extracted files.")
 
     with open(metadata_file, 'r') as meta:
-        metadata_content = meta.read()
-        start_tag = '<TILE_ID metadataLevel="Brief">'
-        end_tag = '</TILE_ID>'
-        start_index = metadata_content.find(start_tag) + len(start_tag)
-        end_index = metadata_content.find(end_tag, start_index)
-        if start_index == -1 or end_index == -1:
-            raise ValueError("TILE_ID not found in metadata.xml")
-        tile_id = metadata_content[start_index:end_index].strip()
+        tile_id = parse_tile_id(meta.read())
 
     # Define output filename
     output_filename = f"{tile_id}.tif"
     output_path = os.path.join(os.path.dirname(zip_path), output_filename)
 
-    # Use GDAL to merge bands into one file
-    vrt_options = gdal.BuildVRTOptions(separate=True, srcNodata=0, VRTNodata=0)
     vrt_filename = output_path.replace('.tif', '.vrt')
-    
-    gdal.BuildVRT(vrt_filename, tif_files, options=vrt_options)
-
-    # Convert to final GeoTIFF with scaling and NoData handling
-    gdal.Translate(output_path, vrt_filename, format='GTiff',
-                   scaleParams=[[0, 10000, 0, 255]],  # Rescale brightness
-                   outputType=gdal.GDT_Byte,         # Ensure Byte (0-255)
-                   noData=0)                         # Preserve NoData
+    merge_bands(output_path, vrt_filename, tif_files, aoi, **merge_options)
 
     # Cleanup extracted files, intermediate VRT, and ZIP file
     shutil.rmtree(extract_dir, ignore_errors=True)  # Delete extracted folder
     os.remove(zip_path)  # Delete ZIP file
     os.remove(vrt_filename)  # Delete intermediate VRT file
-    
-    print(f"Processing complete. Output file: {output_filename}")
\ No newline at end of file
+
+    print(f"Processing complete. Output file: {output_filename}")
+    return output_path
+
+def gdal_budget(workers, task_memory_mb=ZIP_TASK_MEMORY_MB):
+    """
+    GDAL cache and threads of each of `workers` processes. The cache is
+    GDAL_CACHE_SHARE of the per-task memory the pool was sized with (and
+    never more than an even share of the free RAM), so caches and task
+    overhead together stay within what worker_count planned for; the cores
+    are split evenly.
+    """
+    share = min(task_memory_mb * GDAL_CACHE_SHARE, available_memory() / MB / workers)
+    cache_mb = max(int(share), 64)
+    threads = max(cpu_count() // workers, 1)
+    return cache_mb, threads
+
+def init_gdal_worker(cache_mb, threads):
+    """Process pool initializer: apply this worker's share of GDAL cache and threads."""
+    gdal.SetConfigOption("GDAL_CACHEMAX", str(cache_mb))
+    gdal.SetConfigOption("GDAL_NUM_THREADS", str(threads))
+
+def worker_threads():
+    """The GDAL_NUM_THREADS init_gdal_worker gave this process, for NUM_THREADS creation options."""
+    return gdal.GetConfigOption("GDAL_NUM_THREADS") or "1"
+
+def convert_archive(zip_path):
+    """
+    Merge one zip unless its {TILE_ID}.tif already exists and is newer or is
+    in the tile cache; report the time taken.
+    """
+    start = time.time()
+    tile_id = read_tile_id(zip_path)
+    output_path = os.path.join(os.path.dirname(zip_path), f"{tile_id}.tif")
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(zip_path):
+        logging.info(f"Skipping {os.path.basename(zip_path)}: {os.path.basename(output_path)} is up to date")
+        metrics.count("archives_skipped")
+        return {"output": output_path, "skipped": True, "seconds": 0.0}
+
+    cache = default_cache()
+    if cache is not None and cache.get("merged", tile_id, merge_params(), output_path):
+        os.remove(zip_path)
+        metrics.count("archives_skipped")
+        return {"output": output_path, "skipped": True, "seconds": time.time() - start}
+
+    metrics.count("bytes_in", os.path.getsize(zip_path))
+    output_path = process_zip(zip_path)
+    metrics.count("bytes_out", os.path.getsize(output_path))
+    if cache is not None:
+        cache.put("merged", tile_id, merge_params(), output_path)
+    seconds = time.time() - start
+    logging.info(f"Merged {os.path.basename(zip_path)} in {seconds:.1f}s")
+    return {"output": output_path, "skipped": False, "seconds": seconds}
+
+def process_all(input_path=INPUT_PATH, max_workers=ZIP_WORKERS):
+    """Merge every .zip in input_path in parallel worker processes; return {zip_path: result}."""
+    zip_files = sorted(glob.glob(os.path.join(input_path, "*.zip")))
+    if not zip_files:
+        logging.info(f"No ZIP archives found in {input_path}")
+        return {}
+    check_engine()  # fail once here rather than once per archive
+
+    workers = min(worker_count(ZIP_TASK_MEMORY_MB * MB, max_workers, label="zip processing"), len(zip_files))
+    cache_mb, threads = gdal_budget(workers)
+    logging.info(f"Merging {len(zip_files)} archives with {workers} workers, "
+                 f"GDAL_CACHEMAX={cache_mb} MB and GDAL_NUM_THREADS={threads} each")
+    start = time.time()
+    with metrics.stage("merge"):
+        results = run_pool(convert_archive, zip_files, workers, initializer=init_gdal_worker,
+                           initargs=(cache_mb, threads), label="archives")
+
+    for zip_path, result in results.items():
+        if result is None:
+            logging.error(f"Failed to merge {os.path.basename(zip_path)}")
+        elif result["skipped"]:
+            logging.info(f"{os.path.basename(zip_path)}: skipped (up to date)")
+        else:
+            logging.info(f"{os.path.basename(zip_path)}: {result['seconds']:.1f}s")
+    logging.info(f"ZIP processing finished in {time.time() - start:.1f}s")
+    return results
+
+if __name__ == "__main__":
+    if not INPUT_PATH:
+        logging.error("INPUT_PATH must be set as environment variable")
+        exit(1)
+
+    process_all(INPUT_PATH)
@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# The stage modules read their settings at import time; keep the tests off the tile cache,
+# the job store, the upload manifest and the deployment's AOI (pool workers inherit these)
+os.environ.setdefault("CACHE_MAX_GB", "0")
+os.environ.setdefault("JOB_STATE_PATH", "")
+os.environ.setdefault("MANIFEST_PATH", "")
+os.environ.setdefault("CLIP_TO_AOI", "0")
+os.environ.setdefault("ORDER_POLL_MIN_SECONDS", "0.05")
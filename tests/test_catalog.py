@@ -0,0 +1,66 @@
+import json
+import pytest
+
+from src.catalog import PredictionCatalog, date_of, open_catalog, tile_of
+
+A = "S2A_MSIL2A_20240601T101031_N0510_R022_T33TUL_20240601T150000_prediction.tif"
+B = "S2B_MSIL2A_20240602T101031_N0510_R022_T33TUM_20240602T150000_prediction.tif"
+C = "S2A_MSIL2A_20240605T101031_N0510_R022_T33TUL_20240605T150000_prediction.tif"
+
+
+def write_json(path, json_data):
+    with open(path, "w") as f:
+        json.dump(json_data, f)
+    return str(path)
+
+
+def test_file_names_give_tile_and_date():
+    assert (tile_of(A), date_of(A)) == ("T33TUL", "2024-06-01")
+    assert (tile_of("dates.json"), date_of("dates.json")) == (None, None)
+
+
+def test_import_drops_duplicates(tmp_path):
+    dates_path = write_json(tmp_path / "dates.json", {"2024-06-01": [A, A], "2024-06-02": [B, B, A]})
+
+    catalog = open_catalog(dates_path)
+
+    assert catalog.count() == 3
+    assert catalog.files_for_date("2024-06-01") == [A]
+    catalog.add("2024-06-01", [A])  # known files are ignored
+    assert catalog.count() == 3
+
+
+def test_corrupt_dates_json_raises_and_leaves_no_catalog(tmp_path):
+    dates_path = tmp_path / "dates.json"
+    dates_path.write_text('{"2024-06-01": [')
+
+    with pytest.raises(ValueError, match="not valid JSON"):
+        open_catalog(str(dates_path))
+    assert not (tmp_path / "dates.sqlite").exists()
+
+
+def test_export_import_round_trip(tmp_path):
+    catalog = PredictionCatalog(str(tmp_path / "first.sqlite"))
+    catalog.add_many([("2024-06-05", C), ("2024-06-01", A), ("2024-06-02", B)])
+
+    exported = catalog.export_dates_json(str(tmp_path / "dates.json"))
+    copy = PredictionCatalog(str(tmp_path / "second.sqlite"))
+    copy.import_dates_json(str(tmp_path / "dates.json"))
+
+    assert exported == {"2024-06-01": [A], "2024-06-02": [B], "2024-06-05": [C]}
+    with open(str(tmp_path / "dates.json")) as f:
+        assert json.load(f) == exported
+    assert copy.export_dates_json(str(tmp_path / "copy.json")) == exported
+    assert not [path for path in tmp_path.iterdir() if path.suffix == ".tmp"]
+
+
+def test_date_range_and_tile_queries(tmp_path):
+    catalog = PredictionCatalog(str(tmp_path / "dates.sqlite"))
+    catalog.add_many([("2024-06-01", A), ("2024-06-02", B), ("2024-06-05", C)])
+
+    assert catalog.date_range("2024-06-01", "2024-06-02") == {"2024-06-01": [A], "2024-06-02": [B]}
+    assert catalog.date_range("2024-06-03", "2024-06-04") == {}
+    assert catalog.for_tile("T33TUL") == [("2024-06-01", A), ("2024-06-05", C)]
+    assert catalog.for_tile("T33TUL", start="2024-06-02") == [("2024-06-05", C)]
+    assert catalog.for_tile("T33TUL", end="2024-06-01") == [("2024-06-01", A)]
+    assert catalog.date_of_file(C) == "2024-06-05"
@@ -0,0 +1,54 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+gdal = pytest.importorskip("osgeo.gdal")
+osr = pytest.importorskip("osgeo.osr")
+
+from src import convert
+from src.job_state import JobStore
+
+SIZE = 1024  # large enough for the COG driver to add overviews
+
+
+def write_prediction(path):
+    """Striped (not tiled) Byte GeoTIFF, as the prediction step writes it."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32633)
+    ds = gdal.GetDriverByName("GTiff").Create(path, SIZE, SIZE, 1, gdal.GDT_Byte)
+    ds.SetGeoTransform((500000, 10, 0, 5000000, 0, -10))
+    ds.SetProjection(srs.ExportToWkt())
+    scores = (np.arange(SIZE * SIZE) % 256).astype(np.uint8).reshape(SIZE, SIZE)
+    ds.GetRasterBand(1).WriteArray(scores)
+    ds = None
+    return path, scores
+
+
+def test_convert_file_writes_cog_with_overviews(tmp_path):
+    path, scores = write_prediction(str(tmp_path / "T33TUL_prediction.tif"))
+
+    stats = convert.convert_file(path)
+
+    ds = gdal.Open(path)
+    assert ds.GetMetadataItem("LAYOUT", "IMAGE_STRUCTURE") == "COG"
+    assert ds.GetRasterBand(1).GetOverviewCount() > 0
+    assert ds.GetRasterBand(1).GetBlockSize()[0] < SIZE  # tiled, not striped
+    np.testing.assert_array_equal(ds.GetRasterBand(1).ReadAsArray(), scores)
+    assert stats["file"] == "T33TUL_prediction.tif"
+    assert os.listdir(str(tmp_path)) == ["T33TUL_prediction.tif"]  # no temp file left behind
+
+
+def test_converted_tile_is_skipped(tmp_path, monkeypatch):
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(convert, "default_job_store", lambda: jobs)
+    output = tmp_path / "predicted"
+    output.mkdir()
+    path, _ = write_prediction(str(output / "T33TUL_prediction.tif"))
+    jobs.advance("image-1", "downloaded", tile_id="T33TUL")
+    jobs.advance_tile("T33TUL", "converted")
+    before = os.stat(path).st_mtime_ns
+
+    assert convert.convert_images(str(output), max_workers=1) == {}
+    assert convert.convert_image(path) is True
+    assert os.stat(path).st_mtime_ns == before
+    assert gdal.Open(path).GetMetadataItem("LAYOUT", "IMAGE_STRUCTURE") != "COG"
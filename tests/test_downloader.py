@@ -0,0 +1,59 @@
+import os
+import hashlib
+
+import pytest
+
+from offline import fakes
+from src import downloader, metrics
+from src.downloader import DownloadJob, download_file
+
+CONTENT = os.urandom(256 * 1024)
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """Serve one asset that the first request cuts off after 100 kB; no backoff between retries."""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "scene.zip").write_bytes(CONTENT)
+    server, base_url = fakes.serve_directory(str(source), drop_after=100 * 1024)
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+    yield base_url
+    server.shutdown()
+
+
+def test_dropped_download_resumes_and_verifies_checksum(tmp_path, served, caplog):
+    job = DownloadJob(f"{served}/scene.zip", "scene.zip")
+    caplog.set_level("INFO")
+
+    with metrics.stage("test_download", log=False):
+        path = download_file(job, str(tmp_path / "downloaded"))
+
+    with open(path, "rb") as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(path + ".part")
+    counters = metrics.METRICS.stages["test_download"]["counters"]
+    assert counters["download_retries"] == 1
+    assert counters["bytes_in"] == len(CONTENT)  # the resumed request only fetched the rest
+    assert "checksum verified" in caplog.text  # against the server's x-goog-hash md5
+
+
+def test_checksum_mismatch_keeps_nothing(tmp_path, served):
+    job = DownloadJob(f"{served}/scene.zip", "scene.zip", checksum="sha256:" + hashlib.sha256(b"other").hexdigest())
+
+    with pytest.raises(ValueError, match="sha256 mismatch"):
+        download_file(job, str(tmp_path / "downloaded"))
+
+    assert os.listdir(str(tmp_path / "downloaded")) == []
+
+
+def test_unverifiable_part_file_is_downloaded_again(tmp_path, served):
+    # A stale .part as long as the object: the server answers 416 without size or checksum
+    target_dir = tmp_path / "downloaded"
+    target_dir.mkdir()
+    (target_dir / "scene.zip.part").write_bytes(b"x" * len(CONTENT))
+
+    path = download_file(DownloadJob(f"{served}/scene.zip", "scene.zip"), str(target_dir))
+
+    with open(path, "rb") as f:
+        assert f.read() == CONTENT
@@ -0,0 +1,84 @@
+import os
+import pytest
+
+from offline.fakes import FakeCatalog
+from src.job_state import JobStore
+
+
+def test_screened_out_tile_is_finished(tmp_path):
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    jobs.advance("image-1", "downloaded", date="2024-06-01", tile_id="T33TUL")
+    jobs.advance_tile("T33TUL", "merged")
+
+    jobs.advance_tile("T33TUL", "screened_out")
+
+    assert jobs.get("image-1")["state"] == "screened_out"
+    assert jobs.reached("image-1", "predicted")  # skip_finished_images does not download it again
+    assert jobs.pending_tiles() == []  # and there is nothing to upload
+    jobs.advance_tile("T33TUL", "predicted")
+    assert jobs.get("image-1")["state"] == "screened_out"
+
+
+def test_unfinished_orders_of_any_day_are_resumed_with_their_date(tmp_path):
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    jobs.advance("image-1", "ordered", date="2024-06-01", order_id="order-1")
+    jobs.advance("image-2", "fulfilled", date="2024-06-02", order_id="order-2")
+    jobs.advance("image-3", "searched", date="2024-06-02")
+
+    assert jobs.in_state("ordered", "fulfilled") == ["image-1", "image-2"]
+    jobs.advance("image-1", "searched", date="2024-06-03")  # found again by a later night's search
+    assert jobs.get("image-1")["date"] == "2024-06-01"
+    assert jobs.get("image-1")["order_id"] == "order-1"
+
+
+def test_reset_lets_a_failed_order_be_placed_again(tmp_path):
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    jobs.advance("image-1", "ordered", date="2024-06-01", order_id="order-1")
+
+    jobs.reset("image-1", "order FAILED")
+
+    job = jobs.get("image-1")
+    assert (job["state"], job["order_id"], job["error"]) == ("searched", None, "order FAILED")
+    assert not jobs.reached("image-1", "ordered")
+    assert jobs.in_state("ordered", "fulfilled") == []
+
+
+def test_pending_tiles_until_uploaded(tmp_path):
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    for number, state in enumerate(["merged", "predicted", "converted", "uploaded"]):
+        jobs.advance(f"image-{number}", "downloaded", tile_id=f"T{number}")
+        jobs.advance_tile(f"T{number}", state)
+
+    assert jobs.pending_tiles() == ["T1", "T2"]
+    assert jobs.date_of_tile("T1") is None
+    jobs.advance_tile("T1", "uploaded")
+    assert jobs.pending_tiles() == ["T2"]
+
+
+def test_output_folder_keeps_pending_predictions(tmp_path):
+    prediction = pytest.importorskip("src.prediction")
+    output = tmp_path / "predicted"
+    output.mkdir()
+    for name in ("T1_prediction.tif", "T1_detections.fgb", "T9_prediction.tif"):
+        (output / name).write_bytes(b"x")
+
+    prediction.clear_output_folder(str(output), keep_tiles={"T1"})
+
+    assert sorted(os.listdir(str(output))) == ["T1_detections.fgb", "T1_prediction.tif"]
+
+
+def test_restart_reuses_the_stored_order(tmp_path, monkeypatch):
+    pytest.importorskip("up42")
+    ordering = pytest.importorskip("src.orderFromUp42_parallel")
+    jobs = JobStore(str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(ordering, "default_job_store", lambda: jobs)
+    monkeypatch.setattr(ordering, "PRODUCT_ID", "product", raising=False)  # set by download_from_up42
+    catalog = FakeCatalog([{"id": "image-1", "assets": []}])
+    first = ordering.open_order("image-1", None, catalog)
+    assert jobs.get("image-1")["order_id"] == first.order_id
+
+    # The run crashes here; the next one must not pay for a second order
+    resumed = ordering.open_order("image-1", None, catalog)
+
+    assert resumed is first
+    assert len(catalog.placed_orders) == 1
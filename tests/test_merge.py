@@ -0,0 +1,87 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+gdal = pytest.importorskip("osgeo.gdal")
+osr = pytest.importorskip("osgeo.osr")
+
+from src import merge
+
+SIZE = 512  # large enough for the mosaic to get overviews (merge.OVERVIEW_MIN_SIZE)
+
+
+def write_prediction(path, column, value, width=SIZE):
+    """Byte EPSG:4326 prediction tile on the mosaic grid, `column` (may be fractional) tiles east of the first one."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds = gdal.GetDriverByName("GTiff").Create(path, width, SIZE, 1, gdal.GDT_Byte)
+    x0 = (1000 + int(column * SIZE)) * merge.PIXEL_SIZE
+    ds.SetGeoTransform((x0, merge.PIXEL_SIZE, 0, 10000 * merge.PIXEL_SIZE, 0, -merge.PIXEL_SIZE))
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(np.full((SIZE, width), value, dtype=np.uint8))
+    ds = None
+    return path
+
+
+def first_overview(output_tif):
+    ds = gdal.Open(output_tif)
+    overview = ds.GetRasterBand(1).GetOverview(0)
+    return overview.ReadAsArray()
+
+
+def test_update_mosaic_refreshes_overviews_of_patched_tile(tmp_path):
+    tiles = [write_prediction(str(tmp_path / f"T{column}_prediction.tif"), column, 50) for column in range(2)]
+    output_tif = str(tmp_path / "mosaic.tif")
+    reproj_dir = str(tmp_path / "reproj")
+    merge.update_mosaic(tiles, output_tif, reproj_dir, mode="warp", max_workers=1)
+    before = first_overview(output_tif)
+
+    write_prediction(tiles[0], 0, 200)
+    later = os.path.getmtime(tiles[0]) + 60
+    os.utime(tiles[0], (later, later))
+    timings = merge.update_mosaic(tiles, output_tif, reproj_dir, mode="warp", max_workers=1)
+
+    assert timings["patched"] == 1
+    after = first_overview(output_tif)
+    half = after.shape[1] // 2
+    inner = (slice(4, -4), slice(4, half - 4))  # away from bilinear edges
+    assert before[inner].mean() == pytest.approx(50, abs=2)
+    assert after[inner].mean() == pytest.approx(200, abs=2)
+    np.testing.assert_array_equal(after[:, half + 4:-4], before[:, half + 4:-4])  # the other tile is untouched
+
+
+def read_all(output_tif):
+    """Every band at full resolution and in the first overview."""
+    ds = gdal.Open(output_tif)
+    bands = [ds.GetRasterBand(number) for number in range(1, ds.RasterCount + 1)]
+    return [band.ReadAsArray() for band in bands], [band.GetOverview(0).ReadAsArray() for band in bands]
+
+
+def test_update_mosaic_matches_a_full_rebuild(tmp_path):
+    # T1 overlaps the east half of T0 and comes later in the VRT, so it wins there
+    tiles = [write_prediction(str(tmp_path / "T0_prediction.tif"), 0, 50),
+             write_prediction(str(tmp_path / "T1_prediction.tif"), 0.5, 100)]
+    output_tif = str(tmp_path / "mosaic.tif")
+    merge.update_mosaic(tiles, output_tif, str(tmp_path / "reproj"), mode="warp", max_workers=1)
+
+    # T0 shrinks to its western quarter: the next quarter loses coverage, the overlap stays T1's
+    write_prediction(tiles[0], 0, 200, width=SIZE // 4)
+    later = os.path.getmtime(tiles[0]) + 60
+    os.utime(tiles[0], (later, later))
+    timings = merge.update_mosaic(tiles, output_tif, str(tmp_path / "reproj"), mode="warp", max_workers=1)
+    rebuilt_tif = str(tmp_path / "rebuilt.tif")
+    merge.build_mosaic(tiles, rebuilt_tif, str(tmp_path / "rebuilt"), mode="warp", max_workers=1,
+                       output_format="GTiff")
+
+    assert timings["patched"] == 1
+    patched, patched_overviews = read_all(output_tif)
+    rebuilt, rebuilt_overviews = read_all(rebuilt_tif)
+    assert patched[0].shape == rebuilt[0].shape
+    for patched_band, rebuilt_band in zip(patched, rebuilt):
+        np.testing.assert_array_equal(patched_band, rebuilt_band)
+    for patched_band, rebuilt_band in zip(patched_overviews, rebuilt_overviews):
+        np.testing.assert_allclose(patched_band, rebuilt_band, atol=1)
+    row = patched[0][SIZE // 2]
+    assert (row[8:SIZE // 4 - 8] == 200).all()
+    assert (row[SIZE // 4 + 8:SIZE // 2 - 8] == 0).all() and (patched[-1][SIZE // 2, SIZE // 4 + 8] == 0)
+    assert (row[SIZE // 2 + 8:-8] == 100).all()
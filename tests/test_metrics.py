@@ -0,0 +1,63 @@
+import gc
+
+from src import metrics
+from src.metrics import Metrics, prometheus_text, summarize
+
+
+def stages(seconds=1.0, peak=100.0, counters=None, samples=None):
+    return {"seconds": seconds, "peak_rss_mb": peak, "counters": counters or {}, "samples": samples or {}}
+
+
+def test_summarize_latencies():
+    assert summarize([]) == {"count": 0}
+    summary = summarize([float(n) for n in range(20, 0, -1)])
+    assert summary == {"count": 20, "sum": 210.0, "mean": 10.5, "p50": 11.0, "p95": 20.0, "max": 20.0}
+
+
+def test_merge_adds_counters_and_samples_and_keeps_maxima():
+    merged = Metrics()
+    merged.merge({"merge": stages(2.0, 300.0, {"tiles": 2}, {"tile_seconds": [1.0]})})
+    merged.merge({"merge": stages(5.0, 200.0, {"tiles": 3, "bytes_in": 10}, {"tile_seconds": [2.0]})})
+
+    assert merged.stages["merge"] == stages(5.0, 300.0, {"tiles": 5, "bytes_in": 10}, {"tile_seconds": [1.0, 2.0]})
+
+
+def test_merge_into_books_worker_stages_on_one_stage():
+    merged = Metrics()
+    merged.merge({"main": stages(3.0, 50.0, {"tiles": 1}), "other": stages(4.0, 80.0, {"tiles": 2})}, into="predict")
+
+    assert merged.stages == {"predict": stages(0.0, 80.0, {"tiles": 3})}  # worker wall times are not stage time
+
+
+def test_prometheus_text():
+    report = {"seconds": 12.5, "stages": {"merge": {
+        "seconds": 3.0, "peak_rss_mb": 2.0, "counters": {"tiles": 4},
+        "latency": {"tile_seconds": {"count": 2, "sum": 1.5, "mean": 0.75, "p50": 1.0, "p95": 1.0, "max": 1.0},
+                    "unused_seconds": {"count": 0}},
+    }}}
+
+    lines = prometheus_text(report).splitlines()
+
+    assert "marine_litter_run_seconds 12.5" in lines
+    assert 'marine_litter_stage_seconds{stage="merge"} 3.0' in lines
+    assert 'marine_litter_stage_peak_rss_bytes{stage="merge"} 2097152' in lines
+    assert 'marine_litter_tiles_total{stage="merge"} 4' in lines
+    assert 'marine_litter_tile_seconds_count{stage="merge"} 2' in lines
+    assert 'marine_litter_tile_seconds_sum{stage="merge"} 1.5' in lines
+    assert 'marine_litter_tile_seconds{stage="merge",quantile="0.95"} 1.0' in lines
+    assert not any("unused" in line for line in lines)
+
+
+def test_stage_peak_rss_is_measured_per_stage():
+    recorded = Metrics()
+    with recorded.stage("large", log=False):
+        block = b"x" * (200 * 1024 * 1024)
+    del block
+    gc.collect()
+    with recorded.stage("small", log=False):
+        pass
+
+    large, small = recorded.stages["large"]["peak_rss_mb"], recorded.stages["small"]["peak_rss_mb"]
+    assert large >= 200
+    assert small < large - 100  # the earlier stage's peak does not carry over
+    assert metrics.peak_rss_mb() >= large - 1  # unlike the process high-water mark
@@ -0,0 +1,42 @@
+import os
+import json
+import datetime
+import pytest
+
+pytest.importorskip("osgeo")
+pytest.importorskip("up42")
+
+from src import orderFromUp42_parallel as ordering
+from offline.fakes import FakeCatalog, serve_directory
+from offline.synthetic import PIXEL_SIZE, footprint, tile_name, write_scenes
+
+SIZE = 32
+
+
+def test_overlapping_aois_order_shared_scene_once(tmp_path):
+    date = (datetime.date.today() - datetime.timedelta(days=ordering.DAYBEFORE)).isoformat()
+    source = tmp_path / "up42"
+    scenes = write_scenes(str(source), count=1, size=SIZE, bands=["B02", "B03", "B04", "B08"], date=date)
+    tile_id, _ = tile_name(0, date)
+
+    # Two AOIs over the west and east part of the scene that overlap in the middle
+    extent = SIZE * PIXEL_SIZE
+    config = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": "west"}, "geometry": footprint(0, 0, extent * 0.6, extent)},
+        {"type": "Feature", "properties": {"name": "east"},
+         "geometry": footprint(extent * 0.4, 0, extent * 0.6, extent)}]}
+    config_path = tmp_path / "config.geojson"
+    config_path.write_text(json.dumps(config))
+
+    input_path = tmp_path / "downloaded"
+    server, base_url = serve_directory(str(source))
+    try:
+        catalog = FakeCatalog(scenes, base_url=base_url)
+        ordering.download_from_up42(str(config_path), catalog=catalog, input_path=str(input_path))
+    finally:
+        server.shutdown()
+
+    assert len(catalog.search_calls) == 2  # one search per AOI, both return the scene
+    assert len(catalog.placed_orders) == 1
+    assert ordering.AOI_INDEX.aois_for_tile(tile_id) == ["east", "west"]
+    assert os.path.exists(input_path / f"{tile_id}.tif")
@@ -0,0 +1,106 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src import order_planner
+from src.order_planner import plan_orders
+
+
+def canned_results(credits):
+    """Search results for three different MGRS tiles, best (least cloudy) first, with the given credits."""
+    return pd.DataFrame({
+        "id": ["a", "b", "c"],
+        "sceneId": [f"S2B_MSIL2A_20240601T101031_N0511_R022_T33T{tile}_20240601T120000" for tile in ("UL", "VL", "WL")],
+        "cloudCoverage": [5.0, 10.0, 20.0],
+        "acquisitionDate": ["2024-06-01T10:10:31Z"] * 3,
+        "credits": credits,
+    })
+
+
+def test_credit_budget_accepts_best_scenes_that_fit():
+    plan, rejected = plan_orders(canned_results([40.0, 40.0, 40.0]), credit_budget=100)
+
+    assert list(plan["id"]) == ["a", "b"]
+    assert [r["id"] for r in rejected] == ["c"]
+    assert rejected[0]["reason"].startswith("credit budget")
+
+
+def test_credit_budget_rejects_scenes_with_unknown_credits(monkeypatch):
+    monkeypatch.setattr(order_planner, "PLAN_CREDITS_PER_SCENE", 0.0)
+
+    plan, rejected = plan_orders(canned_results([40.0, float("nan"), 40.0]), credit_budget=100)
+
+    assert list(plan["id"]) == ["a", "c"]
+    assert rejected == [{"id": "b", "reason": "credits unknown (no estimate and PLAN_CREDITS_PER_SCENE is 0)"}]
+
+
+def test_unknown_credits_use_nonzero_default(monkeypatch):
+    monkeypatch.setattr(order_planner, "PLAN_CREDITS_PER_SCENE", 70.0)
+
+    plan, rejected = plan_orders(canned_results([20.0, float("nan"), 20.0]), credit_budget=100)
+
+    assert list(plan["id"]) == ["a", "b"]  # 20 + 70, then c would exceed the budget
+    assert [r["id"] for r in rejected] == ["c"]
+
+
+def test_unknown_credits_are_fine_without_budget(monkeypatch):
+    monkeypatch.setattr(order_planner, "PLAN_CREDITS_PER_SCENE", 0.0)
+
+    plan, rejected = plan_orders(canned_results([float("nan")] * 3), credit_budget=0)
+
+    assert list(plan["id"]) == ["a", "b", "c"] and not rejected
+
+
+def scenes(rows):
+    """Search results from (id, MGRS tile, cloud cover, acquisition time) tuples."""
+    return pd.DataFrame({
+        "id": [row[0] for row in rows],
+        "sceneId": [f"S2B_MSIL2A_20240601T101031_N0511_R022_T{row[1]}_20240601T120000" for row in rows],
+        "cloudCoverage": [row[2] for row in rows],
+        "acquisitionDate": [row[3] for row in rows],
+    })
+
+
+def test_scenes_are_ranked_by_cloud_and_recency():
+    df = scenes([("old-clear", "33TUL", 0.0, "2024-06-01T10:00:00Z"),
+                 ("new-cloudy", "33TVL", 60.0, "2024-06-03T10:00:00Z"),
+                 ("new-clear", "33TWL", 0.0, "2024-06-03T10:00:00Z")])
+
+    plan, rejected = plan_orders(df, credit_budget=0, time_budget_minutes=0, max_cloud=100, duplicate_hours=0)
+
+    assert list(plan["id"]) == ["new-clear", "old-clear", "new-cloudy"]
+    assert plan["score"].is_monotonic_decreasing
+    assert list(plan["mgrs"]) == ["33TWL", "33TUL", "33TVL"] and not rejected
+
+
+def test_max_cloud_rejects_cloudy_scenes():
+    df = scenes([("clear", "33TUL", 10.0, "2024-06-01T10:00:00Z"),
+                 ("cloudy", "33TVL", 80.0, "2024-06-01T10:00:00Z")])
+
+    plan, rejected = plan_orders(df, credit_budget=0, time_budget_minutes=0, max_cloud=50)
+
+    assert list(plan["id"]) == ["clear"]
+    assert rejected == [{"id": "cloudy", "reason": "cloud cover 80% > 50%"}]
+
+
+def test_same_tile_within_duplicate_hours_is_ordered_once():
+    df = scenes([("best", "33TUL", 5.0, "2024-06-02T10:00:00Z"),
+                 ("same-pass", "33TUL", 30.0, "2024-06-02T10:05:00Z"),
+                 ("days-later", "33TUL", 30.0, "2024-06-05T10:00:00Z"),
+                 ("other-tile", "33TVL", 30.0, "2024-06-02T10:05:00Z")])
+
+    plan, rejected = plan_orders(df, credit_budget=0, time_budget_minutes=0, max_cloud=100, duplicate_hours=24)
+
+    assert sorted(plan["id"]) == ["best", "days-later", "other-tile"]
+    assert rejected == [{"id": "same-pass", "reason": "near-duplicate of best (MGRS 33TUL)"}]
+
+
+def test_time_budget_limits_the_number_of_scenes(monkeypatch):
+    monkeypatch.setattr(order_planner, "PLAN_MINUTES_PER_SCENE", 10.0)
+    df = scenes([(f"scene-{n}", f"33T{tile}L", 10.0 * n, "2024-06-01T10:00:00Z")
+                 for n, tile in enumerate("UVW")])
+
+    plan, rejected = plan_orders(df, credit_budget=0, time_budget_minutes=25)
+
+    assert list(plan["id"]) == ["scene-0", "scene-1"]
+    assert rejected == [{"id": "scene-2", "reason": "time budget: 30 > 25 min"}]
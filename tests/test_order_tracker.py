@@ -0,0 +1,47 @@
+from offline.fakes import FakeOrder
+from src.order_tracker import OrderTracker
+
+
+class FlakyOrder(FakeOrder):
+    """Its first status request fails, like a dropped connection to the UP42 API."""
+
+    @property
+    def status(self):
+        self.polls += 1
+        if self.polls == 1:
+            raise ConnectionError("status request failed")
+        return self.final_status if self.polls > self.polls_until_done else "PLACED"
+
+
+def tracker(fulfilled, **kwargs):
+    def on_fulfilled(image_id, order):
+        fulfilled.append(image_id)
+        return {"order_id": order.order_id, "image_id": image_id, "status": "FULFILLED"}
+    return OrderTracker(on_fulfilled, min_interval=0.01, max_interval=0.02, **kwargs)
+
+
+def test_tracks_all_orders_until_final():
+    fulfilled = []
+    orders = {
+        "img-1": FakeOrder("order-1", [], polls_until_done=3),
+        "img-2": FakeOrder("order-2", [], polls_until_done=1, fail=True),
+        "img-3": FlakyOrder("order-3", [], polls_until_done=2),
+    }
+
+    results = tracker(fulfilled).run(orders)
+
+    assert sorted(fulfilled) == ["img-1", "img-3"]  # downloads start only for fulfilled orders
+    assert results["img-1"]["status"] == "FULFILLED"
+    assert results["img-2"]["status"] == "FAILED"
+    assert results["img-3"]["status"] == "FULFILLED"  # a failed status request is retried
+    assert orders["img-1"].polls == 4
+
+
+def test_gives_up_after_timeout():
+    fulfilled = []
+    order = FakeOrder("order-1", [], polls_until_done=10 ** 6)
+
+    results = tracker(fulfilled, timeout=0.05).run({"img-1": order})
+
+    assert results["img-1"]["status"] == "TIMEOUT"
+    assert fulfilled == []
@@ -0,0 +1,62 @@
+import os
+import pytest
+
+pytest.importorskip("osgeo")
+pytest.importorskip("up42")
+
+from src import pipeline
+from offline.fakes import FakeCatalog, FakeStorageClient, serve_directory
+from offline.synthetic import stub_detector, tile_name, write_scenes
+
+BANDS = ["B02", "B03", "B04", "B08"]
+SIZE = 64
+
+
+@pytest.fixture
+def offline(tmp_path):
+    """Two synthetic scenes behind a fake UP42 catalog and a fake bucket; yields run_pipeline's arguments."""
+    source = tmp_path / "up42"
+    scenes = write_scenes(str(source), count=2, size=SIZE, bands=BANDS)
+    server, base_url = serve_directory(str(source))
+    bucket = FakeStorageClient(str(tmp_path / "gcs")).bucket("marinelitter_predicted")
+    yield {
+        "config_path": str(source / "config.geojson"),
+        "catalog": FakeCatalog(scenes, base_url=base_url),
+        "bucket": bucket,
+        "input_path": str(tmp_path / "downloaded"),
+        "output_path": str(tmp_path / "predicted"),
+        "dates_path": str(tmp_path / "dates.json"),
+    }
+    server.shutdown()
+
+
+def test_pipeline_uploads_predictions_and_cleans_inputs(offline):
+    summary = pipeline.run_pipeline(predict_func=stub_detector, **offline)
+
+    assert summary["failed"] == {}
+    assert summary["predicted"] == summary["uploaded"] == 2
+    bucket = offline["bucket"]
+    for number in range(2):
+        tile_id, _ = tile_name(number, scenes_date(offline))
+        assert bucket.get_blob(f"{tile_id}_prediction.tif") is not None
+    assert bucket.get_blob("dates.json") is not None
+    assert os.listdir(offline["input_path"]) == []
+    assert os.listdir(offline["output_path"]) == []  # uploaded files are deleted locally
+
+
+def test_pipeline_reports_failed_items(offline):
+    first = tile_name(0, scenes_date(offline))[0]
+
+    def flaky_detector(tif_path):
+        if os.path.basename(tif_path).startswith(first):
+            raise RuntimeError("model crashed")
+        return stub_detector(tif_path)
+
+    summary = pipeline.run_pipeline(predict_func=flaky_detector, **offline)
+
+    assert summary["failed"] == {"predict": 1}
+    assert summary["uploaded"] == 1
+
+
+def scenes_date(offline):
+    return offline["catalog"].scenes[0]["acquisitionDate"][:10]
@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+gdal = pytest.importorskip("osgeo.gdal")
+osr = pytest.importorskip("osgeo.osr")
+
+from src.aoi import to_ogr
+from src.prefilter import PREFILTER_MIN_VALID, screen_tile
+from offline.synthetic import ORIGIN, PIXEL_SIZE, UTM_EPSG, footprint
+
+SIZE = 100
+AOI_COLUMNS = 5  # the AOI covers 5% of the tile, below PREFILTER_MIN_VALID
+
+
+def write_clipped_tile(path):
+    """Byte B02/B03/B08 tile of open water inside the AOI columns, zeroed outside them like mask_outside does."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(UTM_EPSG)
+    ds = gdal.GetDriverByName("GTiff").Create(path, SIZE, SIZE, 3, gdal.GDT_Byte)
+    ds.SetGeoTransform((ORIGIN[0], PIXEL_SIZE, 0, ORIGIN[1], 0, -PIXEL_SIZE))
+    ds.SetProjection(srs.ExportToWkt())
+    for number, (name, value) in enumerate([("B02", 45), ("B03", 40), ("B08", 10)], start=1):
+        values = np.zeros((SIZE, SIZE), dtype=np.uint8)
+        values[:, :AOI_COLUMNS] = value
+        band = ds.GetRasterBand(number)
+        band.SetDescription(name)
+        band.WriteArray(values)
+    ds = None
+    return path
+
+
+def test_fractions_are_taken_inside_the_aoi(tmp_path):
+    path = write_clipped_tile(str(tmp_path / "T33TUL.tif"))
+    aoi = to_ogr(footprint(0, 0, AOI_COLUMNS * PIXEL_SIZE, SIZE * PIXEL_SIZE))
+
+    decision = screen_tile(path, size=SIZE, aoi=aoi)
+
+    assert decision["keep"], decision["reason"]
+    assert decision["aoi_fraction"] == pytest.approx(AOI_COLUMNS / SIZE, abs=0.02)
+    assert decision["valid_fraction"] > 0.9
+    assert decision["water_fraction"] > 0.9
+
+
+def test_masked_pixels_count_as_nodata_without_aoi(tmp_path):
+    path = write_clipped_tile(str(tmp_path / "T33TUL.tif"))
+
+    decision = screen_tile(path, size=SIZE)  # CLIP_TO_AOI=0 in the tests: no AOI
+
+    assert decision["valid_fraction"] < PREFILTER_MIN_VALID
+    assert not decision["keep"]
@@ -0,0 +1,64 @@
+import os
+import pytest
+
+from src import metrics, scheduler
+from src.scheduler import MB, run_pool, worker_count
+
+
+def record_name(path):
+    """Pool task: append the file's name to run.log next to it; fails for files named bad*."""
+    name = os.path.basename(path)
+    with open(os.path.join(os.path.dirname(path), "run.log"), "a") as log:
+        log.write(name + "\n")
+    if name.startswith("bad"):
+        raise ValueError(name)
+    return name.upper()
+
+
+def write_file(folder, name, size):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_worker_count_is_limited_by_cores_memory_and_cap(monkeypatch):
+    monkeypatch.setattr(scheduler, "cpu_count", lambda: 8)
+    monkeypatch.setattr(scheduler, "available_memory", lambda: 9 * 1024 * MB)
+    monkeypatch.setattr(scheduler, "MEMORY_RESERVE_MB", 1024)
+
+    assert worker_count(512 * MB) == 8                      # cores
+    assert worker_count(2048 * MB) == 4                     # 8 GB free after the reserve
+    assert worker_count(512 * MB, max_workers=3) == 3       # cap
+    assert worker_count(512 * MB, threads_per_worker=4) == 2
+    assert worker_count(100 * 1024 * MB) == 1               # never less than one
+
+
+def test_run_pool_dispatches_largest_first_and_reports_failures(tmp_path):
+    paths = [write_file(str(tmp_path), name, size) for name, size in
+             (("small.tif", 10), ("large.tif", 1000), ("bad.tif", 500), ("medium.tif", 100))]
+    metrics.METRICS.reset()
+
+    with metrics.stage("test", log=False):
+        results = run_pool(record_name, paths, workers=1, label="files")
+
+    with open(str(tmp_path / "run.log")) as log:
+        assert log.read().split() == ["large.tif", "bad.tif", "medium.tif", "small.tif"]
+    assert results == {paths[0]: "SMALL.TIF", paths[1]: "LARGE.TIF", paths[2]: None, paths[3]: "MEDIUM.TIF"}
+    assert metrics.METRICS.stages["test"]["counters"]["files_failed"] == 1
+
+
+def test_run_pool_orders_by_given_sizes(tmp_path):
+    paths = [write_file(str(tmp_path), name, 10) for name in ("a.tif", "b.tif", "c.tif")]
+
+    run_pool(record_name, paths, workers=1, sizes={paths[0]: 1, paths[1]: 3, paths[2]: 2})
+
+    with open(str(tmp_path / "run.log")) as log:
+        assert log.read().split() == ["b.tif", "c.tif", "a.tif"]
+
+
+def test_torch_threads_split_the_cores(monkeypatch):
+    prediction = pytest.importorskip("src.prediction")
+    monkeypatch.setattr(prediction, "cpu_count", lambda: 8)
+
+    assert [prediction.torch_threads(workers) for workers in (1, 3, 8, 16)] == [8, 2, 1, 1]
@@ -0,0 +1,55 @@
+import os
+
+from offline.fakes import FakeStorageClient
+from src.storage import GcsBackend, LocalBackend, backend_for, local_md5, matches
+
+
+def write_file(folder, name="T33TUL_prediction.tif", content=b"prediction"):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_local_backend_upload_stat_names_delete(tmp_path):
+    source = write_file(str(tmp_path))
+    backend = LocalBackend(str(tmp_path / "bucket"))
+    assert backend.stat("2024/T33TUL_prediction.tif") is None
+
+    backend.upload(source, "2024/T33TUL_prediction.tif")
+    backend.upload(source, "dates.json")
+
+    assert backend.stat("2024/T33TUL_prediction.tif") == {"size": len(b"prediction"), "md5": local_md5(source),
+                                                           "crc32c": None}
+    assert backend.names() == ["2024/T33TUL_prediction.tif", "dates.json"]
+    assert not any(name.endswith(".tmp") for name in os.listdir(str(tmp_path / "bucket")))
+    backend.delete("2024/T33TUL_prediction.tif")
+    backend.delete("2024/T33TUL_prediction.tif")  # deleting a missing object is not an error
+    assert backend.names() == ["dates.json"]
+
+
+def test_local_backend_upload_replaces_object(tmp_path):
+    backend = LocalBackend(str(tmp_path / "bucket"))
+    backend.upload(write_file(str(tmp_path), content=b"old"), "T33TUL_prediction.tif")
+
+    source = write_file(str(tmp_path), content=b"new prediction")
+    backend.upload(source, "T33TUL_prediction.tif")
+
+    assert matches(source, backend.stat("T33TUL_prediction.tif"))
+
+
+def test_matches_needs_size_and_checksum(tmp_path):
+    source = write_file(str(tmp_path))
+    stat = {"size": os.path.getsize(source), "md5": local_md5(source), "crc32c": None}
+
+    assert matches(source, stat)
+    assert not matches(source, None)
+    assert not matches(source, dict(stat, size=stat["size"] + 1))
+    assert not matches(source, dict(stat, md5=local_md5(write_file(str(tmp_path), "other", b"other"))))
+    assert not matches(source, dict(stat, md5=None))  # nothing to verify against
+
+
+def test_backend_for_wraps_buckets_only(tmp_path):
+    backend = LocalBackend(str(tmp_path / "bucket"))
+    assert backend_for(backend) is backend
+    assert isinstance(backend_for(FakeStorageClient(str(tmp_path)).bucket("predicted")), GcsBackend)
@@ -0,0 +1,71 @@
+import os
+import itertools
+
+from src import tile_cache
+from src.tile_cache import TileCache
+
+PARAMS = {"checkpoint": "a" * 64, "merge": {"engine": "gdal", "dtype": "Byte"}}
+
+
+def write_file(folder, name, size=100):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_get_returns_cached_file_or_none(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+    source = write_file(str(tmp_path), "T33TUL_prediction.tif")
+    target = str(tmp_path / "restored.tif")
+    assert cache.get("prediction", "T33TUL", PARAMS, target) is None
+    assert not os.path.exists(target)
+
+    cache.put("prediction", "T33TUL", PARAMS, source)
+
+    assert cache.has("prediction", "T33TUL", PARAMS)
+    assert cache.get("prediction", "T33TUL", PARAMS, target) == target
+    assert read(target) == read(source)
+    assert cache.get("merged", "T33TUL", PARAMS, target + ".merged") is None  # kinds do not share entries
+
+
+def test_key_changes_with_params_and_checkpoint(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+    cache.put("prediction", "T33TUL", PARAMS, write_file(str(tmp_path), "T33TUL_prediction.tif"))
+    target = str(tmp_path / "restored.tif")
+
+    new_checkpoint = dict(PARAMS, checkpoint="b" * 64)
+    new_merge = dict(PARAMS, merge={"engine": "numpy", "dtype": "Byte"})
+
+    assert cache.get("prediction", "T33TUL", new_checkpoint, target) is None
+    assert cache.get("prediction", "T33TUL", new_merge, target) is None
+    assert cache.get("prediction", "T33TUL", dict(reversed(list(PARAMS.items()))), target) == target
+    assert TileCache.key("prediction", "T33TUL", PARAMS) != TileCache.key("prediction", "T33TUL", new_checkpoint)
+
+
+def test_evicts_least_recently_used_beyond_limit(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(tile_cache.time, "time", lambda: next(clock))
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=250)
+    for tile_id in ("T1", "T2"):
+        cache.put("merged", tile_id, PARAMS, write_file(str(tmp_path), f"{tile_id}.tif"))
+    assert cache.get("merged", "T1", PARAMS, str(tmp_path / "T1_restored.tif"))  # T2 is now the oldest
+
+    cache.put("merged", "T3", PARAMS, write_file(str(tmp_path), "T3.tif"))
+
+    assert [cache.has("merged", tile_id, PARAMS) for tile_id in ("T1", "T2", "T3")] == [True, False, True]
+    assert not os.path.exists(cache._object_path(TileCache.key("merged", "T2", PARAMS)))
+
+
+def test_missing_object_is_a_miss(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+    cache.put("merged", "T33TUL", PARAMS, write_file(str(tmp_path), "T33TUL.tif"))
+    os.remove(cache._object_path(TileCache.key("merged", "T33TUL", PARAMS)))
+
+    assert cache.get("merged", "T33TUL", PARAMS, str(tmp_path / "restored.tif")) is None
+    assert not cache.has("merged", "T33TUL", PARAMS)
@@ -0,0 +1,94 @@
+import os
+
+from src.manifest import Manifest
+from src.storage import LocalBackend
+from src.upload_delete import upload_delete, upload_extra_file, upload_file
+
+
+def write_prediction(folder, name="T33TUL_prediction.tif", content=b"prediction"):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_upload_verifies_and_deletes_local_file(tmp_path):
+    source = write_prediction(str(tmp_path))
+    bucket = LocalBackend(str(tmp_path / "bucket"))
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    assert upload_file(bucket, source, str(tmp_path), manifest)
+
+    assert not os.path.exists(source)
+    assert manifest.stat("T33TUL_prediction.tif") == bucket.stat("T33TUL_prediction.tif")
+
+
+def test_manifest_hit_skips_upload_when_bucket_has_object(tmp_path):
+    source = write_prediction(str(tmp_path))
+    bucket = LocalBackend(str(tmp_path / "bucket"))
+    bucket.upload(source, "T33TUL_prediction.tif")
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.record_upload("T33TUL_prediction.tif", bucket.stat("T33TUL_prediction.tif"))
+    uploaded = bucket.path("T33TUL_prediction.tif")
+    before = os.path.getmtime(uploaded)
+
+    assert upload_file(bucket, source, str(tmp_path), manifest)
+
+    assert not os.path.exists(source)
+    assert os.path.getmtime(uploaded) == before  # not uploaded again
+
+
+def test_manifest_hit_reuploads_when_bucket_object_is_gone(tmp_path):
+    source = write_prediction(str(tmp_path))
+    bucket = LocalBackend(str(tmp_path / "bucket"))
+    bucket.upload(source, "T33TUL_prediction.tif")
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    manifest.record_upload("T33TUL_prediction.tif", bucket.stat("T33TUL_prediction.tif"))
+    bucket.delete("T33TUL_prediction.tif")  # removed behind the manifest's back
+
+    assert upload_file(bucket, source, str(tmp_path), manifest)
+
+    assert not os.path.exists(source)
+    with open(bucket.path("T33TUL_prediction.tif"), "rb") as f:
+        assert f.read() == b"prediction"
+
+
+def test_manifest_records_acquisition_date_from_tile_name(tmp_path):
+    name = "S2B_OPER_MSI_L2A_TL_2BPS_20240601T101031_A000001_T33TUL_N05.11_prediction.tif"
+    source = write_prediction(str(tmp_path), name)
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    assert upload_file(LocalBackend(str(tmp_path / "bucket")), source, str(tmp_path), manifest)
+
+    [entry] = manifest.objects_for_tile(name[:-len("_prediction.tif")])
+    assert entry["date"] == "2024-06-01"
+
+
+def test_extra_file_is_kept_and_recorded_in_manifest(tmp_path):
+    dates = write_prediction(str(tmp_path), "dates.json", b"{}")
+    bucket = LocalBackend(str(tmp_path / "bucket"))
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    assert upload_extra_file(bucket, dates, manifest)
+
+    assert os.path.exists(dates)
+    assert manifest.stat("dates.json") == bucket.stat("dates.json")
+
+
+class FailingBackend(LocalBackend):
+    def upload(self, local_path, name):
+        raise IOError("bucket unavailable")
+
+
+def test_upload_delete_returns_files_that_failed(tmp_path):
+    folder = str(tmp_path / "predicted")
+    os.makedirs(folder)
+    source = write_prediction(folder)
+    dates = str(tmp_path / "dates.json")
+    with open(dates, "w") as f:
+        f.write("{}")
+
+    failed = upload_delete(None, folder, dates, None, bucket=FailingBackend(str(tmp_path / "bucket")))
+
+    assert failed == [source, dates]
+    assert os.path.exists(source)  # kept for the next run
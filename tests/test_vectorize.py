@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+gdal = pytest.importorskip("osgeo.gdal")
+ogr = pytest.importorskip("osgeo.ogr")
+osr = pytest.importorskip("osgeo.osr")
+
+from src import vectorize
+
+PIXEL = 10  # metres, UTM zone 33N around 15°E 45°N
+
+
+def write_scores(path):
+    """Byte prediction with a 3x2 block, a diagonal pair, a lone pixel and a pixel just below 0.5."""
+    scores = np.zeros((20, 20), dtype=np.uint8)
+    scores[2:4, 2:5] = [[255, 153, 153], [153, 153, 153]]  # 6 pixels
+    scores[10, 10], scores[11, 11] = 200, 128               # touch at a corner only: one 8-connected detection
+    scores[16, 3] = 255                                     # lone pixel, dropped by MIN_DETECTION_PIXELS
+    scores[16, 16] = 127                                    # 127 / 255 < 0.5
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32633)
+    ds = gdal.GetDriverByName("GTiff").Create(path, 20, 20, 1, gdal.GDT_Byte)
+    ds.SetGeoTransform((500000, PIXEL, 0, 5000000, 0, -PIXEL))
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(scores)
+    ds = None
+    return path
+
+
+def test_vectorize_prediction_writes_one_polygon_per_detection(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorize, "MIN_DETECTION_PIXELS", 2)
+    prediction = write_scores(str(tmp_path / "T33TUL_prediction.tif"))
+
+    output_path, count = vectorize.vectorize_prediction(prediction, threshold=0.5, date="2024-06-01",
+                                                        vector_format="GeoJSON")
+
+    assert output_path == str(tmp_path / "T33TUL_detections.geojson")
+    assert count == 2
+    source = ogr.Open(output_path)
+    layer = source.GetLayer(0)
+    assert layer.GetSpatialRef().GetAuthorityCode(None) == "4326"
+    features = sorted(layer, key=lambda feature: feature.GetField("pixels"))
+    pair, block = [{name: feature.GetField(name) for name in
+                    ("tile_id", "date", "pixels", "area_m2", "max_score", "mean_score")} for feature in features]
+    assert pair == {"tile_id": "T33TUL", "date": "2024-06-01", "pixels": 2, "area_m2": 2 * PIXEL ** 2,
+                    "max_score": round(200 / 255, 4), "mean_score": round(164 / 255, 4)}
+    assert block == {"tile_id": "T33TUL", "date": "2024-06-01", "pixels": 6, "area_m2": 6 * PIXEL ** 2,
+                     "max_score": 1.0, "mean_score": round(1020 / 6 / 255, 4)}
+    for feature in features:
+        lon_min, lon_max, lat_min, lat_max = feature.GetGeometryRef().GetEnvelope()
+        assert 14.9 < lon_min < lon_max < 15.1 and 45.0 < lat_min < lat_max < 45.2  # degrees, not metres
+
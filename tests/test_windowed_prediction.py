@@ -0,0 +1,66 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+gdal = pytest.importorskip("osgeo.gdal")
+
+from src.windowed_prediction import MODEL_BANDS, blend_weights, patch_starts, predict_windowed
+
+WIDTH, HEIGHT = 100, 70
+NODATA_COLUMNS = 20  # the east edge is nodata in every band
+
+
+def write_tile(path, bands=MODEL_BANDS):
+    """Byte tile whose bands are named and stored in merge (sorted) order; B01 holds a pattern, 0 = nodata."""
+    ds = gdal.GetDriverByName("GTiff").Create(path, WIDTH, HEIGHT, len(bands), gdal.GDT_Byte)
+    ys, xs = np.mgrid[:HEIGHT, :WIDTH]
+    pattern = ((xs + 2 * ys) % 200 + 1).astype(np.uint8)
+    pattern[:, -NODATA_COLUMNS:] = 0
+    for number, name in enumerate(sorted(bands), start=1):
+        band = ds.GetRasterBand(number)
+        band.SetDescription(name)
+        band.WriteArray(pattern if name == "B01" else np.where(pattern > 0, 50, 0).astype(np.uint8))
+    ds = None
+    return path, pattern
+
+
+def first_band(batch):
+    """Stub model: the probability is the first input channel (B01)."""
+    return batch[:, 0]
+
+
+def test_patch_starts_end_flush_with_the_edge():
+    assert patch_starts(100, 40, 30) == [0, 30, 60]
+    assert patch_starts(100, 40, 25) == [0, 25, 50, 60]  # extra patch flush with the edge
+    assert patch_starts(40, 40, 30) == [0]
+    assert patch_starts(30, 40, 30) == [0]  # tile smaller than a patch
+
+
+def test_blend_weights_ramp_across_the_overlap():
+    weights = blend_weights(8, 2)
+
+    assert weights.shape == (8, 8)
+    assert weights[4, 4] == 1
+    assert weights[0, 0] == pytest.approx((1 / 3) ** 2)
+    np.testing.assert_allclose(weights, weights.T)
+    np.testing.assert_allclose(weights, weights[::-1, ::-1])
+    assert (blend_weights(8, 0) == 1).all()
+
+
+def test_windowed_prediction_covers_the_tile_without_seams(tmp_path):
+    tile, pattern = write_tile(str(tmp_path / "T33TUL.tif"))
+    output = str(tmp_path / "T33TUL_prediction.tif")
+
+    predict_windowed(tile, output, first_band, patch_size=32, overlap=8, batch_size=3, input_scale=1 / 255)
+
+    result = gdal.Open(output).ReadAsArray()
+    assert result.shape == (HEIGHT, WIDTH)
+    # Blending identical overlapping predictions must give back the input exactly: no seams, no gaps
+    np.testing.assert_array_equal(result, pattern)
+    assert (result[:, -NODATA_COLUMNS:] == 0).all()
+
+
+def test_windowed_prediction_needs_the_model_bands(tmp_path):
+    tile, _ = write_tile(str(tmp_path / "T33TUL.tif"), bands=["B01", "B02", "B03", "B08"])
+
+    with pytest.raises(ValueError, match="B04"):
+        predict_windowed(tile, str(tmp_path / "out.tif"), first_band, patch_size=32, overlap=8)
@@ -0,0 +1,107 @@
+import os
+import time
+import pytest
+
+gdal = pytest.importorskip("osgeo.gdal")
+
+from src import zip_processing
+from offline.synthetic import tile_name, write_scene
+
+BANDS = ["B02", "B03", "B04", "B08"]
+SIZE = 64
+
+
+def write_zips(directory, count):
+    """`count` small synthetic archives; returns [(zip_path, tile_id)]."""
+    archives = []
+    for number in range(count):
+        tile_id, _ = tile_name(number, "2024-06-01")
+        path = write_scene(os.path.join(directory, f"scene_{number}.zip"), tile_id, number * SIZE * 10, SIZE,
+                           bands=BANDS, seed=number)
+        archives.append((path, tile_id))
+    return archives
+
+
+def test_process_all_merges_every_archive_in_parallel(tmp_path):
+    archives = write_zips(str(tmp_path), 3)
+
+    results = zip_processing.process_all(str(tmp_path), max_workers=2)
+
+    assert set(results) == {path for path, _ in archives}
+    for zip_path, tile_id in archives:
+        result = results[zip_path]
+        assert result is not None and not result["skipped"]
+        assert result["output"] == os.path.join(str(tmp_path), f"{tile_id}.tif")
+        ds = gdal.Open(result["output"])
+        assert (ds.RasterXSize, ds.RasterYSize, ds.RasterCount) == (SIZE, SIZE, len(BANDS))
+        assert ds.GetRasterBand(1).DataType == gdal.GDT_Byte
+        assert not os.path.exists(zip_path)  # merged archives are removed
+
+
+def test_process_all_skips_archive_with_newer_tile(tmp_path):
+    [(zip_path, tile_id)] = write_zips(str(tmp_path), 1)
+    output_path = os.path.join(str(tmp_path), f"{tile_id}.tif")
+    with open(output_path, "w") as f:
+        f.write("merged earlier")
+    later = os.path.getmtime(zip_path) + 60
+    os.utime(output_path, (later, later))
+
+    results = zip_processing.process_all(str(tmp_path), max_workers=1)
+
+    assert results[zip_path]["skipped"]
+    assert os.path.exists(zip_path)
+    with open(output_path) as f:
+        assert f.read() == "merged earlier"
+
+
+def test_process_all_remerges_archive_newer_than_tile(tmp_path):
+    [(zip_path, tile_id)] = write_zips(str(tmp_path), 1)
+    output_path = os.path.join(str(tmp_path), f"{tile_id}.tif")
+    with open(output_path, "w") as f:
+        f.write("stale")
+    earlier = time.time() - 3600
+    os.utime(output_path, (earlier, earlier))
+
+    results = zip_processing.process_all(str(tmp_path), max_workers=1)
+
+    assert not results[zip_path]["skipped"]
+    assert gdal.Open(output_path).RasterCount == len(BANDS)
+
+
+def test_gdal_budget_takes_cache_from_task_memory(monkeypatch):
+    monkeypatch.setattr(zip_processing, "available_memory", lambda: 8192 * zip_processing.MB)
+    monkeypatch.setattr(zip_processing, "cpu_count", lambda: 8)
+    monkeypatch.setattr(zip_processing, "GDAL_CACHE_SHARE", 0.5)
+
+    assert zip_processing.gdal_budget(4, task_memory_mb=768) == (384, 2)  # half the budget the pool was sized with
+    assert zip_processing.gdal_budget(16, task_memory_mb=768) == (384, 1)  # never below one thread
+    assert zip_processing.gdal_budget(4, task_memory_mb=65536) == (2048, 2)  # nor above a share of the free RAM
+    monkeypatch.setattr(zip_processing, "available_memory", lambda: 0)
+    assert zip_processing.gdal_budget(2)[0] == 64  # nor below a 64 MB cache
+
+
+def test_init_gdal_worker_sets_cache_and_threads():
+    previous = {name: gdal.GetConfigOption(name) for name in ("GDAL_CACHEMAX", "GDAL_NUM_THREADS")}
+    try:
+        zip_processing.init_gdal_worker(512, 3)
+        assert gdal.GetConfigOption("GDAL_CACHEMAX") == "512"
+        assert gdal.GetConfigOption("GDAL_NUM_THREADS") == "3"
+        assert zip_processing.worker_threads() == "3"  # what the merged tiles are compressed with
+    finally:
+        for name, value in previous.items():
+            gdal.SetConfigOption(name, value)
+
+
+def test_gdal_engine_refuses_output_it_cannot_write(tmp_path):
+    zip_processing.check_engine("gdal", "Byte", {})
+    zip_processing.check_engine("numpy", "UInt16", {"B08": [0, 8000, 0, 10000]})
+    with pytest.raises(ValueError, match="MERGE_DTYPE=UInt16"):
+        zip_processing.check_engine("gdal", "UInt16", {})
+    with pytest.raises(ValueError, match="MERGE_SCALES"):
+        zip_processing.check_engine("gdal", "Byte", {"B08": [0, 8000, 0, 255]})
+    with pytest.raises(ValueError, match="Unknown MERGE_ENGINE"):
+        zip_processing.check_engine("pillow", "Byte", {})
+
+    (path, _), = write_zips(str(tmp_path), 1)
+    with pytest.raises(ValueError, match="MERGE_DTYPE=Float16"):
+        zip_processing.process_zip(path, engine="gdal", dtype="Float16")